@@ -0,0 +1,141 @@
+"""Приложение бота: клиент Telegram и общие объекты процесса.
+
+App создаётся фабрикой (main.create_app), но бот, очередь отправки,
+индекс событий, кэши и учёт обновлений создаются при первом обращении
+к ним. Поэтому импорт модулей бота ничего не подключает и не запускает
+потоков: перезапуск и короткие CLI не платят за то, что им не нужно.
+"""
+import os
+import threading
+
+from constants import (DB_PATH, DIGEST_MONTH, DIGEST_WEEK, DIGESTS,
+                       DISPATCHER_QUEUE_SIZE, DISPATCHER_WORKERS,
+                       HEALTH_FILE, UPDATE_OFFSET_FILE)
+from database import on_events_changed
+from events_index import EventsIndex
+from message_cache import MessageCache
+from outbox import Outbox
+from search import SearchCache
+from supervisor import Heartbeat, UpdateOffsets
+
+
+class LazyProperty:
+    """Атрибут App, который создаётся при первом обращении.
+
+    Создание идёт под блокировкой приложения: даже если первыми
+    обратились несколько потоков, объект создаётся один. Готовый объект
+    хранится в атрибуте экземпляра - дальше обращение обычное, и его
+    можно заменить присваиванием (benchmark подменяет очередь отправки).
+    """
+
+    def __init__(self, create):
+        """Инициализатор; create(app) возвращает объект."""
+        self.create = create
+        self.name = create.__name__
+        self.__doc__ = create.__doc__
+
+    def __get__(self, app, owner=None):
+        """Возвращает объект, создав его при первом обращении."""
+        if app is None:
+            return self
+        with app._lock:
+            if self.name not in app.__dict__:
+                app.__dict__[self.name] = self.create(app)
+        return app.__dict__[self.name]
+
+
+def get_digest_kinds() -> tuple:
+    """Возвращает виды сводок из переменной окружения DIGESTS."""
+    digest_kinds = tuple(
+        kind for kind in os.getenv('DIGESTS', ','.join(DIGESTS)).split(',')
+        if kind
+    )
+    if not set(digest_kinds) <= {DIGEST_WEEK, DIGEST_MONTH}:
+        raise ValueError(
+            f'DIGESTS: допустимы {DIGEST_WEEK} и {DIGEST_MONTH} через запятую.'
+        )
+    return digest_kinds
+
+
+class App:
+    """Общие объекты процесса бота.
+
+    register_handlers(bot) подключает обработчики к боту при его
+    создании. Настройки, которые дёшево проверить (DIGESTS), читаются
+    сразу - ошибка в них видна при запуске, а не при первой рассылке.
+    """
+
+    def __init__(self, register_handlers=None):
+        """Инициализатор; объекты создаются при первом обращении."""
+        self.register_handlers = register_handlers
+        # Виды сводок событий, которые рассылаются чатам:
+        self.digest_kinds = get_digest_kinds()
+        # Повторная: бот при создании обращается к update_offsets.
+        self._lock = threading.RLock()
+
+    @LazyProperty
+    def bot(self):
+        """Бот (обновления обрабатываются пулом потоков с очередью)."""
+        # telebot импортируется только вместе с ботом:
+        from dispatcher import DispatchingTeleBot
+
+        bot = DispatchingTeleBot(
+            token=os.getenv('BOT_TOKEN'),
+            workers=int(os.getenv('BOT_WORKERS', DISPATCHER_WORKERS)),
+            max_size=int(os.getenv('BOT_QUEUE_SIZE', DISPATCHER_QUEUE_SIZE))
+        )
+        bot.dispatcher.on_done = self._on_update_done
+        # Запись входящих обновлений для loadtest (RECORD_UPDATES=файл):
+        record_path = os.getenv('RECORD_UPDATES')
+        if record_path:
+            from loadtest import UpdateRecorder
+
+            bot.recorder = UpdateRecorder(record_path)
+        if self.register_handlers:
+            self.register_handlers(bot)
+        return bot
+
+    @LazyProperty
+    def update_offsets(self):
+        """Полученные и обработанные обновления (опрос после перезапуска
+        продолжается с первого необработанного)."""
+        return UpdateOffsets(
+            os.getenv('UPDATE_OFFSET_FILE', UPDATE_OFFSET_FILE)
+        )
+
+    @LazyProperty
+    def heartbeat(self):
+        """Время активности частей бота (HEALTH_FILE)."""
+        return Heartbeat(os.getenv('HEALTH_FILE', HEALTH_FILE))
+
+    @LazyProperty
+    def outbox(self):
+        """Очередь исходящих сообщений."""
+        return Outbox(self.bot)
+
+    @LazyProperty
+    def events_index(self):
+        """Индекс событий по дням года (перестраивается при изменении
+        таблицы)."""
+        events_index = EventsIndex(DB_PATH)
+        on_events_changed(lambda event_ids: events_index.invalidate())
+        return events_index
+
+    @LazyProperty
+    def message_cache(self):
+        """Готовые сообщения о ближайшем событии (общие для /next, кнопки
+        и рассылки)."""
+        return MessageCache()
+
+    @LazyProperty
+    def search_cache(self):
+        """Результаты поиска по частым запросам (/find и inline-режим)."""
+        return SearchCache()
+
+    def _on_update_done(self, update):
+        """Запоминает, что обновление обработано.
+
+        В файл состояние пишет цикл опроса (poll_updates) - один раз
+        на каждый ответ getUpdates, а не после каждого обновления.
+        """
+        self.update_offsets.mark_done(update.update_id)
@@ -0,0 +1,157 @@
+"""Запуск бота на asyncio: AsyncTeleBot и таймеры в одном цикле событий.
+
+Обработчики - те же, что в main (register_handlers), но выполняются
+в пуле потоков (to_thread), как и работа с БД, чтобы не блокировать цикл
+событий. Ответы и рассылки уходят через общую очередь отправки (Outbox),
+то есть через синхронного бота App.bot (requests) в потоке очереди, а не
+через клиент AsyncTeleBot.
+
+Это компромисс: обработчики main синхронные, и переписывать их на async
+ради одного режима не стали. Поэтому asyncio здесь экономит только поток
+опроса Telegram; на каждое обновление по-прежнему занят поток пула
+(не больше его размера), а отправка идёт своим HTTP-клиентом.
+
+Напоминания (reminders) - таймеры в своей куче TimerHeap, как в режиме
+потоков: она ждёт сроков в отдельном потоке пула, а не в цикле событий.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+
+from telebot.async_telebot import AsyncTeleBot
+
+from chats import send_due_chats
+from constants import (BOT_POOLING_TIMEOUT, CHATS_RECHECK_INTERVAL,
+                       NEXT_DATES_UPDATE_TIME, OUR_TIMEZONE)
+from database import (get_chat_event_ids, get_connection, on_chats_changed,
+                      on_events_changed)
+from main import (broadcast_nearest_date, prepare_chats_digests,
+                  register_default_chat, register_handlers, send_reminder,
+                  update_digests, update_events_dates)
+from reminders import sync_reminders
+from timers import TimerHeap, get_next_fire_time
+
+# Таймеры напоминаний (выполняются в потоке, см. _run):
+reminders_scheduler = TimerHeap()
+
+
+class ThreadedHandlers:
+    """Подключает обработчики main к AsyncTeleBot.
+
+    Повторяет методы register_*_handler бота, но оборачивает обработчик:
+    он выполняется в пуле потоков (to_thread) и отвечает через очередь
+    отправки, как в режиме потоков. Так main.register_handlers подключает
+    к асинхронному боту те же команды, кнопки и inline-запросы.
+    """
+
+    def __init__(self, bot):
+        """Инициализатор для асинхронного бота bot."""
+        self.bot = bot
+
+    def __getattr__(self, name):
+        """Возвращает метод регистрации, оборачивающий обработчик."""
+        register = getattr(self.bot, name)
+
+        def register_in_thread(callback, *args, **kwargs):
+            async def handler(update):
+                return await asyncio.to_thread(callback, update)
+
+            return register(handler, *args, **kwargs)
+
+        return register_in_thread
+
+
+def create_async_bot() -> AsyncTeleBot:
+    """Возвращает асинхронного бота с подключёнными обработчиками main."""
+    bot = AsyncTeleBot(token=os.getenv('BOT_TOKEN'))
+    register_handlers(ThreadedHandlers(bot))
+    return bot
+
+
+def get_seconds_until(message_time, timezone) -> float:
+    """Возвращает число секунд до ближайшего наступления времени ЧЧ:ММ."""
+    fire_at = get_next_fire_time(message_time, timezone)
+    return (fire_at - datetime.now(fire_at.tzinfo)).total_seconds()
+
+
+async def run_daily(message_time, job):
+    """Каждый день в message_time (нашего часового пояса) выполняет job."""
+    while True:
+        await asyncio.sleep(get_seconds_until(message_time, OUR_TIMEZONE))
+        try:
+            await job()
+        except Exception as e:
+            logging.error(e)
+
+
+async def run_chat_broadcasts():
+    """Рассылает сообщение о ближайшем событии чатам в их время (см. chats).
+
+    Сообщения уходят через очередь отправки (Outbox): она соблюдает лимиты
+    Telegram и повторяет отправку после 429 через retry_after. Спит до
+    ближайшего момента рассылки, но не дольше CHATS_RECHECK_INTERVAL:
+    расписание могли изменить вне процесса.
+    """
+    while True:
+        first_send_at = await asyncio.to_thread(
+            lambda: send_due_chats(
+                get_connection(), broadcast_nearest_date, time.time()
+            )
+        )
+        delay = CHATS_RECHECK_INTERVAL
+        if first_send_at is not None:
+            delay = min(max(first_send_at - time.time(), 0), delay)
+        await asyncio.sleep(delay)
+
+
+def update_reminders(event_ids=None):
+    """Пересчитывает таймеры напоминаний (всех или указанных событий)."""
+    sync_reminders(
+        reminders_scheduler, get_connection(), send_reminder, event_ids
+    )
+
+
+def update_chat_reminders(chat_id):
+    """Пересчитывает таймеры напоминаний о событиях чата chat_id."""
+    update_reminders(get_chat_event_ids(get_connection(), chat_id))
+
+
+def _start_new_day():
+    """Обновляет ближайшие даты, напоминания и сводки (выполняется в пуле
+    потоков)."""
+    update_events_dates()
+    update_reminders()  # таблицу могли изменить и вне бота
+    prepare_chats_digests()
+
+
+async def _run(bot):
+    """Запускает опрос Telegram ботом bot и ежедневные задачи в одном
+    цикле событий."""
+    await asyncio.to_thread(update_events_dates)
+    await asyncio.to_thread(register_default_chat)
+    await asyncio.to_thread(prepare_chats_digests)
+    on_events_changed(update_digests)
+    await asyncio.to_thread(update_reminders)
+    on_events_changed(update_reminders)
+    on_chats_changed(update_chat_reminders)
+    try:
+        await asyncio.gather(
+            bot.infinity_polling(timeout=BOT_POOLING_TIMEOUT),
+            asyncio.to_thread(reminders_scheduler.run),
+            run_chat_broadcasts(),
+            run_daily(
+                NEXT_DATES_UPDATE_TIME,
+                lambda: asyncio.to_thread(_start_new_day)
+            ),
+        )
+    finally:
+        reminders_scheduler.stop()
+        await bot.close_session()
+
+
+def run_async_bot():
+    """Запускает бота в режиме asyncio (клиент создаётся здесь, а не при
+    импорте модуля)."""
+    asyncio.run(_run(create_async_bot()))
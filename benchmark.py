@@ -0,0 +1,866 @@
+"""Замеры скорости горячих мест бота на синтетических базах событий.
+
+Для каждого размера базы (1 тыс. - 1 млн событий) генерируется events.db
+с обычными событиями, событиями с особыми правилами и 29 февраля
+(генерация воспроизводима: одинаковый seed - одинаковая база, готовая
+база переиспользуется). Замеры каждого размера идут в отдельном процессе
+в каталоге этой базы, поэтому main работает с ней как с обычной events.db.
+Сообщения вместо Telegram получает FakeBot в памяти.
+
+Результат - JSON со временем одного вызова (в секундах) по каждому замеру,
+временем восстановления опроса Telegram после сбоев API (FlakyApiBot),
+паузами очереди отправки после ответов 429 и сбоев (RateLimitedBot),
+глубиной очереди обновлений и пиком памяти на пачке из 10 тыс. обновлений,
+сверкой дат особых правил (NumPy, Python, StoredEvent и прежний расчёт
+Event с перебором календаря) и временем
+холодного запуска: импорта бота и CLI в новом процессе по
+-X importtime (с самыми долгими прямыми импортами). С --compare результат
+сравнивается с ранее сохранённым: при замедлении больше --max-regression
+процесс завершается с кодом 1. Если восстановление или очередь отправки
+ведут себя неверно (потеря, повтор, ранний повтор после 429), очередь
+обновлений растёт больше своего размера или памяти, или даты
+особых правил расходятся, замер падает с AssertionError.
+
+Запуск:
+    python benchmark.py [--events 1000 100000] [--output result.json]
+    python benchmark.py --compare baseline.json [--max-regression 0.1]
+    python benchmark.py --startup  # только время запуска
+    python benchmark.py --checks  # только проверки (без замеров на базах)
+"""
+import argparse
+import calendar
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from datetime import date
+from pathlib import Path
+
+BENCHMARK_EVENTS = (1000, 10000, 100000)
+BENCHMARK_REPEAT = 5
+BENCHMARK_SEED = 0
+BENCHMARK_DATA_DIR = '.benchmarks'
+BENCHMARK_CHAT_ID = -1000000000001
+# Доли событий с особыми правилами и событий 29 февраля:
+SPECIAL_SHARE = 0.1
+LEAP_DAY_SHARE = 0.01
+# Сколько событий берётся для замера Event и as_view:
+SAMPLE_SIZE = 1000
+# Обновлений в пачке и чатов, из которых они приходят (замер очереди):
+BURST_SIZE = 1000
+BURST_CHATS = 100
+# Проверка очереди на пачке: сколько обновлений, размер очереди, сколько
+# секунд обрабатывается обновление и предел памяти (в байтах) - все
+# обновления пачки заняли бы в несколько раз больше:
+BURST_CHECK_SIZE = 10000
+BURST_CHECK_QUEUE_SIZE = 100
+BURST_CHECK_HANDLER_SECONDS = 0.0002
+BURST_CHECK_MAX_MEMORY = 4 * 1024 * 1024
+# Замер восстановления: каждый какой вызов getUpdates падает и сколько
+# сбоев замерить:
+RECOVERY_FAIL_EVERY = 3
+RECOVERY_FAILURES = 5
+# Опрос при занятом обработчике: сколько секунд обрабатывается обновление
+# и сколько вызовов getUpdates за это время допустимо (long polling ждёт
+# новых обновлений, а не отдаёт сразу необработанные):
+BUSY_HANDLER_SECONDS = 1
+BUSY_MAX_GET_UPDATES = 3
+# Проверка очереди отправки: retry_after ответа 429, сколько сообщений
+# ставится в чат с 429 и сколько раз подряд падает отправка в другой чат:
+RATE_LIMIT_RETRY_AFTER = 1
+RATE_LIMIT_MESSAGES = 5
+RATE_LIMIT_FAILURES = 2
+# Сверка дат особых правил: сколько событий и за какие годы (високосные,
+# месяцы с пятым днём недели и на шесть календарных недель):
+SPECIAL_CHECK_EVENTS = 3000
+SPECIAL_CHECK_YEARS = range(2000, 2041)
+SPECIAL_CHECK_LEAP_SHARE = 0.05
+# Модули, время импорта которых замеряется, и сколько самых долгих
+# прямых импортов показывать:
+STARTUP_MODULES = ('events_io', 'ics_export', 'main', 'work_in_time')
+STARTUP_TOP_IMPORTS = 5
+
+
+class FakeBot:
+    """Бот в памяти: запоминает отправленные сообщения вместо Telegram."""
+
+    def __init__(self):
+        """Инициализатор бота без сообщений."""
+        self.sent = []
+        self._condition = threading.Condition()
+
+    def send_message(self, **kwargs):
+        """Запоминает сообщение (как TeleBot.send_message)."""
+        with self._condition:
+            self.sent.append(kwargs)
+            self._condition.notify_all()
+
+    def wait_for(self, count, timeout=10):
+        """Ждёт, пока отправленных сообщений станет count."""
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: len(self.sent) >= count, timeout
+            ):
+                raise TimeoutError('Сообщение не отправлено.')
+
+
+class FlakyApiBot:
+    """Бот с getUpdates, который падает на каждом fail_every-м вызове.
+
+    Каждый вызов возвращает два обновления: последнее уже отданное
+    (Telegram повторяет обновления до подтверждения offset'ом) и новое.
+    Запоминает моменты сбоев, восстановлений и обработанные update_id,
+    о каждом обработанном сообщает on_done(update_id).
+    """
+
+    def __init__(self, on_done, fail_every=RECOVERY_FAIL_EVERY):
+        """Инициализатор бота без обновлений."""
+        self.on_done = on_done
+        self.fail_every = fail_every
+        self.calls = 0
+        self.last_update_id = 0
+        self.failed_at = []
+        self.recovered_at = []
+        self.processed = []
+
+    def get_updates(self, offset=None, timeout=None, **kwargs):
+        """Возвращает обновления с номера offset или выбрасывает ошибку."""
+        from telebot.types import Update
+
+        self.calls += 1
+        now = time.perf_counter()
+        if self.calls % self.fail_every == 0:
+            self.failed_at.append(now)
+            raise ConnectionError('Bot API недоступен')
+        if len(self.recovered_at) < len(self.failed_at):
+            self.recovered_at.append(now)
+        self.last_update_id += 1
+        updates = []
+        for update_id in range(
+            max(offset or 1, self.last_update_id - 1), self.last_update_id + 1
+        ):
+            updates.append(Update.de_json({'update_id': update_id}))
+            updates[-1].json = {'update_id': update_id}
+        return updates
+
+    def process_new_updates(self, updates):
+        """Обрабатывает обновления: запоминает их update_id."""
+        for update in updates:
+            self.processed.append(update.update_id)
+            self.on_done(update.update_id)
+
+
+class BusyApiBot:
+    """Бот с одним обновлением и медленным обработчиком.
+
+    getUpdates ведёт себя как Telegram: обновления с номера offset
+    отдаются сразу, а если их нет - ответ ждёт timeout секунд (long
+    polling) или остановки stop. Обработчик выполняется в своём потоке
+    handle_seconds секунд и сообщает on_done(update_id).
+    """
+
+    def __init__(self, on_done, stop, handle_seconds=BUSY_HANDLER_SECONDS):
+        """Инициализатор бота с необработанным обновлением 1."""
+        self.on_done = on_done
+        self.stop = stop
+        self.handle_seconds = handle_seconds
+        self.calls = 0
+        self.handled = threading.Event()
+
+    def get_updates(self, offset=None, timeout=None, **kwargs):
+        """Возвращает обновление 1 или ждёт новых, как long polling."""
+        from telebot.types import Update
+
+        self.calls += 1
+        if (offset or 1) <= 1:
+            update = Update.de_json({'update_id': 1})
+            update.json = {'update_id': 1}
+            return [update]
+        self.stop.wait(timeout)
+        return []
+
+    def process_new_updates(self, updates):
+        """Запускает обработку обновлений в отдельных потоках."""
+        for update in updates:
+            threading.Thread(
+                target=self._handle, args=(update.update_id,), daemon=True
+            ).start()
+
+    def _handle(self, update_id):
+        """Медленный обработчик."""
+        time.sleep(self.handle_seconds)
+        self.on_done(update_id)
+        self.handled.set()
+
+
+def measure_busy_polling(path) -> dict:
+    """Считает вызовы getUpdates, пока обработчик занят обновлением.
+
+    Проверяет, что опрос не крутится вхолостую и что обновление,
+    не обработанное к моменту сохранения, после перезапуска (новый
+    UpdateOffsets из файла path) будет обработано снова.
+    """
+    from supervisor import Heartbeat, UpdateOffsets, poll_updates
+
+    offsets = UpdateOffsets(path)
+    stop = threading.Event()
+    fake_bot = BusyApiBot(offsets.mark_done, stop)
+    poller = threading.Thread(
+        target=poll_updates, args=(fake_bot, offsets, Heartbeat(), stop)
+    )
+    poller.start()
+    try:
+        time.sleep(fake_bot.handle_seconds / 2)
+        restored = UpdateOffsets(path).take_restored()
+        if restored != [{'update_id': 1}]:
+            raise AssertionError(f'Не сохранено необработанное: {restored}')
+        fake_bot.handled.wait(fake_bot.handle_seconds * 10)
+        calls = fake_bot.calls
+    finally:
+        stop.set()
+        poller.join()
+    if calls > BUSY_MAX_GET_UPDATES:
+        raise AssertionError(
+            f'getUpdates вызван {calls} раз за время обработки.'
+        )
+    return {'busy_get_updates': calls}
+
+
+def measure_recovery(failures=RECOVERY_FAILURES) -> dict:
+    """Замеряет время от сбоя getUpdates до следующего успешного вызова.
+
+    Проверяет, что после перезапусков каждое обновление обработано
+    ровно один раз, а при занятом обработчике опрос не крутится
+    вхолостую (measure_busy_polling).
+    """
+    from supervisor import (Heartbeat, UpdateOffsets, poll_updates,
+                            supervise)
+
+    offsets = UpdateOffsets()
+    fake_bot = FlakyApiBot(offsets.mark_done)
+    stop = threading.Event()
+
+    def poll():
+        if len(fake_bot.recovered_at) >= failures:
+            stop.set()
+            return
+        poll_updates(fake_bot, offsets, Heartbeat(), stop, timeout=0)
+
+    # Каждый сбой - первый после успешной работы (reset_after=0):
+    supervise('benchmark', poll, stop, reset_after=0)
+    if fake_bot.processed != list(range(1, fake_bot.last_update_id + 1)):
+        raise AssertionError('Обновления потеряны или повторены.')
+    timings = [
+        recovered - failed
+        for failed, recovered in zip(
+            fake_bot.failed_at, fake_bot.recovered_at
+        )
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        busy = measure_busy_polling(os.path.join(directory, 'offsets.json'))
+    return {
+        **busy,
+        'failures': len(timings),
+        'updates': fake_bot.last_update_id,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'max': max(timings),
+    }
+
+
+class RateLimitedBot:
+    """Бот, отправка которого падает заданными ошибками.
+
+    errors - {chat_id: [исключение, ...]}: очередная отправка в чат
+    выбрасывает следующее исключение из списка, когда список кончился -
+    сообщение доставлено. Запоминает моменты вызовов по чатам и
+    доставленные сообщения.
+    """
+
+    def __init__(self, errors):
+        """Инициализатор бота без сообщений."""
+        self.errors = errors
+        self.calls = {}
+        self.sent = []
+        self._condition = threading.Condition()
+
+    def send_message(self, chat_id, text, **kwargs):
+        """Выбрасывает очередную ошибку чата или запоминает сообщение."""
+        with self._condition:
+            self.calls.setdefault(chat_id, []).append(time.monotonic())
+            errors = self.errors.get(chat_id)
+            if errors:
+                raise errors.pop(0)
+            self.sent.append((chat_id, text))
+            self._condition.notify_all()
+
+    def wait_for(self, count, timeout=30):
+        """Ждёт, пока доставленных сообщений станет count."""
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: len(self.sent) >= count, timeout
+            ):
+                raise TimeoutError('Сообщения не доставлены.')
+
+
+def measure_rate_limits(retry_after=RATE_LIMIT_RETRY_AFTER,
+                        messages=RATE_LIMIT_MESSAGES,
+                        failures=RATE_LIMIT_FAILURES) -> dict:
+    """Проверяет очередь отправки на ответах 429 и сбоях Bot API.
+
+    В первый чат ставится messages сообщений, первая отправка получает
+    429 с retry_after: повтор должен прийти не раньше retry_after, одним
+    сообщением из всех ожидающих. Отправка во второй чат падает failures
+    раз: повторы - с задержкой OUTBOX_RETRY_DELAY, каждый раз вдвое
+    дольше. Возвращает выдержанные паузы (в секундах).
+    """
+    from telebot.apihelper import ApiTelegramException
+
+    from constants import OUTBOX_RETRY_DELAY
+    from outbox import Outbox
+
+    limited_chat, failing_chat = 1, 2
+    fake_bot = RateLimitedBot({
+        limited_chat: [ApiTelegramException('sendMessage', None, {
+            'ok': False,
+            'error_code': 429,
+            'description': f'Too Many Requests: retry after {retry_after}',
+            'parameters': {'retry_after': retry_after},
+        })],
+        failing_chat: [
+            ConnectionError('Bot API недоступен') for _ in range(failures)
+        ],
+    })
+    outbox = Outbox(fake_bot, global_rate=float('inf'))
+    started_at = time.perf_counter()
+    texts = [f'Сообщение {number}' for number in range(messages)]
+    for text in texts:
+        outbox.send(limited_chat, text)
+    # id строкой (как TG_GROUP_ID из окружения) - та же очередь чата:
+    outbox.send(str(failing_chat), 'Сообщение после сбоев')
+    fake_bot.wait_for(2)
+    elapsed = time.perf_counter() - started_at
+    outbox.stop()
+
+    if sorted(fake_bot.sent) != [
+        (limited_chat, '\n\n'.join(texts)),
+        (failing_chat, 'Сообщение после сбоев'),
+    ]:
+        raise AssertionError(f'Доставлено не то: {fake_bot.sent}')
+    retry_after_wait = (
+        fake_bot.calls[limited_chat][1] - fake_bot.calls[limited_chat][0]
+    )
+    if retry_after_wait < retry_after:
+        raise AssertionError('Повтор после 429 раньше retry_after.')
+    calls = fake_bot.calls[failing_chat]
+    backoff_waits = [
+        later - earlier for earlier, later in zip(calls, calls[1:])
+    ]
+    for attempt, wait in enumerate(backoff_waits):
+        if wait < OUTBOX_RETRY_DELAY * 2 ** attempt:
+            raise AssertionError('Повтор после сбоя раньше задержки.')
+    stats = outbox.get_stats()
+    expected = {'queued': 0, 'sent': 2, 'merged': messages - 1,
+                'retried': failures + 1, 'failed': 0}
+    if stats != expected:
+        raise AssertionError(f'Счётчики очереди: {stats}')
+    return {
+        'elapsed': elapsed,
+        'retry_after_wait': retry_after_wait,
+        'backoff_waits': backoff_waits,
+        **stats,
+    }
+
+
+def check_dispatcher_burst(size=BURST_CHECK_SIZE,
+                           max_size=BURST_CHECK_QUEUE_SIZE,
+                           handle_seconds=BURST_CHECK_HANDLER_SECONDS,
+                           max_memory=BURST_CHECK_MAX_MEMORY) -> dict:
+    """Проверяет, что пачка обновлений не переполняет очередь и память.
+
+    Обновления создаются по одному и ставятся в UpdateDispatcher быстрее,
+    чем обрабатываются: submit должен ждать места, глубина очереди - не
+    превышать max_size, а пик памяти (tracemalloc) - max_memory. Все
+    обновления должны быть обработаны. Возвращает глубину, пик памяти
+    (в байтах) и время.
+    """
+    from dispatcher import UpdateDispatcher
+
+    dispatcher = UpdateDispatcher(
+        lambda update: time.sleep(handle_seconds), max_size=max_size
+    )
+    max_depth = 0
+    started_at = time.perf_counter()
+    tracemalloc.start()
+    try:
+        for update_id in range(size):
+            dispatcher.submit(
+                _make_next_update(update_id, update_id % BURST_CHATS + 1)
+            )
+            max_depth = max(max_depth, dispatcher.get_stats()['queued'])
+        dispatcher.wait_idle()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        dispatcher.stop()
+    elapsed = time.perf_counter() - started_at
+
+    if max_depth > max_size:
+        raise AssertionError(f'Глубина очереди {max_depth} > {max_size}.')
+    if peak_memory > max_memory:
+        raise AssertionError(
+            f'Пик памяти {peak_memory} байт > {max_memory} байт.'
+        )
+    stats = dispatcher.get_stats()
+    if stats['processed'] != size or stats['dropped']:
+        raise AssertionError(f'Счётчики очереди: {stats}')
+    return {
+        'elapsed': elapsed,
+        'max_depth': max_depth,
+        'peak_memory': peak_memory,
+        **stats,
+    }
+
+
+def make_special_row(rng, event_id, years) -> tuple:
+    """Возвращает случайную строку события с особым правилом (EVENT_FIELDS).
+
+    Исходная дата - в одном из years, иногда 29 февраля високосного года.
+    """
+    leap_years = [year for year in years if calendar.isleap(year)]
+    if rng.random() < SPECIAL_CHECK_LEAP_SHARE:
+        year, month, day = rng.choice(leap_years), 2, 29
+    else:
+        year, month = rng.choice(years), rng.randint(1, 12)
+        day = rng.randint(1, calendar.monthrange(year, month)[1])
+    return (event_id, f'{day:02d}{month:02d}', 'Событие по дню недели', year,
+            1, rng.choice((None, 1, 2, 3, 4)))
+
+
+def get_special_date_by_calendar(row, year) -> date:
+    """Возвращает дату события с особым правилом в году year перебором.
+
+    День недели берётся из исходной даты строки (EVENT_FIELDS), его числа
+    в месяце - из столбца calendar.monthcalendar; номер недели вне 1-4
+    (или пустой) - последнее такое число.
+    """
+    _, day_and_month, _, source_year, _, week_number = row
+    day, month = int(day_and_month[:2]), int(day_and_month[2:])
+    weekday = calendar.weekday(source_year, month, day)
+    days = [week[weekday] for week in calendar.monthcalendar(year, month)
+            if week[weekday]]
+    if week_number and 1 <= week_number <= 4:
+        return date(year, month, days[week_number - 1])
+    return date(year, month, days[-1])
+
+
+def check_special_dates(count=SPECIAL_CHECK_EVENTS,
+                        years=SPECIAL_CHECK_YEARS,
+                        seed=BENCHMARK_SEED) -> dict:
+    """Сверяет даты особых правил с независимым перебором календаря.
+
+    Для count случайных событий и каждого года из years даты, посчитанные
+    массивами NumPy (если он установлен), циклом на Python и
+    StoredEvent.iter_occurrences, должны совпасть с перебором дней недели
+    месяца по calendar.monthcalendar (get_special_date_by_calendar), а
+    даты после исходного года - с цепочкой прежнего расчёта
+    Event.create_rules_for_events_with_special_params (год за годом).
+    Возвращает время каждого расчёта и сколько дат пришлось на 29 февраля
+    исходной даты, пятый день недели месяца и шестую календарную неделю
+    месяца.
+    """
+    from function import Event, StoredEvent
+    from special_dates import (_get_numpy, _resolve_with_numpy,
+                               _resolve_with_python, parse_special_rows)
+
+    years = list(years)
+    rng = random.Random(seed)
+    rows = [make_special_row(rng, event_id, years)
+            for event_id in range(1, count + 1)]
+    rules = parse_special_rows(rows)
+    if len(rules.ids) != count:
+        raise AssertionError('Не все правила разобраны.')
+    timings = {}
+
+    started_at = time.perf_counter()
+    expected = [
+        [get_special_date_by_calendar(row, year).toordinal()
+         for year in years]
+        for row in rows
+    ]
+    timings['calendar'] = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    resolved = _resolve_with_python(rules, years)
+    timings['python'] = time.perf_counter() - started_at
+    if resolved != expected:
+        raise AssertionError('Даты Python и календаря не совпадают.')
+
+    np = _get_numpy()
+    if np is not None:
+        started_at = time.perf_counter()
+        resolved = _resolve_with_numpy(np, rules, years).tolist()
+        timings['numpy'] = time.perf_counter() - started_at
+        if resolved != expected:
+            raise AssertionError('Даты NumPy и календаря не совпадают.')
+
+    start, end = date(years[0], 1, 1), date(years[-1] + 1, 1, 1)
+    started_at = time.perf_counter()
+    occurrences = [
+        [event_date.toordinal() for event_date in
+         StoredEvent.from_row(row).iter_occurrences(start, end)]
+        for row in rows
+    ]
+    timings['stored_event'] = time.perf_counter() - started_at
+    if occurrences != expected:
+        raise AssertionError('Даты StoredEvent и календаря не совпадают.')
+
+    started_at = time.perf_counter()
+    for row, row_expected in zip(rows, expected):
+        event = Event(*row[1:])
+        for year, ordinal in zip(years, row_expected):
+            if year <= event.year:
+                continue
+            event = event.create_rules_for_events_with_special_params()
+            if date(*event._y_m_d()).toordinal() != ordinal:
+                raise AssertionError(
+                    f'Прежний расчёт не совпадает с календарём: {row}, '
+                    f'{year}.'
+                )
+    timings['legacy_event'] = time.perf_counter() - started_at
+
+    coverage = {
+        'leap_day_rules': sum(row[1] == '2902' for row in rows),
+        'fifth_weekdays': 0,
+        'sixth_week_dates': 0,
+    }
+    for row in expected:
+        for ordinal in row:
+            event_date = date.fromordinal(ordinal)
+            if event_date.day > 28:
+                coverage['fifth_weekdays'] += 1
+            weeks = calendar.monthcalendar(event_date.year, event_date.month)
+            if len(weeks) == 6 and event_date.day in weeks[5]:
+                coverage['sixth_week_dates'] += 1
+    if not all(coverage.values()):
+        raise AssertionError(f'Не все случаи проверены: {coverage}')
+    return {'events': count, 'years': len(years), **timings, **coverage}
+
+
+def parse_importtime(output) -> list[tuple[str, int, int]]:
+    """Разбирает вывод -X importtime.
+
+    Возвращает строки (модуль, вложенность, мкс с вложенными импортами)
+    в порядке вывода: модуль - после своих импортов. Импорты запуска
+    интерпретатора (site и .pth окружения) пропускаются.
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), depth, int(cumulative)))
+        if (name, depth) == ('site', 0):
+            imports = []
+    return imports
+
+
+def measure_startup(modules=STARTUP_MODULES,
+                    repeat=BENCHMARK_REPEAT) -> dict:
+    """Замеряет холодный запуск: импорт каждого модуля в новом процессе.
+
+    Возвращает по модулю медиану времени импорта (в секундах) и самые
+    долгие прямые импорты модуля в последнем запуске.
+    """
+    results = {}
+    for module in modules:
+        timings = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                cwd=Path(__file__).resolve().parent,
+                check=True,
+                stderr=subprocess.PIPE,
+                text=True
+            ).stderr
+            imports = parse_importtime(output)
+            name, _, cumulative = imports[-1]
+            timings.append(cumulative / 1e6)
+        direct = sorted(
+            (
+                (cumulative, name) for name, depth, cumulative in imports
+                if depth == 1
+            ),
+            reverse=True
+        )
+        results[module] = {
+            'repeat': repeat,
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'top_imports': {
+                name: cumulative / 1e6
+                for cumulative, name in direct[:STARTUP_TOP_IMPORTS]
+            },
+        }
+    return results
+
+
+def make_event_row(rng, chat_id) -> tuple:
+    """Возвращает случайную строку события для вставки в «events»."""
+    year = rng.randint(1950, 2024)
+    if rng.random() < LEAP_DAY_SHARE:
+        return ('2902', 'Событие 29 февраля', year - year % 4, 0, None,
+                chat_id)
+    month = rng.randint(1, 12)
+    day = rng.randint(1, calendar.monthrange(2001, month)[1])
+    if rng.random() < SPECIAL_SHARE:
+        return (f'{day:02d}{month:02d}', 'Событие по дню недели', year, 1,
+                rng.choice((None, 1, 2, 3, 4)), chat_id)
+    return (f'{day:02d}{month:02d}', 'Событие', year, 0, None, chat_id)
+
+
+def generate_events_db(path, count, seed=BENCHMARK_SEED,
+                       chat_id=BENCHMARK_CHAT_ID):
+    """Создаёт базу с count случайными событиями и заполненными next_date."""
+    from database import connect, create_tables, update_next_dates
+    from events_io import INSERT_EVENT
+
+    rng = random.Random(seed)
+    conn = connect(path)
+    try:
+        create_tables(conn)
+        with conn:
+            conn.executemany(
+                INSERT_EVENT,
+                (make_event_row(rng, chat_id) for _ in range(count))
+            )
+        update_next_dates(conn, date.today())
+    finally:
+        conn.close()
+
+
+def measure(func, repeat=BENCHMARK_REPEAT) -> dict:
+    """Замеряет func: число вызовов подбирается, как в timeit."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    timings = [
+        total / number for total in timer.repeat(repeat, number)
+    ]
+    return {
+        'number': number,
+        'repeat': repeat,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+    }
+
+
+def _make_next_update(update_id, chat_id):
+    """Возвращает обновление Telegram с командой /next из личного чата."""
+    from telebot.types import Update
+
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Тест'},
+            'text': '/next',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}],
+        },
+    })
+
+
+def run_cases(repeat) -> dict:
+    """Выполняет замеры на events.db текущего каталога."""
+    os.environ.setdefault('BOT_TOKEN', '1:benchmark')
+    os.environ['TG_GROUP_ID'] = str(BENCHMARK_CHAT_ID)
+    os.environ.pop('TG_THREAD_ID', None)
+
+    import main
+    from database import EVENT_FIELDS, get_connection
+    from function import Event, StoredEvent
+    from outbox import Outbox
+    from substitutions import get_full_value_declension
+
+    app = main.create_app()
+    main.prepare_database()  # как при запуске бота
+    rows = get_connection().execute(
+        f'SELECT {EVENT_FIELDS} FROM events'
+    ).fetchall()
+    sample = rows[:SAMPLE_SIZE]
+    today = main._get_local_today()
+
+    def create_events():
+        for row in sample:
+            Event(*row[1:])
+
+    events = [Event(*row[1:]) for row in sample]
+
+    def view_events():
+        for event in events:
+            event.as_view()
+
+    stored_events = StoredEvent.from_rows(sample)
+
+    def view_stored_events():
+        for event in stored_events:
+            event.as_view()
+
+    def decline_values():
+        for value in range(SAMPLE_SIZE):
+            get_full_value_declension(value, 'days')
+
+    def render_after_change():
+        app.events_index.invalidate()
+        main._generates_text_for_the_nearest_date(today, BENCHMARK_CHAT_ID)
+
+    # /next через обработчики TeleBot и очередь отправки, без лимитов:
+    fake_bot = FakeBot()
+    app.outbox = Outbox(fake_bot, global_rate=float('inf'))
+    update_ids = iter(range(1, sys.maxsize))
+
+    def next_round_trip():
+        update_id = next(update_ids)
+        app.bot.process_new_updates([_make_next_update(update_id, update_id)])
+        fake_bot.wait_for(update_id)
+
+    def process_burst():
+        app.bot.process_new_updates([
+            _make_next_update(update_id, update_id % BURST_CHATS + 1)
+            for update_id in range(BURST_SIZE)
+        ])
+        app.bot.dispatcher.wait_idle()
+
+    cases = {
+        'events_from_stack': lambda: main._get_events_from_stack(rows, []),
+        'event_create': create_events,
+        'event_as_view': view_events,
+        'stored_event_create': lambda: StoredEvent.from_rows(sample),
+        'stored_event_as_view': view_stored_events,
+        'value_declension': decline_values,
+        'nearest_text': lambda: main._generates_text_for_the_nearest_date(
+            today, BENCHMARK_CHAT_ID
+        ),
+        'nearest_text_after_change': render_after_change,
+        'next_round_trip': next_round_trip,
+        'dispatcher_burst': process_burst,
+    }
+    results = {name: measure(func, repeat) for name, func in cases.items()}
+    app.outbox.stop()
+    return results
+
+
+def run_size(count, seed, repeat, data_dir) -> dict:
+    """Готовит базу на count событий и замеряет её в отдельном процессе."""
+    work_dir = Path(data_dir) / f'{count}-{seed}'
+    work_dir.mkdir(parents=True, exist_ok=True)
+    if not (work_dir / 'events.db').exists():
+        generate_events_db(str(work_dir / 'events.db'), count, seed)
+    output = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), '--worker',
+         '--repeat', str(repeat)],
+        cwd=work_dir,
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def compare(baseline, current, max_regression) -> tuple[dict, bool]:
+    """Сравнивает медианы замеров с базовыми.
+
+    Возвращает {размер: {замер: отношение текущего к базовому}} и признак
+    замедления больше max_regression хотя бы в одном замере.
+    """
+    ratios = {}
+    regressed = False
+    groups = dict(current['results'])
+    baseline_groups = dict(baseline['results'])
+    # Время запуска сравнивается как ещё одна группа замеров:
+    if 'startup' in current:
+        groups['startup'] = current['startup']
+        baseline_groups['startup'] = baseline.get('startup', {})
+    for size, cases in groups.items():
+        baseline_cases = baseline_groups.get(size, {})
+        for name, result in cases.items():
+            if name not in baseline_cases:
+                continue
+            ratio = result['median'] / baseline_cases[name]['median']
+            ratios.setdefault(size, {})[name] = round(ratio, 3)
+            regressed = regressed or ratio > 1 + max_regression
+    return (ratios, regressed)
+
+
+def main():
+    """Запуск из командной строки."""
+    parser = argparse.ArgumentParser(description='Замеры скорости бота.')
+    parser.add_argument('--events', type=int, nargs='+',
+                        default=BENCHMARK_EVENTS)
+    parser.add_argument('--seed', type=int, default=BENCHMARK_SEED)
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT)
+    parser.add_argument('--data-dir', default=BENCHMARK_DATA_DIR)
+    parser.add_argument('--output', help='файл для результата (JSON)')
+    parser.add_argument('--compare', help='результат для сравнения (JSON)')
+    parser.add_argument('--max-regression', type=float, default=0.1)
+    parser.add_argument('--startup', action='store_true',
+                        help='замерить только время запуска')
+    parser.add_argument('--checks', action='store_true',
+                        help='только проверки (восстановление, очереди, '
+                             'даты особых правил)')
+    parser.add_argument('--worker', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_cases(args.repeat)))
+        return
+
+    result = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': {},
+    }
+    if not args.startup and not args.checks:
+        result['results'] = {
+            str(count): run_size(count, args.seed, args.repeat, args.data_dir)
+            for count in args.events
+        }
+    if not args.startup:
+        result['recovery'] = measure_recovery()
+        result['rate_limits'] = measure_rate_limits()
+        result['burst'] = check_dispatcher_burst()
+        result['special_dates'] = check_special_dates(seed=args.seed)
+    if not args.checks:
+        result['startup'] = measure_startup(repeat=args.repeat)
+    regressed = False
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            result['compare'], regressed = compare(
+                json.load(baseline_file), result, args.max_regression
+            )
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+    print(text)
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Чаты бота: настройки рассылки и выбор чатов, которым пора её отправить.
+
+У каждого чата свои часовой пояс и время рассылки, а в таблице «chats»
+хранится ближайший момент рассылки (timestamp). В куче таймеров лежит один
+таймер на самый ранний из этих моментов: когда он срабатывает, из БД
+по индексу выбираются только чаты, которым пора, им уходит рассылка,
+а их моменты сдвигаются на следующий день.
+"""
+import re
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from database import (get_due_chats, get_first_send_at, save_chat,
+                      set_next_send_at)
+from timers import get_fire_time
+
+CHATS_TIMER_KEY = 'chats'
+SEND_TIME_PATTERN = re.compile(r'^([01]\d|2[0-3]):[0-5]\d$')
+
+
+def get_next_send_at(timezone, send_time, after: float) -> int:
+    """Возвращает ближайший после after момент ЧЧ:ММ в часовом поясе."""
+    local_date = datetime.fromtimestamp(after, ZoneInfo(timezone)).date()
+    fire_at = get_fire_time(local_date, send_time, timezone).timestamp()
+    if fire_at <= after:
+        fire_at = get_fire_time(
+            local_date + timedelta(days=1), send_time, timezone
+        ).timestamp()
+    return int(fire_at)
+
+
+def register_chat(conn, chat_id, thread_id, timezone, send_time):
+    """Сохраняет настройки чата и считает его ближайший момент рассылки."""
+    if not SEND_TIME_PATTERN.match(send_time):
+        raise ValueError(f'Время «{send_time}» не в формате ЧЧ:ММ.')
+    try:
+        ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f'Часового пояса «{timezone}» нет.')
+    save_chat(
+        conn, chat_id, thread_id, timezone, send_time,
+        get_next_send_at(timezone, send_time, time.time())
+    )
+
+
+def send_due_chats(conn, send, now: float):
+    """Отправляет рассылку чатам, которым пора, и сдвигает их сроки.
+
+    send(chats) получает строки (chat_id, thread_id, timezone, send_time).
+    Чаты, пропустившие срок (бот был выключен), получают рассылку сразу,
+    а следующий срок считается от now. Возвращает ближайший следующий
+    момент рассылки среди всех чатов (или None).
+    """
+    due_chats = get_due_chats(conn, int(now))
+    try:
+        if due_chats:
+            send(due_chats)
+    finally:
+        set_next_send_at(conn, [
+            (get_next_send_at(timezone, send_time, now), chat_id)
+            for chat_id, _, timezone, send_time in due_chats
+        ])
+    return get_first_send_at(conn)
+
+
+class ChatsScheduler:
+    """Ежедневные рассылки по чатам на общей куче таймеров (TimerHeap)."""
+
+    def __init__(self, scheduler, get_connection, send):
+        """Инициализатор (get_connection - соединение для потока таймеров)."""
+        self.scheduler = scheduler
+        self.get_connection = get_connection
+        self.send = send
+
+    def reschedule(self, first_send_at=None):
+        """Ставит таймер на ближайший момент рассылки среди всех чатов."""
+        if first_send_at is None:
+            first_send_at = get_first_send_at(self.get_connection())
+        if first_send_at is None:
+            self.scheduler.cancel(CHATS_TIMER_KEY)
+        else:
+            self.scheduler.add(first_send_at, self.send_due, CHATS_TIMER_KEY)
+
+    def send_due(self):
+        """Срабатывание таймера: рассылка чатам, которым пора."""
+        self.reschedule(
+            send_due_chats(self.get_connection(), self.send, time.time())
+        )
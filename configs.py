@@ -1,21 +1,180 @@
+"""Настройка логгирования: очередь, JSON-строки и ограничение повторов.
+
+Потоки бота не пишут в файл сами: запись попадает в ограниченную очередь
+(put без ожидания), а в файл и консоль её выводит отдельный поток
+QueueListener. При переполнении очереди записи отбрасываются и считаются
+в метрике log_dropped - обработчики никогда не ждут диска.
+
+В файл пишутся JSON-строки с идентификаторами запроса и чата из
+log_context (обработка обновления, задача расписания), в консоль - текст
+в LOG_FORMAT. Одинаковые предупреждения и ошибки (из одного места кода)
+выводятся не больше LOG_RATE_LIMIT_BURST раз за LOG_RATE_LIMIT_INTERVAL
+секунд; число пропущенных дописывается к следующей выведенной записи.
+"""
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import (QueueHandler, QueueListener,
+                              RotatingFileHandler)
 from pathlib import Path
+
 from constants import (BACKUP_COUNT, DATETIME_FORMAT, LOG_DIR, LOG_FILE,
-                       LOG_FORMAT, MAX_BYTES_FOR_LOG_FILE)
+                       LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_LIMIT_BURST,
+                       LOG_RATE_LIMIT_INTERVAL, MAX_BYTES_FOR_LOG_FILE)
+from metrics import metrics
+
+# Поля, которые log_context добавляет к записям:
+LOG_CONTEXT_FIELDS = ('request_id', 'chat_id')
+
+_log_context = ContextVar('log_context', default={})
+
+
+@contextmanager
+def log_context(**fields):
+    """Добавляет поля (request_id, chat_id...) к записям внутри блока."""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def get_log_context() -> dict:
+    """Возвращает поля log_context текущего блока (пустой словарь вне)."""
+    return _log_context.get()
+
+
+class RateLimitFilter(logging.Filter):
+    """Пропускает не больше burst записей из одного места за interval.
+
+    Ограничиваются записи от уровня level: место - файл и строка вызова,
+    поэтому записи с разным текстом из одного места считаются похожими.
+    """
 
-from logging.handlers import RotatingFileHandler
+    def __init__(self, interval=LOG_RATE_LIMIT_INTERVAL,
+                 burst=LOG_RATE_LIMIT_BURST, level=logging.WARNING):
+        """Инициализатор фильтра без истории."""
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.level = level
+        self._windows = {}  # место -> [начало окна, записей в окне]
+        self._lock = threading.Lock()
 
+    def filter(self, record) -> bool:
+        """Возвращает False, если запись надо пропустить."""
+        if record.levelno < self.level:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[1] - self.burst if window else 0
+                self._windows[key] = [now, 1]
+                if suppressed > 0:
+                    record.suppressed = suppressed
+                return True
+            window[1] += 1
+            if window[1] <= self.burst:
+                return True
+        metrics.increment('log_suppressed', record.levelname)
+        return False
 
-def configure_logging():
-    """Настройка конфигурации для логгирования."""
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler, который не ждёт места в очереди, а теряет запись."""
+
+    def prepare(self, record):
+        """Готовит запись к передаче в другой поток.
+
+        Текст сообщения и исключения вычисляются здесь (аргументы могут
+        измениться), поля log_context копируются из текущего контекста.
+        """
+        record = copy.copy(record)
+        message = record.getMessage()
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            message += f' (похожих пропущено: {suppressed})'
+        record.msg = message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info
+            )
+            record.exc_info = None
+        for field, value in _log_context.get().items():
+            setattr(record, field, value)
+        return record
+
+    def enqueue(self, record):
+        """Кладёт запись в очередь; при переполнении отбрасывает её."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.increment('log_dropped', record.levelname)
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись одной JSON-строкой."""
+
+    def format(self, record) -> str:
+        """Возвращает JSON: время, уровень, логгер, сообщение, контекст."""
+        data = {
+            'time': datetime.fromtimestamp(record.created).isoformat(
+                timespec='milliseconds'
+            ),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for field in LOG_CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+def configure_logging(level=None) -> QueueListener:
+    """Настройка конфигурации для логгирования.
+
+    Возвращает запущенный поток записи (останавливается при выходе).
+    Уровень - level или переменная окружения LOG_LEVEL (INFO).
+    """
     log_dir = Path(LOG_DIR)
     log_dir.mkdir(exist_ok=True)
     rotating_handler = RotatingFileHandler(
-        LOG_FILE, maxBytes=MAX_BYTES_FOR_LOG_FILE, backupCount=BACKUP_COUNT
+        LOG_FILE, maxBytes=MAX_BYTES_FOR_LOG_FILE, backupCount=BACKUP_COUNT,
+        encoding='utf-8'
+    )
+    rotating_handler.setFormatter(JsonFormatter())
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        logging.Formatter(LOG_FORMAT, datefmt=DATETIME_FORMAT)
+    )
+    queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(RateLimitFilter())
+    listener = QueueListener(
+        queue_handler.queue, rotating_handler, stream_handler
     )
     logging.basicConfig(
-        datefmt=DATETIME_FORMAT,
-        format=LOG_FORMAT,
-        level=logging.INFO,
-        handlers=(rotating_handler, logging.StreamHandler())
+        level=level or os.getenv('LOG_LEVEL', 'INFO'),
+        handlers=(queue_handler,),
+        force=True
     )
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
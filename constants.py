@@ -15,7 +15,7 @@ MIN_YEAR = 1900
 
 MAX_YEAR = 2050
 
-BASE_DIR = Path(__file__)
+BASE_DIR = Path(__file__).resolve().parent
 
 # Константы для логгирования:
 LOG_DIR = BASE_DIR / 'logs'
@@ -24,12 +24,109 @@ MAX_BYTES_FOR_LOG_FILE = 10 ** 6
 BACKUP_COUNT = 5
 DATETIME_FORMAT = '%Y-%m-%d_%H-%M-%S'
 LOG_FORMAT = '"%(asctime)s - [%(levelname)s] - %(message)s"'
+LOG_QUEUE_SIZE = 10000  # записей в очереди до записи в файл
+# Одинаковых предупреждений (из одного места кода) за интервал, секунд:
+LOG_RATE_LIMIT_BURST = 10
+LOG_RATE_LIMIT_INTERVAL = 60
+
+# База данных событий:
+DB_PATH = 'events.db'
+DB_BUSY_TIMEOUT = 5  # секунд ожидания, если БД занята другой записью
+DB_CACHED_STATEMENTS = 64  # подготовленных запросов на соединение
+CHAT_INDEX_CACHE_SIZE = 256  # чатов, чьи индексы событий держатся в памяти
+# Сколько дней назад от местной даты запроса хранить готовые сообщения:
+# в часовых поясах от UTC-12 до UTC+14 одновременно идут до трёх дат.
+MESSAGE_CACHE_DAYS = 2
+# С какого числа событий с особыми правилами даты считаются в NumPy:
+SPECIAL_DATES_NUMPY_MIN = 1000
+
+# Списки событий (/upcoming, /month):
+PAGE_SIZE = 10
+UPCOMING_DAYS = 30  # период /upcoming по умолчанию
+MAX_UPCOMING_DAYS = 366
+
+# Поиск событий (/find и inline-режим):
+SEARCH_LIMIT = 20  # результатов (inline-ответ - не больше 50)
+SEARCH_CACHE_SIZE = 256  # запросов в LRU-кэше результатов
+INLINE_CACHE_TIME = 60  # секунд, сколько Telegram кэширует inline-ответ
+
+# Календарь iCalendar (/calendar, ics_export.py):
+ICS_YEARS = 10  # лет вперёд по умолчанию
+MAX_ICS_YEARS = 50
+ICS_CHUNK_SIZE = 500  # событий в одном куске файла
+ICS_UID_DOMAIN = 'events-bot'  # правая часть UID событий календаря
+ICS_CALENDAR_NAME = 'События'
+
+# Загрузка событий из файла (/import, events_io.py):
+IMPORT_CHUNK_SIZE = 1000  # строк в одном executemany
+IMPORT_MAX_ERRORS = 20  # ошибок в отчёте (остальные только считаются)
 
 # Отправка сообщений по расписанию
 MESSAGE_TIME = '09:00'
 OUR_TIMEZONE = 'Asia/Yekaterinburg'
+NEXT_DATES_UPDATE_TIME = '00:00'
+# За сколько дней до события напоминать (в MESSAGE_TIME):
+REMINDER_DAYS = (7,)
+# Сводки событий: за неделю (в понедельник) и за месяц (1-го числа),
+# уходят вместе с ежедневной рассылкой (переменная окружения DIGESTS -
+# виды сводок через запятую, пустая - без сводок):
+DIGEST_WEEK = 'week'
+DIGEST_MONTH = 'month'
+DIGESTS = (DIGEST_WEEK, DIGEST_MONTH)
+# Как часто перечитывать расписание чатов, изменённое вне процесса (сек.):
+CHATS_RECHECK_INTERVAL = 60
+
+# Режим запуска (переменная окружения BOT_RUNTIME): потоки или asyncio:
+BOT_RUNTIME_THREADS = 'threads'
+BOT_RUNTIME_ASYNCIO = 'asyncio'
+
+# Очередь отправки сообщений (ограничения Telegram):
+MAX_MESSAGE_LENGTH = 4096
+OUTBOX_GLOBAL_RATE = 30  # сообщений в секунду на бота
+OUTBOX_CHAT_RATE = 1  # сообщений в секунду в личный чат
+OUTBOX_GROUP_RATE = 20 / 60  # сообщений в секунду в группу
+OUTBOX_MAX_ATTEMPTS = 5  # попыток отправки (без учёта ответов 429)
+OUTBOX_RETRY_DELAY = 1  # секунд до первого повтора (далее - вдвое дольше)
+# Сколько ограничителей чатов держать, прежде чем убрать полные у чатов
+# без очереди (новый ограничитель такой же полный):
+OUTBOX_CHAT_BUCKETS = 1000
+
+# Очередь входящих обновлений (переменные окружения BOT_WORKERS и
+# BOT_QUEUE_SIZE): потоков-обработчиков и обновлений в очереди:
+DISPATCHER_WORKERS = 4
+DISPATCHER_QUEUE_SIZE = 1000
+
+# Способ получения обновлений (переменная окружения BOT_UPDATES_MODE):
+UPDATES_MODE_POLLING = 'polling'
+UPDATES_MODE_WEBHOOK = 'webhook'
+
+# Webhook (адрес сервера по умолчанию, если не указан в окружении):
+WEBHOOK_PATH = '/webhook'
+WEBHOOK_HOST = '127.0.0.1'
+WEBHOOK_PORT = 8080
+WEBHOOK_MAX_BODY_SIZE = 10 ** 6
+
+# Метрики (гистограммы задержек, секунды) и профилирование медленных
+# запросов (переменные окружения METRICS_PORT, METRICS_FILE, PROFILE_SLOW):
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+                   5, 10)
+METRICS_HOST = '127.0.0.1'
+METRICS_WRITE_INTERVAL = 60  # секунд между записями METRICS_FILE
+SLOW_REQUEST_SECONDS = 1  # запрос дольше - медленный (его стеки в лог)
+PROFILER_INTERVAL = 0.01  # секунд между снимками стека медленного запроса
 
 # Запуск бота через pooling:
-RELOAD_BOT_TIMER: Final[int] = 60
 BOT_POOLING_TIMEOUT: Final[int] = 50
-BOT_POOLING_INTERVAL: Final[int] = 5
+
+# Перезапуск опроса и расписания после сбоя (секунды): первая задержка,
+# наибольшая задержка и разброс; проработав дольше BACKOFF_RESET_AFTER,
+# часть бота снова перезапускается с первой задержкой:
+BACKOFF_INITIAL = 0.25
+BACKOFF_MAX = 60
+BACKOFF_JITTER = 0.1
+BACKOFF_RESET_AFTER = 60
+# Файлы с обработанными update_id и с временем последней активности
+# (переменные окружения UPDATE_OFFSET_FILE, HEALTH_FILE):
+UPDATE_OFFSET_FILE = 'update_offset.json'
+HEALTH_FILE = 'health.json'
+HEARTBEAT_INTERVAL = 10  # секунд между записями HEALTH_FILE
@@ -0,0 +1,574 @@
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from constants import (DB_BUSY_TIMEOUT, DB_CACHED_STATEMENTS, DB_PATH,
+                       PAGE_SIZE)
+from function import StoredEvent
+from metrics import get_query_name, metrics
+from special_dates import get_next_special_dates
+
+
+# Поля таблицы «events» в порядке StoredEvent.from_row:
+EVENT_FIELDS = (
+    'id, day_and_month, description, year, special_rule, week_number'
+)
+
+CREATE_EVENTS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY,
+        day_and_month TEXT NOT NULL,
+        description TEXT NOT NULL,
+        year INTEGER,
+        special_rule INTEGER DEFAULT 0,
+        week_number INTEGER,
+        next_date TEXT,
+        chat_id INTEGER
+    )
+'''
+# Колонки, добавленные в «events» после первой версии бота (в таблицу
+# прежней версии их добавляет create_tables, заполняет - migrate.py):
+EVENTS_ADDED_COLUMNS = {'next_date': 'TEXT', 'chat_id': 'INTEGER'}
+CREATE_NEXT_DATE_INDEX = '''
+    CREATE INDEX IF NOT EXISTS idx_events_next_date ON events (next_date)
+'''
+CREATE_CHAT_NEXT_DATE_INDEX = '''
+    CREATE INDEX IF NOT EXISTS idx_events_chat_next_date
+    ON events (chat_id, next_date)
+'''
+
+# Чаты: тред для сообщений, часовой пояс, время рассылки и её ближайший
+# момент (timestamp) - по нему планировщик выбирает чаты, которым пора.
+CREATE_CHATS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS chats (
+        chat_id INTEGER PRIMARY KEY,
+        thread_id INTEGER,
+        timezone TEXT NOT NULL,
+        send_time TEXT NOT NULL,
+        next_send_at INTEGER
+    )
+'''
+CREATE_NEXT_SEND_AT_INDEX = '''
+    CREATE INDEX IF NOT EXISTS idx_chats_next_send_at ON chats (next_send_at)
+'''
+
+# Сводки событий за неделю и месяц: готовые строки (JSON-список
+# [дата, id события, текст]) и текст сообщения. sent_at - когда сводка
+# отправлена (после этого она не меняется).
+CREATE_DIGESTS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS digests (
+        chat_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        period_start TEXT NOT NULL,
+        period_end TEXT NOT NULL,
+        items TEXT NOT NULL,
+        text TEXT NOT NULL,
+        sent_at INTEGER,
+        PRIMARY KEY (chat_id, kind, period_start)
+    )
+'''
+
+# Версия таблицы «events»: счётчик, который триггеры увеличивают при каждой
+# записи в неё. По нему кэши видят изменения событий, в том числе из
+# других процессов, и не сбрасываются от записей в «chats» и «digests»
+# (PRAGMA data_version меняется от любой записи в БД). Пересчёт next_date
+# версию не меняет: от него не зависит ни индекс дней, ни текст сообщений,
+# а в процессе бота о нём сообщает notify_events_changed.
+CREATE_EVENTS_VERSION_TABLE = '''
+    CREATE TABLE IF NOT EXISTS events_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+'''
+INIT_EVENTS_VERSION = (
+    'INSERT OR IGNORE INTO events_version (id, version) VALUES (1, 0)'
+)
+CREATE_EVENTS_VERSION_TRIGGERS = tuple(
+    f'''
+    CREATE TRIGGER IF NOT EXISTS events_version_{name} AFTER {event} ON events
+    BEGIN
+        UPDATE events_version SET version = version + 1 WHERE id = 1;
+    END
+    '''
+    for name, event in (
+        ('insert', 'INSERT'),
+        ('delete', 'DELETE'),
+        ('update', 'UPDATE OF day_and_month, description, year, '
+                   'special_rule, week_number, chat_id'),
+    )
+)
+
+# Полнотекстовый поиск по описаниям (FTS5). Таблица хранит только индекс
+# (content='events'), синхронизацию с «events» ведут триггеры. Индексы
+# префиксов из 2 и 3 букв ускоряют поиск по мере набора («ма*»).
+CREATE_EVENTS_FTS_TABLE = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+        description,
+        content='events',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+'''
+CREATE_EVENTS_FTS_TRIGGERS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS events_fts_insert AFTER INSERT ON events
+    BEGIN
+        INSERT INTO events_fts (rowid, description)
+        VALUES (new.id, new.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS events_fts_delete AFTER DELETE ON events
+    BEGIN
+        INSERT INTO events_fts (events_fts, rowid, description)
+        VALUES ('delete', old.id, old.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS events_fts_update
+    AFTER UPDATE OF description ON events
+    BEGIN
+        INSERT INTO events_fts (events_fts, rowid, description)
+        VALUES ('delete', old.id, old.description);
+        INSERT INTO events_fts (rowid, description)
+        VALUES (new.id, new.description);
+    END
+    ''',
+)
+
+
+# Соединения, открытые в процессе (закрываются при остановке):
+_connections = []
+_connections_lock = threading.Lock()
+_local = threading.local()
+
+# Сколько id передавать в одном запросе «WHERE id IN (...)»:
+SQL_PARAMS_CHUNK_SIZE = 500
+
+# Подписчики на изменения таблицы «events» (см. notify_events_changed):
+_events_listeners = []
+
+# Подписчики на изменения настроек чатов (см. save_chat):
+_chats_listeners = []
+
+
+class TimedConnection(sqlite3.Connection):
+    """Соединение, замеряющее время запросов (метрика db_query_seconds).
+
+    Замеряется execute: у SELECT это время до первой строки результата.
+    """
+
+    def execute(self, sql, parameters=()):
+        """Выполняет запрос с замером времени."""
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe(
+                'db_query_seconds',
+                get_query_name(sql),
+                time.perf_counter() - started
+            )
+
+    def executemany(self, sql, parameters):
+        """Выполняет запрос для каждого набора параметров с замером."""
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            metrics.observe(
+                'db_query_seconds',
+                get_query_name(sql),
+                time.perf_counter() - started
+            )
+
+
+def connect(db_path=DB_PATH) -> sqlite3.Connection:
+    """Открывает соединение с БД в режиме WAL.
+
+    В режиме WAL чтение не блокирует запись (и наоборот), а при занятой БД
+    соединение ждёт DB_BUSY_TIMEOUT секунд вместо ошибки «database is locked».
+    Подготовленные запросы кэшируются соединением по тексту запроса.
+    """
+    conn = sqlite3.connect(
+        db_path,
+        timeout=DB_BUSY_TIMEOUT,
+        cached_statements=DB_CACHED_STATEMENTS,
+        check_same_thread=False,
+        factory=TimedConnection
+    )
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+
+def get_connection(db_path=DB_PATH) -> sqlite3.Connection:
+    """Возвращает соединение текущего потока (открывает при первом вызове)."""
+    connections = _local.__dict__.setdefault('connections', {})
+    if db_path not in connections:
+        connections[db_path] = connect(db_path)
+    return connections[db_path]
+
+
+@atexit.register
+def close_connections():
+    """Закрывает все открытые соединения (при остановке бота)."""
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+    _local.__dict__.pop('connections', None)
+
+
+def on_events_changed(callback):
+    """Подписывает callback(event_ids) на изменения таблицы «events».
+
+    event_ids - список id изменённых событий или None, если изменилось
+    неизвестно что (нужен полный пересчёт).
+    """
+    _events_listeners.append(callback)
+    return callback
+
+
+def notify_events_changed(event_ids=None):
+    """Сообщает подписчикам, что события были изменены."""
+    for callback in _events_listeners:
+        callback(event_ids)
+
+
+def on_chats_changed(callback):
+    """Подписывает callback(chat_id) на изменения настроек чатов."""
+    _chats_listeners.append(callback)
+    return callback
+
+
+def add_missing_columns(conn) -> list:
+    """Добавляет в «events» прежней версии недостающие колонки.
+
+    Возвращает имена добавленных колонок.
+    """
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(events)')}
+    added = [
+        name for name in EVENTS_ADDED_COLUMNS if name not in columns
+    ]
+    for name in added:
+        conn.execute(
+            f'ALTER TABLE events ADD COLUMN {name} '
+            f'{EVENTS_ADDED_COLUMNS[name]}'
+        )
+    return added
+
+
+def create_tables(conn):
+    """Создаёт таблицы и индексы, если их ещё нет.
+
+    Таблицу «events» прежней версии дополняет недостающими колонками,
+    поэтому подходит и для новой, и для старой БД.
+    """
+    conn.execute(CREATE_EVENTS_TABLE)
+    add_missing_columns(conn)
+    conn.execute(CREATE_NEXT_DATE_INDEX)
+    conn.execute(CREATE_CHAT_NEXT_DATE_INDEX)
+    conn.execute(CREATE_CHATS_TABLE)
+    conn.execute(CREATE_NEXT_SEND_AT_INDEX)
+    conn.execute(CREATE_DIGESTS_TABLE)
+    conn.execute(CREATE_EVENTS_VERSION_TABLE)
+    conn.execute(INIT_EVENTS_VERSION)
+    conn.execute(CREATE_EVENTS_FTS_TABLE)
+    for trigger in CREATE_EVENTS_VERSION_TRIGGERS + CREATE_EVENTS_FTS_TRIGGERS:
+        conn.execute(trigger)
+    conn.commit()
+
+
+def get_events_version(conn) -> int:
+    """Возвращает версию таблицы «events» (растёт при каждой записи)."""
+    return conn.execute(
+        'SELECT version FROM events_version WHERE id = 1'
+    ).fetchone()[0]
+
+
+def needs_migration(conn) -> bool:
+    """Проверяет, есть ли события без чата (БД до migrate.py)."""
+    return conn.execute(
+        'SELECT 1 FROM events WHERE chat_id IS NULL LIMIT 1'
+    ).fetchone() is not None
+
+
+def rebuild_search_index(conn):
+    """Заново строит поисковый индекс по всем событиям."""
+    conn.execute("INSERT INTO events_fts (events_fts) VALUES ('rebuild')")
+    conn.commit()
+
+
+def update_next_dates(conn, today: date) -> int:
+    """Пересчитывает ближайшую дату у прошедших и новых событий.
+
+    Обновляются только строки, у которых next_date не заполнена или уже
+    прошла. События с особыми правилами считаются пакетно (special_dates).
+    Возвращает количество обновлённых строк.
+    """
+    rows = conn.execute(
+        f'SELECT {EVENT_FIELDS} FROM events '
+        'WHERE next_date IS NULL OR next_date < ?',
+        (today.isoformat(),)
+    ).fetchall()
+
+    updates = [
+        (next_date.isoformat(), event_id)
+        for event_id, next_date in get_next_special_dates(
+            [row for row in rows if row[4]], today
+        )
+    ]
+    for row in rows:
+        if row[4]:
+            continue  # событие с особыми правилами уже посчитано
+        try:
+            next_date = StoredEvent.from_row(row).get_next_date(today)
+        except ValueError as e:
+            logging.warning(f'Событие id={row[0]} пропущено: {e}')
+            continue
+        updates.append((next_date.isoformat(), row[0]))
+
+    conn.executemany('UPDATE events SET next_date = ? WHERE id = ?', updates)
+    conn.commit()
+    if updates:
+        notify_events_changed([event_id for _, event_id in updates])
+    return len(updates)
+
+
+def get_event(conn, event_id):
+    """Возвращает строку события (поля EVENT_FIELDS) или None."""
+    return conn.execute(
+        f'SELECT {EVENT_FIELDS} FROM events WHERE id = ?', (event_id,)
+    ).fetchone()
+
+
+def iter_events(conn, chat_id=None):
+    """Возвращает курсор по событиям (поля EVENT_FIELDS) чата или всем.
+
+    Строки читаются по мере перебора, а не все сразу.
+    """
+    if chat_id is None:
+        return conn.execute(f'SELECT {EVENT_FIELDS} FROM events ORDER BY id')
+    return conn.execute(
+        f'SELECT {EVENT_FIELDS} FROM events WHERE chat_id = ? ORDER BY id',
+        (chat_id,)
+    )
+
+
+def _select_in(conn, query, values) -> list:
+    """Выполняет query, оканчивающийся на «IN», для всех values.
+
+    Значения передаются частями по SQL_PARAMS_CHUNK_SIZE: у SQLite есть
+    предел числа параметров запроса. Возвращает строки всех частей.
+    """
+    values = list(values)
+    rows = []
+    for start in range(0, len(values), SQL_PARAMS_CHUNK_SIZE):
+        chunk = values[start:start + SQL_PARAMS_CHUNK_SIZE]
+        rows += conn.execute(
+            f'{query} ({", ".join("?" * len(chunk))})', chunk
+        ).fetchall()
+    return rows
+
+
+def get_chat_event_ids(conn, chat_id) -> list:
+    """Возвращает id событий чата (по индексу chat_id, next_date)."""
+    return [
+        row[0] for row in conn.execute(
+            'SELECT id FROM events WHERE chat_id = ?', (chat_id,)
+        )
+    ]
+
+
+def get_events_with_chats(conn, event_ids) -> list:
+    """Возвращает строки указанных событий: поля EVENT_FIELDS и chat_id."""
+    return _select_in(
+        conn, f'SELECT {EVENT_FIELDS}, chat_id FROM events WHERE id IN',
+        event_ids
+    )
+
+
+def get_events_before(conn, chat_id, end: date) -> list:
+    """Возвращает события чата с ближайшей датой до end (по индексу).
+
+    Это события, которые могут выпасть на период, кончающийся в end
+    (начинающийся не раньше сегодняшнего дня).
+    """
+    return conn.execute(
+        f'SELECT {EVENT_FIELDS} FROM events '
+        'WHERE chat_id = ? AND next_date < ?',
+        (chat_id, end.isoformat())
+    ).fetchall()
+
+
+def get_event_chat(conn, event_id):
+    """Возвращает (id чата, id треда) события или None."""
+    return conn.execute(
+        'SELECT events.chat_id, chats.thread_id FROM events '
+        'LEFT JOIN chats ON chats.chat_id = events.chat_id '
+        'WHERE events.id = ?',
+        (event_id,)
+    ).fetchone()
+
+
+def get_next_dates(conn, event_ids=None) -> list[tuple]:
+    """Возвращает ближайшие даты всех или указанных событий.
+
+    Строки - (id, next_date, часовой пояс чата, время рассылки чата);
+    для событий без зарегистрированного чата пояс и время - None.
+    """
+    query = (
+        'SELECT events.id, events.next_date, chats.timezone, chats.send_time '
+        'FROM events LEFT JOIN chats ON chats.chat_id = events.chat_id '
+        'WHERE events.next_date IS NOT NULL'
+    )
+    if event_ids is None:
+        return conn.execute(query).fetchall()
+    return _select_in(conn, f'{query} AND events.id IN', event_ids)
+
+
+def get_events_page(conn, chat_id, start: date, end: date, cursor=None,
+                    limit=PAGE_SIZE) -> list:
+    """Возвращает страницу событий чата с next_date в диапазоне [start, end].
+
+    Постраничный вывод по ключу (next_date, id): cursor - пара последней
+    показанной строки, страница начинается сразу после неё. Строки - поля
+    EVENT_FIELDS и next_date.
+    """
+    cursor = cursor or ('', 0)
+    return conn.execute(
+        f'SELECT {EVENT_FIELDS}, next_date FROM events '
+        'WHERE chat_id = ? AND next_date BETWEEN ? AND ? '
+        'AND (next_date, id) > (?, ?) ORDER BY next_date, id LIMIT ?',
+        (chat_id, start.isoformat(), end.isoformat(), *cursor, limit)
+    ).fetchall()
+
+
+def search_events(conn, chat_id, match_query, limit) -> list:
+    """Возвращает события чата, подходящие под запрос FTS5, ближайшие первыми.
+
+    Строки - поля EVENT_FIELDS и next_date.
+    """
+    return conn.execute(
+        f'SELECT {EVENT_FIELDS}, next_date FROM events '
+        'WHERE id IN (SELECT rowid FROM events_fts WHERE events_fts MATCH ?) '
+        'AND chat_id = ? ORDER BY next_date IS NULL, next_date, id LIMIT ?',
+        (match_query, chat_id, limit)
+    ).fetchall()
+
+
+def get_chat(conn, chat_id):
+    """Возвращает строку чата (chat_id, thread_id, timezone, send_time,
+    next_send_at) или None, если чат не зарегистрирован."""
+    return conn.execute(
+        'SELECT chat_id, thread_id, timezone, send_time, next_send_at '
+        'FROM chats WHERE chat_id = ?',
+        (chat_id,)
+    ).fetchone()
+
+
+def save_chat(conn, chat_id, thread_id, timezone, send_time, next_send_at):
+    """Добавляет чат или обновляет его настройки."""
+    conn.execute(
+        'INSERT INTO chats (chat_id, thread_id, timezone, send_time, '
+        'next_send_at) VALUES (?, ?, ?, ?, ?) '
+        'ON CONFLICT (chat_id) DO UPDATE SET thread_id = excluded.thread_id, '
+        'timezone = excluded.timezone, send_time = excluded.send_time, '
+        'next_send_at = excluded.next_send_at',
+        (chat_id, thread_id, timezone, send_time, next_send_at)
+    )
+    conn.commit()
+    for callback in _chats_listeners:
+        callback(chat_id)
+
+
+def get_due_chats(conn, now: int) -> list:
+    """Возвращает чаты, которым пора отправить рассылку (по индексу)."""
+    return conn.execute(
+        'SELECT chat_id, thread_id, timezone, send_time FROM chats '
+        'WHERE next_send_at <= ?',
+        (now,)
+    ).fetchall()
+
+
+def get_first_send_at(conn):
+    """Возвращает ближайший момент рассылки среди всех чатов (или None)."""
+    return conn.execute('SELECT MIN(next_send_at) FROM chats').fetchone()[0]
+
+
+def set_next_send_at(conn, updates):
+    """Сохраняет следующие моменты рассылки: пары (next_send_at, chat_id)."""
+    conn.executemany(
+        'UPDATE chats SET next_send_at = ? WHERE chat_id = ?', updates
+    )
+    conn.commit()
+
+
+def get_chats(conn) -> list:
+    """Возвращает все чаты: (chat_id, thread_id, timezone, send_time)."""
+    return conn.execute(
+        'SELECT chat_id, thread_id, timezone, send_time FROM chats'
+    ).fetchall()
+
+
+def get_digest(conn, chat_id, kind, period_start: date):
+    """Возвращает сводку (items, text, sent_at) или None."""
+    return conn.execute(
+        'SELECT items, text, sent_at FROM digests '
+        'WHERE chat_id = ? AND kind = ? AND period_start = ?',
+        (chat_id, kind, period_start.isoformat())
+    ).fetchone()
+
+
+def get_open_digests(conn, chat_ids=None) -> list:
+    """Возвращает неотправленные сводки всех или указанных чатов.
+
+    Строки - (chat_id, kind, period_start, period_end, items).
+    """
+    query = (
+        'SELECT chat_id, kind, period_start, period_end, items '
+        'FROM digests WHERE sent_at IS NULL'
+    )
+    if chat_ids is None:
+        return conn.execute(query).fetchall()
+    return _select_in(conn, f'{query} AND chat_id IN', chat_ids)
+
+
+def save_digests(conn, digests):
+    """Сохраняет сводки: строки (chat_id, kind, period_start, period_end,
+    items, text); sent_at существующих сводок не меняется."""
+    conn.executemany(
+        'INSERT INTO digests (chat_id, kind, period_start, period_end, '
+        'items, text) VALUES (?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT (chat_id, kind, period_start) DO UPDATE SET '
+        'period_end = excluded.period_end, items = excluded.items, '
+        'text = excluded.text',
+        digests
+    )
+    conn.commit()
+
+
+def set_digests_sent(conn, sent_at: int, digests):
+    """Отмечает сводки отправленными: строки (chat_id, kind, period_start)."""
+    conn.executemany(
+        'UPDATE digests SET sent_at = ? '
+        'WHERE chat_id = ? AND kind = ? AND period_start = ?',
+        [(sent_at, *digest) for digest in digests]
+    )
+    conn.commit()
+
+
+def delete_old_digests(conn, before: date) -> int:
+    """Удаляет сводки периодов, кончившихся до before."""
+    deleted = conn.execute(
+        'DELETE FROM digests WHERE period_end < ?', (before.isoformat(),)
+    ).rowcount
+    conn.commit()
+    return deleted
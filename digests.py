@@ -0,0 +1,214 @@
+"""Сводки событий за неделю (по понедельникам) и за месяц (1-го числа).
+
+Сводка чата на период считается один раз и заранее - когда начинается
+новый день и при запуске бота - и хранится в таблице «digests» вместе
+с готовым текстом. При изменении событий сводки не пересчитываются
+по всей таблице: из неотправленных сводок убираются строки изменённых
+событий и добавляются их новые даты в периоде. В день сводки её текст
+берётся из БД готовым и уходит вместе с ежедневной рассылкой чата.
+"""
+import json
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from constants import DAY_NAME, DIGEST_WEEK, DIGESTS, MAX_MESSAGE_LENGTH
+from database import (delete_old_digests, get_digest, get_events_before,
+                      get_events_with_chats, get_open_digests, save_digests)
+from function import StoredEvent
+from substitutions import get_declension
+
+
+def get_period(kind, day: date) -> tuple[date, date]:
+    """Возвращает начало и конец (не включительно) периода с днём day."""
+    if kind == DIGEST_WEEK:
+        start = day - timedelta(days=day.weekday())
+        return (start, start + timedelta(days=7))
+    start = day.replace(day=1)
+    return (start, (start + timedelta(days=32)).replace(day=1))
+
+
+def get_next_period(kind, day: date) -> tuple[date, date]:
+    """Возвращает ближайший период, начинающийся не раньше day."""
+    start, end = get_period(kind, day)
+    if start < day:
+        return get_period(kind, end)
+    return (start, end)
+
+
+def collect_items(events, start: date, end: date) -> list[list]:
+    """Возвращает строки сводки [дата, id события, текст] по порядку дат.
+
+    Текст - описание и число лет на дату события (StoredEvent.get_title).
+    """
+    items = [
+        [event_date.isoformat(), event.id, event.get_title(event_date.year)]
+        for event in events
+        for event_date in event.iter_occurrences(start, end)
+    ]
+    items.sort()
+    return items
+
+
+def _get_header(kind, start: date, end: date) -> str:
+    """Возвращает заголовок сводки."""
+    if kind == DIGEST_WEEK:
+        last = end - timedelta(days=1)
+        return (
+            f'События недели ({start.day} '
+            f'{get_declension(start.month, "а", "я")} - {last.day} '
+            f'{get_declension(last.month, "а", "я")}):'
+        )
+    return f'События в {get_declension(start.month, "е", "е")}:'
+
+
+def render_digest(kind, start: date, end: date, items) -> str:
+    """Возвращает текст сводки: события, сгруппированные по дням.
+
+    Текст не длиннее одного сообщения Telegram: не поместившиеся события
+    только считаются.
+    """
+    header = _get_header(kind, start, end)
+    if not items:
+        return f'{header}\nСобытий нет.'
+    lines = [header]
+    length = len(header)
+    current_day = None
+    for number, (day, _, title) in enumerate(items):
+        new_lines = []
+        if day != current_day:
+            event_date = date.fromisoformat(day)
+            new_lines += [
+                '',
+                f'{DAY_NAME[event_date.weekday()]}, {event_date.day} '
+                f'{get_declension(event_date.month, "а", "я")}:'
+            ]
+        new_lines.append(f'• {title}')
+        added = sum(len(line) + 1 for line in new_lines)
+        # Запас на строку «...и ещё N»:
+        if length + added > MAX_MESSAGE_LENGTH - 40:
+            lines.append(f'...и ещё {len(items) - number}')
+            break
+        current_day = day
+        lines += new_lines
+        length += added
+    return '\n'.join(lines)
+
+
+def build_digest(conn, chat_id, kind, start: date, end: date) -> tuple:
+    """Считает сводку чата за период (строку для save_digests).
+
+    Читаются только события с ближайшей датой до конца периода.
+    """
+    items = collect_items(
+        StoredEvent.from_rows(get_events_before(conn, chat_id, end)),
+        start,
+        end
+    )
+    return (
+        chat_id, kind, start.isoformat(), end.isoformat(),
+        json.dumps(items, ensure_ascii=False),
+        render_digest(kind, start, end, items)
+    )
+
+
+def prepare_digests(conn, chats, now: float, kinds=DIGESTS) -> int:
+    """Заранее считает ближайшие сводки чатов, которых ещё нет в БД.
+
+    chats - строки (chat_id, thread_id, timezone, ...). Сводки прошедших
+    периодов удаляются. Возвращает количество посчитанных сводок.
+    """
+    digests = []
+    oldest_today = None
+    for chat_id, _, timezone, *_ in chats:
+        today = datetime.fromtimestamp(now, ZoneInfo(timezone)).date()
+        oldest_today = min(oldest_today or today, today)
+        for kind in kinds:
+            start, end = get_next_period(kind, today)
+            if get_digest(conn, chat_id, kind, start) is None:
+                digests.append(build_digest(conn, chat_id, kind, start, end))
+    if digests:
+        save_digests(conn, digests)
+    if oldest_today is not None:
+        delete_old_digests(conn, oldest_today)
+    return len(digests)
+
+
+def patch_digests(conn, event_ids) -> int:
+    """Обновляет неотправленные сводки после изменения событий.
+
+    Пересчитываются только строки событий event_ids в сводках их чатов;
+    None - изменилось неизвестно что, и сводки считаются заново.
+    Возвращает количество изменившихся сводок.
+    """
+    if event_ids is None:
+        open_digests = get_open_digests(conn)
+        save_digests(conn, [
+            build_digest(
+                conn, chat_id, kind, date.fromisoformat(start),
+                date.fromisoformat(end)
+            )
+            for chat_id, kind, start, end, _ in open_digests
+        ])
+        return len(open_digests)
+
+    event_ids = set(event_ids)
+    events_by_chat = {}
+    for *row, chat_id in get_events_with_chats(conn, event_ids):
+        events_by_chat.setdefault(chat_id, []).append(
+            StoredEvent.from_row(row)
+        )
+    # Читаются только сводки чатов изменённых событий. Чат удалённого
+    # события неизвестен - тогда просматриваются сводки всех чатов.
+    found = sum(len(events) for events in events_by_chat.values())
+    open_digests = get_open_digests(
+        conn, events_by_chat if found == len(event_ids) else None
+    )
+    changed = []
+    for chat_id, kind, start, end, items_json in open_digests:
+        items = json.loads(items_json)
+        period = (date.fromisoformat(start), date.fromisoformat(end))
+        patched = [item for item in items if item[1] not in event_ids]
+        patched += collect_items(events_by_chat.get(chat_id, ()), *period)
+        patched.sort()
+        if patched != items:
+            changed.append((
+                chat_id, kind, start, end,
+                json.dumps(patched, ensure_ascii=False),
+                render_digest(kind, *period, patched)
+            ))
+    if changed:
+        save_digests(conn, changed)
+    return len(changed)
+
+
+def get_due_digests(conn, chats, now: float, kinds=DIGESTS) -> list:
+    """Возвращает сводки, которые чатам пора отправить сегодня.
+
+    chats - строки (chat_id, thread_id, timezone, ...). Строки результата -
+    (chat_id, thread_id, текст, (chat_id, kind, начало периода)), последнее
+    - для set_digests_sent. Уже отправленные сводки пропускаются,
+    не посчитанные заранее считаются здесь же.
+    """
+    due = []
+    missing = []
+    for chat_id, thread_id, timezone, *_ in chats:
+        today = datetime.fromtimestamp(now, ZoneInfo(timezone)).date()
+        for kind in kinds:
+            start, end = get_period(kind, today)
+            if start != today:
+                continue
+            digest = get_digest(conn, chat_id, kind, start)
+            if digest is None:
+                digest = build_digest(conn, chat_id, kind, start, end)
+                missing.append(digest)
+                text = digest[-1]
+            elif digest[2] is not None:
+                continue  # уже отправлена
+            else:
+                text = digest[1]
+            due.append(
+                (chat_id, thread_id, text, (chat_id, kind, start.isoformat()))
+            )
+    if missing:
+        save_digests(conn, missing)
+    return due
@@ -0,0 +1,261 @@
+"""Очередь входящих обновлений Telegram с пулом обработчиков.
+
+Обновления от polling или webhook не обрабатываются сразу, а попадают
+в ограниченную очередь. Несколько потоков-обработчиков разбирают её так,
+что обновления одного чата обрабатываются строго по очереди (ответы
+не перемешиваются), а разные чаты - параллельно. Когда очередь
+заполнена, приём новых обновлений ждёт (polling перестаёт забирать
+обновления у Telegram). Повторные нажатия той же кнопки, пока первое
+ещё ждёт обработки, отбрасываются. О каждом обработанном или
+отброшенном обновлении сообщает on_done (по нему опрос Telegram
+понимает, до какого обновления всё обработано).
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from telebot import TeleBot, apihelper
+from telebot.types import Update
+
+from configs import log_context
+from constants import DISPATCHER_QUEUE_SIZE, DISPATCHER_WORKERS
+from metrics import metrics
+
+
+def get_chat_key(update):
+    """Возвращает ключ очереди обновления: id чата или пользователя."""
+    message = (
+        update.message or update.edited_message or update.channel_post
+    )
+    if message is not None:
+        return message.chat.id
+    callback_query = update.callback_query
+    if callback_query is not None:
+        if callback_query.message is not None:
+            return callback_query.message.chat.id
+        return callback_query.from_user.id
+    if update.inline_query is not None:
+        return update.inline_query.from_user.id
+    return ('update', update.update_id)  # без чата - своя очередь
+
+
+def get_callback_key(update):
+    """Возвращает ключ нажатия кнопки (None - обновление не нажатие)."""
+    callback_query = update.callback_query
+    if callback_query is None:
+        return None
+    if callback_query.message is not None:
+        return (
+            callback_query.message.chat.id,
+            callback_query.message.message_id,
+            callback_query.data
+        )
+    return (
+        callback_query.from_user.id,
+        callback_query.inline_message_id,
+        callback_query.data
+    )
+
+
+class UpdateDispatcher:
+    """Ограниченная очередь обновлений с FIFO по чатам и пулом потоков.
+
+    process(update) вызывается в потоке-обработчике. Очереди ведутся
+    по чатам; чат, чьё обновление сейчас обрабатывается, не попадает
+    к другим потокам, пока обработка не закончится. on_done(update)
+    вызывается после обработки или отбрасывания обновления.
+    """
+
+    def __init__(self, process, workers=DISPATCHER_WORKERS,
+                 max_size=DISPATCHER_QUEUE_SIZE, on_done=None):
+        """Инициализатор (потоки запускаются при первом обновлении)."""
+        self.process = process
+        self.on_done = on_done
+        self.workers = workers
+        self.max_size = max_size
+        self._queues = {}
+        self._ready = deque()
+        self._callbacks = set()
+        self._size = 0
+        self._condition = threading.Condition()
+        self._threads = []
+        self._running = True
+        self.processed = 0
+        self.dropped = 0
+
+    def submit(self, update, timeout=None) -> bool:
+        """Ставит обновление в очередь, ожидая места не дольше timeout.
+
+        Возвращает False, если обновление отброшено (повторное нажатие
+        или очередь так и не освободилась).
+        """
+        chat_key = get_chat_key(update)
+        callback_key = get_callback_key(update)
+        with self._condition:
+            if callback_key is not None and callback_key in self._callbacks:
+                self.dropped += 1
+                metrics.increment('dispatcher_dropped', 'duplicate_callback')
+                dropped = True
+            elif not self._condition.wait_for(
+                lambda: self._size < self.max_size, timeout
+            ):
+                self.dropped += 1
+                metrics.increment('dispatcher_dropped', 'queue_full')
+                dropped = True
+            else:
+                dropped = False
+                self._put(chat_key, callback_key, update)
+        if dropped:
+            self._notify_done(update)
+        return not dropped
+
+    def _put(self, chat_key, callback_key, update):
+        """Добавляет обновление в очередь чата (под блокировкой)."""
+        queue = self._queues.get(chat_key)
+        if queue is None:
+            queue = self._queues[chat_key] = deque()
+            self._ready.append(chat_key)
+        queue.append((update, callback_key, time.perf_counter()))
+        if callback_key is not None:
+            self._callbacks.add(callback_key)
+        self._size += 1
+        metrics.set_gauge('dispatcher_queue_depth', 'updates', self._size)
+        self._condition.notify_all()
+        self._start()
+
+    def _notify_done(self, update):
+        """Сообщает on_done, что обновление обработано или отброшено."""
+        if self.on_done is None:
+            return
+        try:
+            self.on_done(update)
+        except Exception as e:
+            logging.error(f'Ошибка on_done: {e}')
+
+    def _start(self):
+        """Запускает потоки-обработчики (вызывается под блокировкой)."""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _take_next(self):
+        """Ждёт чат с обновлениями и забирает его первое обновление."""
+        with self._condition:
+            while not self._ready:
+                if not self._running:
+                    return None
+                self._condition.wait()
+            chat_key = self._ready.popleft()
+            update, callback_key, queued_at = self._queues[chat_key].popleft()
+            self._callbacks.discard(callback_key)
+            self._size -= 1
+            metrics.set_gauge('dispatcher_queue_depth', 'updates', self._size)
+            self._condition.notify_all()  # место в очереди освободилось
+        metrics.observe(
+            'dispatcher_wait_seconds', 'update',
+            time.perf_counter() - queued_at
+        )
+        return (chat_key, update)
+
+    def _finish(self, chat_key):
+        """Возвращает чат в очередь готовых или убирает опустевший."""
+        with self._condition:
+            self.processed += 1
+            if self._queues[chat_key]:
+                self._ready.append(chat_key)
+            else:
+                del self._queues[chat_key]
+            self._condition.notify_all()
+
+    def _run(self):
+        """Поток-обработчик."""
+        while True:
+            taken = self._take_next()
+            if taken is None:
+                return
+            chat_key, update = taken
+            try:
+                # Записи лога обработки помечаются обновлением и чатом:
+                with log_context(
+                    request_id=update.update_id,
+                    chat_id=chat_key if isinstance(chat_key, int) else None
+                ):
+                    self.process(update)
+            except Exception as e:
+                logging.error(f'Ошибка обработки обновления: {e}')
+            finally:
+                self._notify_done(update)
+                self._finish(chat_key)
+
+    def get_stats(self) -> dict:
+        """Возвращает счётчики очереди."""
+        with self._condition:
+            return {
+                'queued': self._size,
+                'chats': len(self._queues),
+                'processed': self.processed,
+                'dropped': self.dropped,
+            }
+
+    def wait_idle(self, timeout=None) -> bool:
+        """Ждёт, пока все обновления будут обработаны."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._queues, timeout
+            )
+
+    def stop(self, timeout=None):
+        """Останавливает потоки, дождавшись обработки очереди."""
+        self.wait_idle(timeout)
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+class DispatchingTeleBot(TeleBot):
+    """TeleBot, передающий обновления обработчикам через UpdateDispatcher.
+
+    Все способы получения обновлений (polling, webhook) вызывают
+    process_new_updates, поэтому очередь стоит перед любым из них.
+    """
+
+    def __init__(self, token, workers=DISPATCHER_WORKERS,
+                 max_size=DISPATCHER_QUEUE_SIZE, **kwargs):
+        """Инициализатор; обработчики вызываются в потоках очереди."""
+        super().__init__(token, threaded=False, **kwargs)
+        self.dispatcher = UpdateDispatcher(
+            self._process_update, workers, max_size
+        )
+        # Запись полученных обновлений (loadtest.UpdateRecorder):
+        self.recorder = None
+
+    def get_updates(self, offset=None, limit=None, timeout=20,
+                    allowed_updates=None, long_polling_timeout=20):
+        """Получает обновления (как TeleBot) и записывает их JSON."""
+        json_updates = apihelper.get_updates(
+            self.token, offset=offset, limit=limit, timeout=timeout,
+            allowed_updates=allowed_updates,
+            long_polling_timeout=long_polling_timeout
+        )
+        if self.recorder is not None:
+            self.recorder.record(json_updates)
+        updates = []
+        for json_update in json_updates:
+            update = Update.de_json(json_update)
+            # JSON хранится, пока обновление не обработано (UpdateOffsets):
+            update.json = json_update
+            updates.append(update)
+        return updates
+
+    def _process_update(self, update):
+        """Передаёт обновление обработчикам (в потоке очереди)."""
+        super().process_new_updates([update])
+
+    def process_new_updates(self, updates):
+        """Ставит обновления в очередь (ждёт места, если она полна)."""
+        for update in updates:
+            self.dispatcher.submit(update)
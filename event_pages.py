@@ -0,0 +1,106 @@
+"""Постраничные списки событий: /upcoming [дней] и /month [ММ].
+
+Данные кнопок листания (callback_data) содержат вид списка, его период
+и ключ (next_date, id) последней показанной строки, поэтому следующая
+страница читается из БД одним запросом по индексу без пересчёта списка.
+"""
+import calendar
+from datetime import date, timedelta
+
+from constants import MAX_UPCOMING_DAYS, PAGE_SIZE, UPCOMING_DAYS
+from database import get_events_page
+from function import StoredEvent
+from substitutions import get_declension
+
+PAGE_CALLBACK_PREFIX = 'page'
+VIEW_UPCOMING = 'u'
+VIEW_MONTH = 'm'
+_DATE_FORMAT = '%Y%m%d'
+
+
+def get_upcoming_period(today: date, days=None) -> tuple[date, date]:
+    """Возвращает период /upcoming: сегодня и ещё days - 1 дней."""
+    days = min(max(int(days or UPCOMING_DAYS), 1), MAX_UPCOMING_DAYS)
+    return (today, today + timedelta(days=days - 1))
+
+
+def get_month_period(today: date, month=None) -> tuple[date, date]:
+    """Возвращает период /month: оставшиеся дни ближайшего месяца ММ."""
+    month = int(month or today.month)
+    if not 1 <= month <= 12:
+        raise ValueError(f'Месяца {month} нет.')
+    year = today.year if month >= today.month else today.year + 1
+    start = max(date(year, month, 1), today)
+    return (start, date(year, month, calendar.monthrange(year, month)[1]))
+
+
+def make_page_callback(view, start: date, end: date, cursor=None) -> str:
+    """Собирает callback_data кнопки листания (не длиннее 64 байт)."""
+    next_date, event_id = cursor or ('', 0)
+    return ':'.join((
+        PAGE_CALLBACK_PREFIX,
+        view,
+        start.strftime(_DATE_FORMAT),
+        end.strftime(_DATE_FORMAT),
+        next_date.replace('-', ''),
+        str(event_id)
+    ))
+
+
+def parse_page_callback(data):
+    """Разбирает callback_data кнопки листания."""
+    _, view, start, end, next_date, event_id = data.split(':')
+    cursor = None
+    if next_date:
+        cursor = (
+            f'{next_date[:4]}-{next_date[4:6]}-{next_date[6:]}', int(event_id)
+        )
+    return (
+        view,
+        date(int(start[:4]), int(start[4:6]), int(start[6:])),
+        date(int(end[:4]), int(end[4:6]), int(end[6:])),
+        cursor
+    )
+
+
+def _get_title(view, start: date, end: date) -> str:
+    """Возвращает заголовок списка."""
+    if view == VIEW_MONTH:
+        return f'События в {get_declension(start.month, "е", "е")}:'
+    return f'События до {end:%d.%m.%Y}:'
+
+
+def render_page(
+    conn, chat_id, view, start: date, end: date, cursor=None
+):
+    """Возвращает текст страницы событий чата и клавиатуру листания."""
+    # telebot импортируется при первом списке, а не при запуске:
+    from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+    rows = get_events_page(conn, chat_id, start, end, cursor, PAGE_SIZE + 1)
+    has_next_page = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+    if not rows:
+        return ('Событий нет.', None)
+
+    lines = [
+        StoredEvent.from_row(row[:-1]).as_view(date.fromisoformat(row[-1]))
+        for row in rows
+    ]
+    text = '\n'.join([_get_title(view, start, end), *lines])
+
+    buttons = []
+    if cursor:
+        buttons.append(InlineKeyboardButton(
+            '« В начало',
+            callback_data=make_page_callback(view, start, end)
+        ))
+    if has_next_page:
+        last_row = rows[-1]
+        buttons.append(InlineKeyboardButton(
+            'Далее »',
+            callback_data=make_page_callback(
+                view, start, end, (last_row[-1], last_row[0])
+            )
+        ))
+    return (text, InlineKeyboardMarkup([buttons]) if buttons else None)
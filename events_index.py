@@ -0,0 +1,200 @@
+import calendar
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import date
+from itertools import accumulate
+
+from constants import CHAT_INDEX_CACHE_SIZE, MDAYS
+from database import EVENT_FIELDS, connect, get_events_version
+from function import StoredEvent
+from special_dates import parse_special_rows, resolve_special_dates
+
+
+# Индекс строится по дням високосного года (0-365), чтобы у 29.02 было
+# своё место. Порядок ячеек совпадает с порядком дат внутри любого года.
+_MONTH_OFFSET = list(accumulate([0, 0, 31, 29] + MDAYS[3:12]))
+_SLOT_TO_DAY_AND_MONTH = [
+    (day, month)
+    for month in range(1, 13)
+    for day in range(1, (29 if month == 2 else MDAYS[month]) + 1)
+]
+_LEAP_DAY_SLOT = _MONTH_OFFSET[2] + 28
+# Сколько лет вперёд искать даты: наибольший промежуток между
+# високосными годами (2096 -> 2104).
+_MAX_YEARS_AHEAD = 8
+
+
+def get_slot(day: int, month: int) -> int:
+    """Возвращает номер ячейки индекса (0-365) для дня и месяца."""
+    return _MONTH_OFFSET[month] + day - 1
+
+
+class DayBuckets:
+    """События одного чата, разложенные по 366 ячейкам дней года.
+
+    Обычные события повторяются в тот же день каждый год и лежат в ячейках
+    по дате ДДММ. События с особыми правилами (N-й день недели месяца)
+    каждый год выпадают на разные дни, поэтому их ячейки считаются
+    отдельно для каждого года, который понадобился (special_dates).
+    """
+
+    __slots__ = ('buckets', 'filled_slots', '_special_rules',
+                 '_special_events', '_special_years')
+
+    def __init__(self, rows):
+        """Раскладывает строки (поля EVENT_FIELDS) по ячейкам."""
+        buckets = {}
+        special_rows = []
+        events = {}
+        for row in rows:
+            event = StoredEvent.from_row(row)
+            if event.special_rule:
+                special_rows.append(row)
+                events[event.id] = event
+            else:
+                buckets.setdefault(
+                    get_slot(event.day, event.month), []
+                ).append(event)
+        rules = parse_special_rows(special_rows)
+        resolved_ids = set(rules.ids)
+        # Правило, которое не удалось разобрать, - по дате ДДММ:
+        for event_id, event in events.items():
+            if event_id not in resolved_ids:
+                buckets.setdefault(
+                    get_slot(event.day, event.month), []
+                ).append(event)
+        self.buckets = buckets
+        self.filled_slots = sorted(buckets)
+        self._special_rules = rules
+        self._special_events = [events[event_id] for event_id in rules.ids]
+        self._special_years = {}
+
+    def _get_special_buckets(self, year) -> dict:
+        """Возвращает ячейки событий с особыми правилами в году year."""
+        buckets = self._special_years.get(year)
+        if buckets is not None:
+            return buckets
+        buckets = {}
+        if self._special_events:
+            resolved = resolve_special_dates(self._special_rules, (year,))
+            for event, (ordinal,) in zip(self._special_events, resolved):
+                event_date = date.fromordinal(int(ordinal))
+                buckets.setdefault(
+                    get_slot(event_date.day, event_date.month), []
+                ).append(event)
+        self._special_years[year] = buckets
+        return buckets
+
+    def iter_dates(self, today: date):
+        """Перебирает непустые ячейки по порядку, начиная с сегодняшней.
+
+        Возвращает пары (количество дней до даты, события StoredEvent).
+        Годы перебираются подряд, пока не пройдёт _MAX_YEARS_AHEAD лет -
+        так находится и 29 февраля, до которого бывает до 8 лет.
+        """
+        if not self.filled_slots and not self._special_events:
+            return
+        today_slot = get_slot(today.day, today.month)
+        for year in range(today.year, today.year + _MAX_YEARS_AHEAD + 1):
+            special_buckets = self._get_special_buckets(year)
+            slots = self.filled_slots
+            if special_buckets:
+                slots = sorted(set(slots).union(special_buckets))
+            start = bisect_left(slots, today_slot) if year == today.year else 0
+            for slot in slots[start:]:
+                if slot == _LEAP_DAY_SLOT and not calendar.isleap(year):
+                    continue  # 29 февраля в невисокосный год не наступает.
+                day, month = _SLOT_TO_DAY_AND_MONTH[slot]
+                yield (
+                    (date(year, month, day) - today).days,
+                    self.buckets.get(slot, []) + special_buckets.get(slot, [])
+                )
+
+
+class EventsIndex:
+    """Индекс событий из БД, разложенных по дням года.
+
+    Строки таблицы «events» каждого чата хранятся в 366 ячейках (по одной
+    на каждый день високосного года), дополнительно хранится отсортированный
+    список непустых ячеек. Поиск ближайшей даты и событий на N дней вперёд
+    не зависит от размера таблицы. Индексы строятся для чатов по запросу
+    (не больше CHAT_INDEX_CACHE_SIZE последних) и сбрасываются только когда
+    таблица событий изменилась: в любом процессе (версия «events», её
+    ведут триггеры) или в этом (счётчик изменений, см. invalidate).
+    Записи в другие таблицы БД индексы не сбрасывают.
+    """
+
+    def __init__(self, db_path, cache_size=CHAT_INDEX_CACHE_SIZE):
+        """Инициализатор пустого индекса."""
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self._conn = None
+        self._lock = threading.Lock()
+        self._changes = 0
+        self._version = None
+        self._chats = OrderedDict()
+
+    def invalidate(self):
+        """Отмечает, что таблица была изменена в этом процессе."""
+        with self._lock:
+            self._changes += 1
+
+    def _get_version(self) -> tuple[int, int]:
+        """Возвращает текущую версию таблицы событий."""
+        if self._conn is None:
+            self._conn = connect(self.db_path)
+        return (get_events_version(self._conn), self._changes)
+
+    def refresh(self):
+        """Сбрасывает индексы чатов, если таблица изменилась."""
+        with self._lock:
+            version = self._get_version()
+            if version != self._version:
+                self._chats.clear()
+                self._version = version
+
+    def get_version(self) -> tuple[int, int]:
+        """Возвращает версию данных, по которой построен индекс."""
+        self.refresh()
+        return self._version
+
+    def _get_buckets(self, chat_id) -> DayBuckets:
+        """Возвращает индекс чата (None - все события), строит при нехватке."""
+        self.refresh()
+        with self._lock:
+            day_buckets = self._chats.get(chat_id)
+            if day_buckets is not None:
+                self._chats.move_to_end(chat_id)
+                return day_buckets
+            query = f'SELECT {EVENT_FIELDS} FROM events'
+            if chat_id is None:
+                rows = self._conn.execute(query)
+            else:
+                rows = self._conn.execute(
+                    f'{query} WHERE chat_id = ?', (chat_id,)
+                )
+            day_buckets = self._chats[chat_id] = DayBuckets(rows)
+            if len(self._chats) > self.cache_size:
+                self._chats.popitem(last=False)
+            return day_buckets
+
+    def get_nearest(self, today: date, chat_id=None) -> tuple[int, list]:
+        """Возвращает ближайшие события чата и оставшиеся до них дни."""
+        for days_delta, events in self._get_buckets(chat_id).iter_dates(today):
+            return (days_delta, list(events))
+        return (float('inf'), [])
+
+    def get_upcoming(
+        self, today: date, days: int, chat_id=None
+    ) -> list[tuple[int, list]]:
+        """Возвращает события на «days» дней вперёд, сгруппированные по дням.
+
+        Сегодняшний день входит в выборку.
+        """
+        upcoming = []
+        for days_delta, events in self._get_buckets(chat_id).iter_dates(today):
+            if days_delta >= days:
+                break
+            upcoming.append((days_delta, list(events)))
+        return upcoming
@@ -0,0 +1,228 @@
+"""Массовая загрузка и выгрузка событий (CSV и JSONL) потоком.
+
+Файл читается и пишется построчно, поэтому память не зависит от его
+размера. Строки с ошибками не прерывают загрузку, а попадают в отчёт.
+
+Запуск:
+    python events_io.py import events.csv [--db events.db] [--chat ID]
+    python events_io.py export events.jsonl [--db events.db] [--chat ID]
+
+По умолчанию используется чат TG_GROUP_ID (переменная окружения или .env),
+а если она не задана - события загружаются без чата и выгружаются все.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from datetime import date
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from constants import DB_PATH, IMPORT_CHUNK_SIZE, IMPORT_MAX_ERRORS
+from database import connect, create_tables, update_next_dates
+from function import parse_event_date
+
+# Поля файла (и таблицы «events», кроме id, next_date и chat_id):
+FIELDS = ('day_and_month', 'description', 'year', 'special_rule',
+          'week_number')
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+FORMAT_BY_SUFFIX = {
+    '.csv': FORMAT_CSV,
+    '.jsonl': FORMAT_JSONL,
+    '.ndjson': FORMAT_JSONL,
+    '.json': FORMAT_JSONL,
+}
+_TRUE_VALUES = {'1', 'true', 'да', 'yes'}
+
+INSERT_EVENT = (
+    f'INSERT INTO events ({", ".join(FIELDS)}, chat_id) '
+    'VALUES (?, ?, ?, ?, ?, ?)'
+)
+
+
+class ImportReport:
+    """Итог загрузки: сколько строк загружено и ошибки по номерам строк."""
+
+    def __init__(self):
+        """Инициализатор пустого отчёта."""
+        self.imported = 0
+        self.errors_count = 0
+        self.errors = []  # не больше IMPORT_MAX_ERRORS первых ошибок
+
+    def add_error(self, line_number, error):
+        """Добавляет ошибку строки в отчёт."""
+        self.errors_count += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append((line_number, str(error)))
+
+    def as_text(self) -> str:
+        """Отчёт для пользователя."""
+        lines = [
+            f'Загружено событий: {self.imported}. '
+            f'Строк с ошибками: {self.errors_count}.'
+        ]
+        lines += [f'Строка {number}: {error}' for number, error in self.errors]
+        if self.errors_count > len(self.errors):
+            lines.append('...')
+        return '\n'.join(lines)
+
+
+def get_format(filename) -> str:
+    """Определяет формат файла по расширению."""
+    file_format = FORMAT_BY_SUFFIX.get(Path(filename).suffix.lower())
+    if file_format is None:
+        raise ValueError('Нужен файл .csv или .jsonl.')
+    return file_format
+
+
+def read_records(lines, file_format):
+    """Построчно читает файл, возвращает пары (номер строки, запись).
+
+    Запись - словарь полей; строка JSONL, которую не удалось разобрать,
+    возвращается как есть (ошибка попадёт в отчёт при проверке).
+    """
+    if file_format == FORMAT_CSV:
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield (reader.line_num, record)
+        return
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield (line_number, json.loads(line))
+        except ValueError:
+            yield (line_number, line)
+
+
+def _parse_special_rule(value) -> int:
+    """Приводит признак особых правил к 0/1."""
+    if isinstance(value, str):
+        return int(value.strip().lower() in _TRUE_VALUES)
+    return int(bool(value))
+
+
+def prepare_row(record, today_year) -> tuple:
+    """Проверяет запись и возвращает строку для вставки в «events».
+
+    Проверка даты та же, что в Event (parse_event_date), но без создания
+    объекта. Если год не указан - подставляется today_year.
+    """
+    if not isinstance(record, dict):
+        raise ValueError('Строку не удалось разобрать.')
+    description = str(record.get('description') or '').strip()
+    if not description:
+        raise ValueError('Не указано описание события.')
+    day, month, year = parse_event_date(
+        str(record.get('day_and_month') or '').strip(),
+        str(record.get('year') or today_year).strip()
+    )
+    week_number = record.get('week_number') or None
+    if week_number is not None:
+        week_number = int(week_number)
+        if not 1 <= week_number <= 6:
+            raise ValueError(f'Недели {week_number} в месяце нет.')
+    return (
+        f'{day:02d}{month:02d}',
+        description,
+        year,
+        _parse_special_rule(record.get('special_rule')),
+        week_number
+    )
+
+
+def import_events(
+    conn, records, chat_id=None, chunk_size=IMPORT_CHUNK_SIZE
+) -> ImportReport:
+    """Загружает записи в «events» чата одной транзакцией, пачками executemany.
+
+    Ближайшие даты новых событий заполняет update_next_dates (вызывающий).
+    """
+    report = ImportReport()
+    today_year = date.today().year
+    chunk = []
+    with conn:  # commit в конце, rollback при сбое БД
+        for line_number, record in records:
+            try:
+                chunk.append((*prepare_row(record, today_year), chat_id))
+            except ValueError as e:
+                report.add_error(line_number, e)
+                continue
+            if len(chunk) >= chunk_size:
+                conn.executemany(INSERT_EVENT, chunk)
+                report.imported += len(chunk)
+                chunk.clear()
+        if chunk:
+            conn.executemany(INSERT_EVENT, chunk)
+            report.imported += len(chunk)
+    return report
+
+
+def export_events(conn, file_format, chat_id=None):
+    """Построчно выгружает события в CSV или JSONL (генератор строк).
+
+    Если chat_id указан - только события этого чата.
+    """
+    query = f'SELECT {", ".join(FIELDS)} FROM events'
+    if chat_id is None:
+        cursor = conn.execute(f'{query} ORDER BY id')
+    else:
+        cursor = conn.execute(
+            f'{query} WHERE chat_id = ? ORDER BY id', (chat_id,)
+        )
+    if file_format == FORMAT_JSONL:
+        for row in cursor:
+            yield json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for row in cursor:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def main():
+    """Запуск из командной строки."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Загрузка/выгрузка событий.')
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('path', help='файл .csv или .jsonl («-» - консоль)')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--format', choices=(FORMAT_CSV, FORMAT_JSONL))
+    parser.add_argument(
+        '--chat', type=int, default=os.getenv('TG_GROUP_ID'),
+        help='id чата событий'
+    )
+    args = parser.parse_args()
+    file_format = args.format or get_format(args.path)
+
+    conn = connect(args.db)
+    if args.command == 'import':
+        create_tables(conn)
+        with (
+            sys.stdin if args.path == '-'
+            else open(args.path, encoding='utf-8-sig', newline='')
+        ) as lines:
+            report = import_events(
+                conn, read_records(lines, file_format), args.chat
+            )
+        update_next_dates(conn, date.today())
+        print(report.as_text())
+    else:
+        with (
+            sys.stdout if args.path == '-'
+            else open(args.path, 'w', encoding='utf-8', newline='')
+        ) as output:
+            output.writelines(export_events(conn, file_format, args.chat))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,179 @@
 import calendar
+import itertools
 import logging
 import re
 from datetime import date
-from typing import Union
+from typing import Iterator, NamedTuple, Optional, Union
 
 from constants import DAY_NAME, MAX_YEAR, MDAYS, MIN_YEAR
 from substitutions import get_declension, get_full_value_declension
 
 
+# Дата события вида ДДММ:
+DAY_AND_MONTH_PATTERN = re.compile(r'^(\d{2})(\d{2})$')
+
+
+def parse_event_date(day_and_month, year) -> tuple[int, int, int]:
+    """Проверяет дату ДДММ и год события, возвращает (день, месяц, год).
+
+    Используется в Event и при массовой загрузке событий (без создания
+    объектов). Год должен быть указан.
+    """
+    pair = DAY_AND_MONTH_PATTERN.match(str(day_and_month))
+    if not pair:
+        raise ValueError(
+            f'Указано некорректное значение «{day_and_month}». '
+            f'Нужно 4 цифры вида ДДММ.'
+        )
+    day, month = int(pair[1]), int(pair[2])
+
+    if not (1 <= month <= 12):
+        raise ValueError(f'Месяца {month} нет.')
+
+    if str(year).isdigit():
+        if not MIN_YEAR <= int(year) <= MAX_YEAR:
+            raise ValueError(
+                f'Год {year} не подходит. '
+                f'Диапазон {MIN_YEAR}-{MAX_YEAR}.'
+            )
+    else:
+        raise ValueError(f'Неверный формат года ({year})?')
+    year = int(year)
+
+    # Проверка, что указанный день есть в указанном месяце/годе:
+    added_day = 1 if calendar.isleap(year) and month == 2 else 0
+    if not (day <= MDAYS[month] + added_day):
+        raise ValueError(
+            f'В {get_declension(month, "е", "е")} {year} года только '
+            f'{get_full_value_declension(MDAYS[month] + added_day, "days")}'
+        )
+    return (day, month, year)
+
+
+def get_nth_weekday(year, month, weekday, week_number=None) -> int:
+    """Возвращает число месяца, на которое выпадает N-й день недели.
+
+    Если week_number не указан или не входит в диапазон 1-4 - возвращается
+    последний такой день недели в месяце.
+    """
+    first_weekday, days_in_month = calendar.monthrange(year, month)
+    first_day = (weekday - first_weekday) % 7 + 1
+    if week_number and 1 <= int(week_number) <= 4:
+        return first_day + 7 * (int(week_number) - 1)
+    return first_day + 7 * ((days_in_month - first_day) // 7)
+
+
+class StoredEvent(NamedTuple):
+    """Событие, прочитанное из БД: неизменяемый кортеж без проверок.
+
+    Дата проверяется при записи (Event, events_io.prepare_row), поэтому
+    строка БД превращается в событие без регулярных выражений и
+    предупреждений. В отличие от Event нет __dict__ и исходных строк
+    полей - только разобранные значения.
+    """
+
+    id: Optional[int]
+    day: int
+    month: int
+    year: Optional[int]
+    description: str
+    special_rule: bool
+    week_number: Optional[int]
+
+    @classmethod
+    def from_row(cls, row) -> 'StoredEvent':
+        """Строит событие из строки БД (поля EVENT_FIELDS)."""
+        event_id, day_and_month, description, year, special_rule, week = row
+        return cls(
+            event_id,
+            int(day_and_month[:2]),
+            int(day_and_month[2:]),
+            year,
+            description,
+            bool(special_rule),
+            week
+        )
+
+    @classmethod
+    def from_rows(cls, rows) -> list['StoredEvent']:
+        """Строит события из строк БД (например, из курсора) разом."""
+        return list(map(cls.from_row, rows))
+
+    def as_view(self, event_date: Optional[date] = None) -> str:
+        """Отображение события вида «1 января - день Х (N лет)».
+
+        Если указан год - то считается количество прошедших лет.
+        Если указана event_date (ближайшая дата события) - выводится она,
+        а годы считаются на эту дату.
+        """
+        if event_date is None:
+            day, month = self.day, self.month
+            year = date.today().year
+        else:
+            day, month = event_date.day, event_date.month
+            year = event_date.year
+        return (
+            f'{day} {get_declension(month, "а", "я")} - '
+            f'{self.get_title(year)}'
+        )
+
+    def get_title(self, year: int) -> str:
+        """Описание события с числом лет на указанный год: «день Х (N лет)».
+
+        Без года события - только описание.
+        """
+        if self.year:
+            return (
+                f'{self.description} '
+                f'({get_full_value_declension(year - self.year, "years")})'
+            )
+        return self.description
+
+    def get_date_in_year(self, year: int) -> Optional[date]:
+        """Возвращает дату события в указанном году.
+
+        Для событий с особыми правилами день подбирается по дню недели
+        исходной даты. Для 29 февраля в невисокосный год возвращается None.
+        """
+        if self.special_rule:
+            weekday = date(
+                self.year or date.today().year, self.month, self.day
+            ).weekday()
+            day = get_nth_weekday(year, self.month, weekday, self.week_number)
+            return date(year, self.month, day)
+        if self.day > MDAYS[self.month] and not calendar.isleap(year):
+            return None
+        return date(year, self.month, self.day)
+
+    def get_next_date(self, today: Optional[date] = None) -> date:
+        """Возвращает ближайшую (начиная с сегодня) дату события."""
+        today = today or date.today()
+        year = today.year
+        while True:
+            event_date = self.get_date_in_year(year)
+            if event_date and event_date >= today:
+                return event_date
+            year += 1
+
+    def iter_occurrences(
+            self, start: Optional[date] = None, end: Optional[date] = None
+    ) -> Iterator[date]:
+        """Лениво перебирает даты события от start (включительно).
+
+        По умолчанию start - сегодня; end (не включительно) не указан -
+        перебор бесконечный. 29 февраля бывает только в високосные годы,
+        особые правила - N-й или последний день недели месяца.
+        """
+        start = start or date.today()
+        for year in itertools.count(start.year):
+            event_date = self.get_date_in_year(year)
+            if event_date is None or event_date < start:
+                continue
+            if end is not None and event_date >= end:
+                return
+            yield event_date
+
+
 class Event:
     """Событие для отслеживания.
 
@@ -44,50 +210,17 @@ class Event:
 
     def _validate_date(self):
         """Проверяет в полях «day_and_month» и «year» вводимую информацию."""
-        pattern = r'^(\d{2})(\d{2})$'
-        pair = re.match(pattern, str(self.day_and_month))
-        if not pair:
-            raise ValueError(
-                f'Указано некорректное значение «{self.day_and_month}». '
-                f'Нужно 4 цифры вида ДДММ.'
-            )
-        day, month = [int(x) for x in pair.groups()]
-
-        if not (1 <= month <= 12):
-            raise ValueError(f'Месяца {month} нет.')
-
         # В случае, если год не указывается - подставляется текущий год:
         if not self.year:
             today_year = date.today().year
             self.year = today_year
             logging.warning(
-                f'Год не был указан, будет установлен {today_year} год.'
+                'Год не был указан, будет установлен %s год.', today_year
             )
 
-        if str(self.year).isdigit():
-            if not MIN_YEAR <= int(self.year) <= MAX_YEAR:
-                raise ValueError(
-                    f'Год {self.year} не подходит. '
-                    f'Диапазон {MIN_YEAR}-{MAX_YEAR}.'
-                )
-        else:
-            raise ValueError(f'Неверный формат года ({self.year})?')
-        self._year = int(self.year)
-
-        # Проверка, что указанный день есть в указанном месяце/годе:
-        if not (day <= MDAYS[month]):
-            add_year = ''  # Заглушка на случай, когда год не указан.
-            added_day = 0
-            if self.year:
-                add_year = f'{self.year} года '
-                if calendar.isleap(int(self.year)) and month == 2:
-                    added_day = 1
-            raise ValueError(
-                f'В {get_declension(month, "е", "е")} {add_year}только '
-                f'{get_full_value_declension(MDAYS[month] + added_day, "days")}'
-            )
-        self._day = day
-        self._month = month
+        self._day, self._month, self._year = parse_event_date(
+            self.day_and_month, self.year
+        )
         return self
 
     def _year_in_data(self) -> bool:
@@ -116,19 +249,38 @@ class Event:
         """Возвращает кортеж вида ГГГГ ММ ДД."""
         return (self._year, self._month, self._day)
 
-    def as_view(self) -> str:
-        """Отображение события вида «1 января 2025г. - день Х».
+    def as_stored(self, event_id=None) -> StoredEvent:
+        """Возвращает проверенное событие в виде StoredEvent."""
+        return StoredEvent(
+            event_id,
+            self._day,
+            self._month,
+            self._year,
+            self.description,
+            bool(self.special_rule),
+            self.week_number
+        )
 
-        Если указан год - то считается количество прошедших лет.
+    def as_view(self, event_date: Optional[date] = None) -> str:
+        """Отображение события вида «1 января - день Х (N лет)».
+
+        См. StoredEvent.as_view.
         """
-        data = f'{self._day} {get_declension(self._month, "а", "я")}'
-        if self._year_in_data():
-            year_pass = date.today().year - self._year  # прошло лет
-            return (
-                f'{data} - {self.description} '
-                f'({get_full_value_declension(year_pass, "year")})'
-            )
-        return f'{data} - {self.description}'
+        return self.as_stored().as_view(event_date)
+
+    def get_date_in_year(self, year: int) -> Optional[date]:
+        """Возвращает дату события в указанном году (None для 29.02)."""
+        return self.as_stored().get_date_in_year(year)
+
+    def get_next_date(self, today: Optional[date] = None) -> date:
+        """Возвращает ближайшую (начиная с сегодня) дату события."""
+        return self.as_stored().get_next_date(today)
+
+    def iter_occurrences(
+            self, start: Optional[date] = None, end: Optional[date] = None
+    ) -> Iterator[date]:
+        """Лениво перебирает даты события (см. StoredEvent)."""
+        return self.as_stored().iter_occurrences(start, end)
 
     # def __str__(self):
     #     return f'{date(self.year, r'self.day_and_month')
@@ -167,54 +319,34 @@ class Event:
         }
 
     def _create_rules_for_events_with_special_params(self, last_week=False):
-        """Создает для события со специальными параметрами новую запись."""
-        if date.today().year == int(self.year):  # текущий год == указанному
-
-            # если сегодня день - меньше, чем день события:
-            if date.today().timetuple().tm_yday < (
-                date(*self._y_m_d()).timetuple().tm_yday
-            ):
-                pass  # действие не требуется
-
-            # когда года совпадают и надо переписывать системно:
-            next_year = int(self._year) + 1
-            rules = self.get_events_special_params()
-            month = rules['this_month']
-            this_weekday = rules['this_weekday']
-            if last_week:
-                number_of_week_for_this_day = rules['all_weeks_in_month']
-            number_of_week_for_this_day = rules['number_of_week_for_this_day']
-
-            first_day_of_month_in_next_year = self._get_firstday(
-                next_year, month)
-
-            _ = 1 if first_day_of_month_in_next_year >= this_weekday else 0
-            day = 7 * (number_of_week_for_this_day + _) - (
-                first_day_of_month_in_next_year
-            ) + this_weekday - 6
-            return (day, month, next_year)  # заглушка
-            return Event(
-                f'{day:02d}{month:02d}',
-                self.description,
-                next_year,
-                self.special_rule,
-                self.week_number
-            )
-        return self  # FIXME пока заглушка
-        # return 'это в будущем - ждём' if (
-        #     date.today().year < int(self.year)
-        # ) else 'это в прошлом - укажите дату из будущего'
+        """Создает для события со специальными параметрами запись на следующий
+        год (при last_week=True - на последний такой день недели в месяце)."""
+        next_year = self._year + 1
+        day = get_nth_weekday(
+            next_year,
+            self._month,
+            self._get_weekday(True),
+            None if last_week else self.week_number
+        )
+        return Event(
+            f'{day:02d}{self._month:02d}',
+            self.description,
+            next_year,
+            self.special_rule,
+            self.week_number
+        )
 
     def create_rules_for_events_with_special_params(self):
         """Валидирует и создает событию со спец.параметрами новую запись.
 
         Если в первоначальной записи указаны специальные правила:
             - если в записи не указан номер недели - значит последняя неделя.
+        Массово (для всех событий и лет сразу) даты считает special_dates.
         """
         if self.special_rule:
-            if not self.week_number:
-                self._create_rules_for_events_with_special_params(True)
-            self._create_rules_for_events_with_special_params()
+            return self._create_rules_for_events_with_special_params(
+                not self.week_number
+            )
         return self
 
 
@@ -0,0 +1,210 @@
+"""Выгрузка событий в календарь iCalendar (.ics, RFC 5545).
+
+Календарь можно один раз добавить в приложение календаря вместо того,
+чтобы спрашивать бота. Каждое событие - один VEVENT на весь день с
+правилом повторения RRULE до конца периода (ежегодно в тот же день,
+29 февраля - только в високосные годы, особые правила - N-й или
+последний день недели месяца), поэтому размер файла не зависит от
+числа лет. С rrule=False каждая дата - отдельный VEVENT (для календарей
+без RRULE); даты перебираются лениво.
+
+Файл выдаётся кусками по ICS_CHUNK_SIZE событий, события читаются из БД
+курсором - весь календарь в памяти не собирается.
+
+Запуск:
+    python ics_export.py events.ics [--db events.db] [--chat ID]
+                         [--years 10] [--no-rrule]
+
+По умолчанию выгружаются события чата TG_GROUP_ID (переменная окружения
+или .env), а если она не задана - все события.
+"""
+import argparse
+import os
+import sys
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator, Optional
+
+from dotenv import load_dotenv
+
+from constants import (DB_PATH, ICS_CALENDAR_NAME, ICS_CHUNK_SIZE,
+                       ICS_UID_DOMAIN, ICS_YEARS)
+from database import connect, iter_events
+from function import StoredEvent
+
+# Строка iCalendar - не длиннее 75 байт (без перевода строки):
+MAX_LINE_BYTES = 75
+ICS_WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+
+def escape_text(text) -> str:
+    """Экранирует текст для значения свойства (SUMMARY, DESCRIPTION)."""
+    return (
+        str(text).replace('\\', '\\\\').replace(';', '\\;')
+        .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def fold_line(line) -> str:
+    """Разбивает длинную строку на строки по 75 байт (RFC 5545, 3.1).
+
+    Продолжение начинается с пробела; символы UTF-8 не разрезаются.
+    """
+    if len(line.encode()) <= MAX_LINE_BYTES:
+        return line
+    parts = []
+    part, size = '', 0
+    limit = MAX_LINE_BYTES
+    for char in line:
+        char_size = len(char.encode())
+        if size + char_size > limit:
+            parts.append(part)
+            part, size = ' ', 1
+            limit = MAX_LINE_BYTES
+        part += char
+        size += char_size
+    parts.append(part)
+    return '\r\n'.join(parts)
+
+
+def add_years(day: date, years) -> date:
+    """Возвращает ту же дату через years лет (29.02 -> 1 марта)."""
+    try:
+        return day.replace(year=day.year + years)
+    except ValueError:
+        return date(day.year + years, 3, 1)
+
+
+def format_date(day: date) -> str:
+    """Возвращает дату вида ГГГГММДД (быстрее strftime)."""
+    return f'{day.year:04d}{day.month:02d}{day.day:02d}'
+
+
+def get_rrule(event: StoredEvent, first: date, end: date) -> str:
+    """Возвращает RRULE события с первой датой first, до end (не включая).
+
+    Особое правило: день недели first в том же месяце - N-й (1-4) или
+    последний (-1), как в get_nth_weekday.
+    """
+    until = format_date(end - timedelta(days=1))
+    if event.special_rule:
+        week_number = event.week_number
+        number = (
+            int(week_number)
+            if week_number and 1 <= int(week_number) <= 4 else -1
+        )
+        return (
+            f'RRULE:FREQ=YEARLY;UNTIL={until};BYMONTH={event.month};'
+            f'BYDAY={number}{ICS_WEEKDAYS[first.weekday()]}'
+        )
+    return (
+        f'RRULE:FREQ=YEARLY;UNTIL={until};BYMONTH={event.month};'
+        f'BYMONTHDAY={event.day}'
+    )
+
+
+def _get_vevent(event, uid, day, stamp, rrule=None) -> list[str]:
+    """Возвращает строки VEVENT на весь день day."""
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{uid}@{ICS_UID_DOMAIN}',
+        f'DTSTAMP:{stamp}',
+        f'DTSTART;VALUE=DATE:{format_date(day)}',
+        f'DTEND;VALUE=DATE:{format_date(day + timedelta(days=1))}',
+    ]
+    if rrule:
+        lines.append(rrule)
+    # Длинными могут быть только строки с текстом пользователя:
+    lines.append(fold_line(f'SUMMARY:{escape_text(event.description)}'))
+    if event.year:
+        lines.append(f'DESCRIPTION:С {event.year} года')
+    lines.append('TRANSP:TRANSPARENT')
+    lines.append('END:VEVENT')
+    return lines
+
+
+def get_event_lines(event: StoredEvent, start: date, end: date,
+                    stamp: str, rrule=True) -> list[str]:
+    """Возвращает строки VEVENT события за период [start, end).
+
+    Пустой список - в периоде нет ни одной даты события.
+    """
+    occurrences = event.iter_occurrences(start, end)
+    if rrule:
+        first = next(occurrences, None)
+        if first is None:
+            return []
+        return _get_vevent(
+            event, f'event-{event.id}', first, stamp,
+            get_rrule(event, first, end)
+        )
+    lines = []
+    for day in occurrences:
+        lines.extend(_get_vevent(
+            event, f'event-{event.id}-{format_date(day)}', day, stamp
+        ))
+    return lines
+
+
+def iter_calendar(conn, chat_id=None, start: Optional[date] = None,
+                  years=ICS_YEARS, rrule=True,
+                  chunk_size=ICS_CHUNK_SIZE) -> Iterator[str]:
+    """Выдаёт календарь событий на years лет от start кусками текста.
+
+    Если chat_id указан - только события этого чата.
+    """
+    start = start or date.today()
+    end = add_years(start, years)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:-//{ICS_UID_DOMAIN}//events//RU',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        fold_line(f'X-WR-CALNAME:{escape_text(ICS_CALENDAR_NAME)}'),
+    ]
+    events_in_chunk = 0
+    for row in iter_events(conn, chat_id):
+        lines.extend(
+            get_event_lines(StoredEvent.from_row(row), start, end, stamp,
+                            rrule)
+        )
+        events_in_chunk += 1
+        if events_in_chunk >= chunk_size:
+            yield '\r\n'.join(lines) + '\r\n'
+            lines = []
+            events_in_chunk = 0
+    lines.append('END:VCALENDAR')
+    yield '\r\n'.join(lines) + '\r\n'
+
+
+def main():
+    """Запуск из командной строки."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Выгрузка событий в .ics.')
+    parser.add_argument('path', help='файл .ics («-» - консоль)')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument(
+        '--chat', type=int, default=os.getenv('TG_GROUP_ID'),
+        help='id чата событий'
+    )
+    parser.add_argument('--years', type=int, default=ICS_YEARS)
+    parser.add_argument(
+        '--no-rrule', action='store_true',
+        help='каждая дата - отдельное событие (без правил повторения)'
+    )
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    chunks = iter_calendar(
+        conn, args.chat, years=args.years, rrule=not args.no_rrule
+    )
+    if args.path == '-':
+        sys.stdout.writelines(chunks)
+        return
+    with open(args.path, 'w', encoding='utf-8', newline='') as output:
+        output.writelines(chunks)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,5 @@
 from telebot.types import InlineKeyboardButton
 
-from main import test_me, send_response
-
 
 NEAREST_DATE_BUTTON = [
     InlineKeyboardButton(
@@ -16,9 +14,3 @@ TEST_BUTTON = [
         callback_data='test_me_command'
     )
 ]
-
-# Перечень всех рабочих функций, связанных с кнопками:
-FUNCTION_FROM_COMMAND = {
-    'test_me_command': test_me,
-    'nearest_date_command': send_response
-}
@@ -0,0 +1,580 @@
+"""Запись и воспроизведение входящих обновлений Telegram (нагрузочный замер).
+
+Запись: бот с переменной окружения RECORD_UPDATES=updates.jsonl дописывает
+в файл каждое полученное обновление (JSON, как его прислал Telegram)
+с временем получения. Без записи поток обновлений можно сгенерировать:
+утренний всплеск /next и нажатий кнопки «Ближайшее событие» из многих
+чатов.
+
+Воспроизведение: обновления отдаются боту в записанном темпе, ускоренном
+в --speedup раз, через polling или webhook - как их отдавал бы Telegram.
+Вместо Telegram работает локальный FakeBotApi: отдаёт обновления
+getUpdates, принимает sendMessage и остальные методы, отвечает через
+--api-latency секунд и запоминает вызовы. База - копия events.db (или
+сгенерированная база на --events событий, как в benchmark), поэтому
+команды вроде /settings не меняют рабочую базу.
+
+Отчёт - JSON: p50/p95/p99 времени от поступления обновления до ответа,
+пропускная способность, число обновлений без ответа и ошибки. Ответ -
+отправленное через очередь сообщение (Outbox.on_sent) или ответ
+на inline-запрос и нажатие кнопки листания. Обновления без ответа
+(обычный текст) в задержки не входят.
+
+Запуск:
+    python loadtest.py generate updates.jsonl [--updates 1000]
+                       [--chats 100] [--duration 60]
+    python loadtest.py replay updates.jsonl [--db events.db | --events N]
+                       [--mode polling|webhook] [--speedup 10]
+                       [--workers 4] [--senders 8] [--output report.json]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+from constants import (DB_PATH, DISPATCHER_WORKERS, UPDATES_MODE_POLLING,
+                       UPDATES_MODE_WEBHOOK)
+
+LOADTEST_TOKEN = '1:loadtest'
+LOADTEST_SECRET = 'loadtest'
+LOADTEST_SEED = 0
+# Генерация: обновлений, чатов, за сколько секунд и доля нажатий кнопки:
+LOADTEST_UPDATES = 1000
+LOADTEST_CHATS = 100
+LOADTEST_DURATION = 60
+CALLBACK_SHARE = 0.3
+# Воспроизведение: потоков отправки на webhook и сколько ждать ответов
+# после последнего обновления, секунд:
+LOADTEST_SENDERS = 8
+LOADTEST_DRAIN_TIMEOUT = 60
+# Обновлений в одном ответе getUpdates (максимум Telegram):
+GET_UPDATES_LIMIT = 100
+LATENCY_PERCENTILES = (50, 95, 99)
+
+
+class UpdateRecorder:
+    """Дописывает полученные обновления в JSONL-файл.
+
+    Строка: {"received_at": Unix timestamp, "update": JSON обновления}.
+    """
+
+    def __init__(self, path):
+        """Инициализатор; файл открывается на дозапись."""
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def record(self, json_updates):
+        """Записывает обновления (словари, как от Telegram)."""
+        if not json_updates:
+            return
+        received_at = time.time()
+        lines = ''.join(
+            json.dumps(
+                {'received_at': received_at, 'update': update},
+                ensure_ascii=False
+            ) + '\n'
+            for update in json_updates
+        )
+        try:
+            with self._lock:
+                self._file.write(lines)
+                self._file.flush()
+        except OSError as e:
+            logging.error(f'Не удалось записать {self.path}: {e}')
+
+
+def read_recording(path) -> list[tuple[float, dict]]:
+    """Читает запись: пары (секунд от первого обновления, обновление).
+
+    update_id нумеруются заново с 1 по порядку получения - в записи
+    после перезапусков бота они могут повторяться.
+    """
+    with open(path, encoding='utf-8') as records_file:
+        records = [json.loads(line) for line in records_file if line.strip()]
+    records.sort(key=lambda record: record['received_at'])
+    if not records:
+        return []
+    started = records[0]['received_at']
+    return [
+        (
+            record['received_at'] - started,
+            {**record['update'], 'update_id': update_id}
+        )
+        for update_id, record in enumerate(records, 1)
+    ]
+
+
+def _make_user(chat_id) -> dict:
+    """Возвращает JSON пользователя для сгенерированного обновления."""
+    return {'id': chat_id, 'is_bot': False, 'first_name': 'Тест'}
+
+
+def make_update(update_id, chat_id, callback=False) -> dict:
+    """Возвращает обновление: /next или нажатие «Ближайшее событие»."""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+    }
+    if callback:
+        return {
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': _make_user(chat_id),
+                'chat_instance': str(chat_id),
+                'data': 'nearest_date_command',
+                'message': {**message, 'text': 'Привет! Нажми нужную кнопку.'},
+            },
+        }
+    return {
+        'update_id': update_id,
+        'message': {
+            **message,
+            'from': _make_user(chat_id),
+            'text': '/next',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}],
+        },
+    }
+
+
+def generate_updates(path, count=LOADTEST_UPDATES, chats=LOADTEST_CHATS,
+                     duration=LOADTEST_DURATION, seed=LOADTEST_SEED):
+    """Пишет запись всплеска: count обновлений из chats чатов за duration.
+
+    Формат - как у UpdateRecorder; генерация воспроизводима (seed).
+    """
+    rng = random.Random(seed)
+    started = time.time()
+    offsets = sorted(rng.uniform(0, duration) for _ in range(count))
+    with open(path, 'w', encoding='utf-8') as records_file:
+        for update_id, offset in enumerate(offsets, 1):
+            update = make_update(
+                update_id, rng.randint(1, chats),
+                rng.random() < CALLBACK_SHARE
+            )
+            records_file.write(json.dumps(
+                {'received_at': started + offset, 'update': update},
+                ensure_ascii=False
+            ) + '\n')
+
+
+def get_percentile(values, percent):
+    """Возвращает перцентиль отсортированного списка (ближайший ранг)."""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * percent // 100))  # округление вверх
+    return values[int(rank) - 1]
+
+
+class FakeBotApiHandler(BaseHTTPRequestHandler):
+    """Запросы бота к FakeBotApi: /bot<токен>/<метод>?параметры."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        """Отвечает на вызов метода Bot API."""
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)  # файлы sendDocument не нужны
+        method = url.path.rsplit('/', 1)[-1]
+        body = json.dumps(
+            {'ok': True, 'result': self.server.api.call(method, params)}
+        ).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        """Не пишет в консоль строку на каждый запрос."""
+
+
+class FakeBotApi:
+    """Локальный Bot API для воспроизведения обновлений.
+
+    Обновления, добавленные schedule, getUpdates отдаёт с момента их
+    поступления (perf_counter). Ответы на inline-запросы и нажатия
+    запоминаются по id запроса - answered.
+    """
+
+    def __init__(self, latency=0):
+        """Инициализатор; latency - задержка ответа на каждый вызов."""
+        self.latency = latency
+        self.calls = Counter()
+        self.answered = {}  # id inline-запроса или нажатия -> время ответа
+        self._updates = deque()  # (время поступления, обновление)
+        self._closed = False
+        self._condition = threading.Condition()
+        self._messages = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBotApiHandler)
+        self.server.daemon_threads = True
+        self.server.api = self
+
+    @property
+    def url(self) -> str:
+        """Адрес сервера (http://127.0.0.1:порт)."""
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """Запускает сервер в фоновом потоке."""
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        """Останавливает сервер и прерывает ожидание getUpdates."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def schedule(self, updates):
+        """Добавляет пары (время поступления, обновление) для getUpdates.
+
+        Обновления - по возрастанию update_id и времени поступления.
+        """
+        with self._condition:
+            self._updates.extend(updates)
+            self._condition.notify_all()
+
+    def call(self, method, params):
+        """Выполняет метод Bot API и возвращает его result."""
+        if self.latency:
+            time.sleep(self.latency)
+        now = time.perf_counter()
+        with self._condition:
+            self.calls[method] += 1
+            if method in ('answerInlineQuery', 'answerCallbackQuery'):
+                query_id = params.get('inline_query_id') or params.get(
+                    'callback_query_id'
+                )
+                self.answered.setdefault(query_id, now)
+        if method == 'getUpdates':
+            return self._get_updates(
+                int(params.get('offset') or 0),
+                float(params.get('timeout') or 0)
+            )
+        if method in ('sendMessage', 'sendDocument', 'editMessageText'):
+            return self._make_message(params)
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Бот',
+                    'username': 'loadtest_bot'}
+        return True
+
+    def _get_updates(self, offset, timeout) -> list:
+        """Ждёт (не дольше timeout) и отдаёт поступившие обновления.
+
+        Обновления с update_id меньше offset подтверждены и забываются,
+        как в Telegram. Время поступления растёт вместе с update_id.
+        """
+        deadline = time.perf_counter() + timeout
+        with self._condition:
+            while self._updates and self._updates[0][1]['update_id'] < offset:
+                self._updates.popleft()
+            while not self._closed:
+                now = time.perf_counter()
+                ready = []
+                next_release = deadline
+                for released_at, update in self._updates:
+                    if released_at > now or len(ready) >= GET_UPDATES_LIMIT:
+                        next_release = min(released_at, deadline)
+                        break
+                    ready.append(update)
+                if ready or now >= deadline:
+                    return ready
+                self._condition.wait(next_release - now)
+            return []
+
+    def _make_message(self, params) -> dict:
+        """Возвращает JSON отправленного сообщения."""
+        with self._condition:
+            self._messages += 1
+            message_id = self._messages
+        chat_id = int(params.get('chat_id') or 0)
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {
+                'id': chat_id,
+                'type': 'supergroup' if chat_id < 0 else 'private',
+            },
+            'text': params.get('text', ''),
+        }
+
+
+class ErrorCounter(logging.Handler):
+    """Считает записи лога уровня ERROR и выше."""
+
+    def __init__(self):
+        """Инициализатор счётчика."""
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        """Учитывает запись."""
+        self.count += 1
+
+
+def _get_query_id(update):
+    """Возвращает id inline-запроса или нажатия кнопки листания.
+
+    На них бот отвечает методом Bot API с этим id, а не сообщением.
+    """
+    from event_pages import PAGE_CALLBACK_PREFIX
+
+    if 'inline_query' in update:
+        return update['inline_query']['id']
+    data = update.get('callback_query', {}).get('data') or ''
+    if data.startswith(f'{PAGE_CALLBACK_PREFIX}:'):
+        return update['callback_query']['id']
+    return None
+
+
+def replay(records, mode=UPDATES_MODE_POLLING, speedup=1,
+           senders=LOADTEST_SENDERS, api_latency=0,
+           drain_timeout=LOADTEST_DRAIN_TIMEOUT) -> dict:
+    """Воспроизводит обновления на боте main и возвращает отчёт.
+
+    records - пары (секунд от начала, обновление). Бот и база берутся
+    из окружения и текущего каталога (см. prepare_workspace).
+    """
+    from telebot import apihelper
+
+    import main
+    from supervisor import UpdateOffsets
+    from webhook import create_webhook_server, post_update
+
+    api = FakeBotApi(api_latency)
+    api.start()
+    apihelper.API_URL = api.url + '/bot{0}/{1}'
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+
+    app = main.create_app()
+    main.prepare_database()  # как при запуске бота
+    app.update_offsets = UpdateOffsets()  # без файла: каждый раз с начала
+    bot = app.bot
+    replied = {}  # update_id -> время отправки ответа
+
+    def on_sent(message):
+        now = time.perf_counter()
+        for request_id in message.request_ids:
+            replied.setdefault(request_id, now)
+
+    app.outbox.on_sent = on_sent
+    started = time.perf_counter() + 0.1
+    schedule = [
+        (started + offset / speedup, update) for offset, update in records
+    ]
+    webhook_errors = Counter()
+    stop = threading.Event()
+    if mode == UPDATES_MODE_WEBHOOK:
+        server = create_webhook_server(
+            bot.process_new_updates, LOADTEST_SECRET, '127.0.0.1', 0
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+        webhook_url = f'http://{host}:{port}{server.webhook_path}'
+
+        def send(update):
+            try:
+                post_update(webhook_url, update, LOADTEST_SECRET)
+            except Exception as e:
+                webhook_errors[type(e).__name__] += 1
+
+        with ThreadPoolExecutor(senders) as executor:
+            for released_at, update in schedule:
+                delay = released_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(send, update)
+        server.shutdown()
+        server.server_close()
+    else:
+        api.schedule(schedule)
+        poller = threading.Thread(
+            target=main.run_tg_bot, args=(stop,), daemon=True
+        )
+        poller.start()
+
+    # Ждём, пока все обновления будут получены и обработаны:
+    last_release = schedule[-1][0] if schedule else started
+    deadline = last_release + drain_timeout
+    stats = bot.dispatcher.get_stats()
+    while (
+        stats['processed'] + stats['dropped'] < len(schedule)
+        - sum(webhook_errors.values())
+        and time.perf_counter() < deadline
+    ):
+        time.sleep(0.01)
+        stats = bot.dispatcher.get_stats()
+    stop.set()
+    bot.dispatcher.stop(max(deadline - time.perf_counter(), 0))
+    app.outbox.stop(max(deadline - time.perf_counter(), 0))
+    api.close()
+    logging.getLogger().removeHandler(errors)
+
+    latencies = []
+    for released_at, update in schedule:
+        query_id = _get_query_id(update)
+        replied_at = (
+            api.answered.get(query_id) if query_id
+            else replied.get(update['update_id'])
+        )
+        if replied_at is not None:
+            latencies.append(replied_at - released_at)
+    latencies.sort()
+    finished = max(
+        [*replied.values(), *api.answered.values()], default=started
+    )
+    duration = finished - started
+    outbox_stats = app.outbox.get_stats()
+    return {
+        'mode': mode,
+        'updates': len(schedule),
+        'speedup': speedup,
+        'workers': bot.dispatcher.workers,
+        'senders': senders if mode == UPDATES_MODE_WEBHOOK else None,
+        'api_latency': api_latency,
+        'offered_rate': (
+            len(schedule) / (last_release - started)
+            if last_release > started else None
+        ),
+        'duration': duration,
+        'throughput': len(latencies) / duration if duration > 0 else None,
+        'answered': len(latencies),
+        'unanswered': len(schedule) - len(latencies),
+        'latency': {
+            **{
+                f'p{percent}': get_percentile(latencies, percent)
+                for percent in LATENCY_PERCENTILES
+            },
+            'max': latencies[-1] if latencies else None,
+        },
+        'errors': {
+            'log': errors.count,
+            'webhook': dict(webhook_errors),
+            'dropped': stats['dropped'],
+            'outbox_failed': outbox_stats['failed'],
+            'not_processed': (
+                len(schedule) - stats['processed'] - stats['dropped']
+            ),
+        },
+        'outbox': outbox_stats,
+        'api_calls': dict(api.calls),
+    }
+
+
+def prepare_workspace(db_path=None, events=None, seed=LOADTEST_SEED) -> str:
+    """Готовит временный каталог с копией базы и делает его текущим.
+
+    events - вместо копии db_path взять сгенерированную базу на events
+    событий (из каталога benchmark). Возвращает путь каталога.
+    """
+    from benchmark import (BENCHMARK_CHAT_ID, BENCHMARK_DATA_DIR,
+                           generate_events_db)
+
+    work_dir = tempfile.mkdtemp(prefix='loadtest-')
+    if events:
+        source = Path(BENCHMARK_DATA_DIR) / f'{events}-{seed}' / DB_PATH
+        if not source.exists():
+            source.parent.mkdir(parents=True, exist_ok=True)
+            generate_events_db(str(source), events, seed)
+        # События сгенерированной базы - в чате benchmark:
+        os.environ['TG_GROUP_ID'] = str(BENCHMARK_CHAT_ID)
+    else:
+        source = Path(db_path or DB_PATH)
+    shutil.copy(source, Path(work_dir) / DB_PATH)
+    os.chdir(work_dir)
+    return work_dir
+
+
+def main():
+    """Запуск из командной строки."""
+    parser = argparse.ArgumentParser(
+        description='Запись и воспроизведение обновлений Telegram.'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate = commands.add_parser('generate', help='сгенерировать всплеск')
+    generate.add_argument('path', help='файл записи (.jsonl)')
+    generate.add_argument('--updates', type=int, default=LOADTEST_UPDATES)
+    generate.add_argument('--chats', type=int, default=LOADTEST_CHATS)
+    generate.add_argument('--duration', type=float,
+                          default=LOADTEST_DURATION, help='секунд')
+    generate.add_argument('--seed', type=int, default=LOADTEST_SEED)
+    play = commands.add_parser('replay', help='воспроизвести запись')
+    play.add_argument('path', help='файл записи (.jsonl)')
+    play.add_argument('--db', default=DB_PATH, help='база (копируется)')
+    play.add_argument('--events', type=int,
+                      help='сгенерировать базу на N событий вместо --db')
+    play.add_argument('--seed', type=int, default=LOADTEST_SEED)
+    play.add_argument(
+        '--mode', choices=(UPDATES_MODE_POLLING, UPDATES_MODE_WEBHOOK),
+        default=UPDATES_MODE_POLLING
+    )
+    play.add_argument('--speedup', type=float, default=1,
+                      help='во сколько раз быстрее записи')
+    play.add_argument('--workers', type=int, default=DISPATCHER_WORKERS,
+                      help='потоков-обработчиков обновлений')
+    play.add_argument('--senders', type=int, default=LOADTEST_SENDERS,
+                      help='одновременных запросов на webhook')
+    play.add_argument('--api-latency', type=float, default=0,
+                      help='задержка ответа Bot API, секунд')
+    play.add_argument('--drain-timeout', type=float,
+                      default=LOADTEST_DRAIN_TIMEOUT)
+    play.add_argument('--output', help='файл для отчёта (JSON)')
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        generate_updates(
+            args.path, args.updates, args.chats, args.duration, args.seed
+        )
+        return
+
+    records = read_recording(args.path)
+    output = Path(args.output).resolve() if args.output else None
+    current_dir = os.getcwd()
+    work_dir = prepare_workspace(args.db, args.events, args.seed)
+    os.environ.update({
+        'BOT_TOKEN': LOADTEST_TOKEN,
+        'BOT_WORKERS': str(args.workers),
+        'RECORD_UPDATES': '',
+        'HEALTH_FILE': '',
+    })
+    # Запросы к FakeBotApi не должны идти через прокси:
+    os.environ['NO_PROXY'] = ','.join(
+        filter(None, (os.getenv('NO_PROXY'), '127.0.0.1'))
+    )
+    try:
+        report = replay(
+            records, args.mode, args.speedup, args.senders,
+            args.api_latency, args.drain_timeout
+        )
+    finally:
+        os.chdir(current_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        output.write_text(text + '\n', encoding='utf-8')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,65 +1,123 @@
+import calendar
+import io
+import logging
 import os
-import sqlite3
-from datetime import date
+import tempfile
+import threading
 import time
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
 # from typing import Optional, Union
 
-from dotenv import load_dotenv
-from telebot import TeleBot, types
-from telebot.types import (ReplyKeyboardMarkup, KeyboardButton,
-                           InlineKeyboardMarkup)
-
-from constants import (BOT_POOLING_TIMEOUT, BOT_POOLING_INTERVAL,
-                       RELOAD_BOT_TIMER)
-from function import Event
-from keyboards import (FUNCTION_FROM_COMMAND, NEAREST_DATE_BUTTON, TEST_BUTTON)
-from substitutions import (get_full_value_declension,
-                           get_full_values_with_declension)
-
-load_dotenv()
-
-today = date.today()
-today_year = today.year
-
-# Создаём бота:
-bot = TeleBot(token=os.getenv('BOT_TOKEN'))
-
-
-def _send_message(
-    some_text, message=None, keyboard=None, **kwargs
-) -> types.Message:
-    """Отправляет сообщение в тред нашей группы или лично."""
-    # для нашей группы (если в _send_message есть kwargs «for_group»):
-    if 'for_group' in kwargs and kwargs['for_group']:
-        chat_id = os.getenv('TG_GROUP_ID')  # id группы семейки
-        thread_id = os.getenv('TG_THREAD_ID')  # id треда объявлений
-
-    # для личного чата (получаем только chat.id):
-    else:
-        chat_id = message.chat.id  # id чата из тела message
-        thread_id = None
-
-    # Отправка сообщения:
-    bot.send_message(
-        chat_id=chat_id,
-        text=some_text,
-        reply_markup=keyboard,
-        message_thread_id=thread_id
+from app import App
+from constants import (DB_PATH, ICS_YEARS, INLINE_CACHE_TIME,
+                       MAX_ICS_YEARS, MESSAGE_TIME, OUR_TIMEZONE)
+from chats import register_chat
+from database import (create_tables, get_chat, get_chats, get_connection,
+                      get_event, get_event_chat, needs_migration,
+                      set_digests_sent, update_next_dates)
+from digests import get_due_digests, patch_digests, prepare_digests
+from events_io import get_format, import_events, read_records
+from event_pages import (PAGE_CALLBACK_PREFIX, VIEW_MONTH, VIEW_UPCOMING,
+                         get_month_period, get_upcoming_period,
+                         parse_page_callback, render_page)
+from function import StoredEvent
+from ics_export import iter_calendar
+from metrics import SlowRequestProfiler, metrics
+from substitutions import get_full_value_declension
+from supervisor import poll_updates, supervise
+
+# Приложение процесса (создаётся create_app или при первом get_app):
+_app = None
+_app_lock = threading.RLock()
+
+
+def create_app() -> App:
+    """Создаёт приложение бота: читает .env, подключает обработчики.
+
+    Бот и остальные объекты приложения создаются при первом обращении.
+    """
+    global _app
+    # python-dotenv нужен только при запуске бота:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    # Профилирование медленных запросов (если PROFILE_SLOW задана):
+    if os.getenv('PROFILE_SLOW'):
+        metrics.profiler = SlowRequestProfiler()
+    with _app_lock:
+        _app = App(register_handlers)
+    return _app
+
+
+def get_app() -> App:
+    """Возвращает приложение процесса (создаёт его при первом вызове)."""
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                create_app()
+    return _app
+
+
+def _get_local_today(timezone=OUR_TIMEZONE) -> date:
+    """Возвращает сегодняшнюю дату в часовом поясе (по умолчанию нашем)."""
+    return datetime.now(ZoneInfo(timezone)).date()
+
+
+def _is_admin(user_id) -> bool:
+    """Проверяет, что пользователь указан в ADMIN_IDS (через запятую)."""
+    return str(user_id) in os.getenv('ADMIN_IDS', '').split(',')
+
+
+def _get_default_chat_id():
+    """Возвращает id нашей группы (TG_GROUP_ID) или None."""
+    group_id = os.getenv('TG_GROUP_ID')
+    return int(group_id) if group_id else None
+
+
+def _get_chat_settings(chat_id) -> tuple:
+    """Возвращает id чата, чьи события показывать, и его часовой пояс.
+
+    Зарегистрированный чат (/settings) видит свои события, остальные -
+    события нашей группы.
+    """
+    chat = get_chat(get_connection(), chat_id)
+    if chat is None:
+        return (_get_default_chat_id(), OUR_TIMEZONE)
+    return (chat[0], chat[2])
+
+
+def _send_message(some_text, message, keyboard=None) -> None:
+    """Отправляет ответ на message (через очередь).
+
+    Ответ - в тот же чат и тот же тред (тему форума), откуда пришёл.
+    """
+    # Постановка в очередь отправки (с учётом лимитов Telegram):
+    get_app().outbox.send(
+        message.chat.id, some_text, reply_markup=keyboard,
+        thread_id=message.message_thread_id
     )
 
 
 def _get_events_from_stack(
     events,
     events_stack: list = [],
-    minimal_days_delta=float('inf')
+    minimal_days_delta=float('inf'),
+    today=None
 ) -> tuple[int, list]:
     """Возвращает ближайшее(-ие) событие(-я) и оставшиеся до него(-их) дни.
 
     На вход подаются строки событий из БД, после чего перебором собирается
-    список событий, выпадающих на ближайшую (относительно сегодня) дату
-    и количество дней до этих событий."""
+    список событий, выпадающих на ближайшую (относительно today, по
+    умолчанию - сегодня) дату и количество дней до этих событий."""
+    today = today or _get_local_today()
+    today_year = today.year
     for event in events:
         event_day, event_month = int(event[1][:2]), int(event[1][2:])
+        if not calendar.isleap(today_year) and (event_day, event_month) == (
+            29, 2
+        ):
+            continue  # 29 февраля в невисокосный год не наступает.
         event_in_format = date(today_year, event_month, event_day)
         delta = (event_in_format - today).days
 
@@ -74,30 +132,28 @@ def _get_events_from_stack(
     return (minimal_days_delta, events_stack)
 
 
-def _generates_text_for_the_nearest_date():
-    """Готовит сообщение о ближайшем событии."""
+def _generates_text_for_the_nearest_date(today=None, chat_id=None):
+    """Готовит сообщение о ближайшем событии чата (None - всех событий).
+
+    При ошибке пишет её в лог со стеком и возвращает None.
+    """
     # FIXME: не понятно, как работает «', '.join(map(str, events_stack))»
 
     try:
-        # Подключаемся к базе данных:
-        conn = sqlite3.connect('events.db')
-        cursor = conn.cursor()
-        # Чтение данных из базы и создание переменной со списком строк:
-        cursor.execute('SELECT * FROM events')
-        rows = cursor.fetchall()
-
-        # Закрытие соединения с базой данных:
-        conn.close()
-
-        result = _get_events_from_stack(rows)  # Получение ближайших событий.
+        # Получение ближайших событий из индекса (без полного чтения БД):
+        today = today or _get_local_today()
+        result = get_app().events_index.get_nearest(today, chat_id)
+        if not result[1]:
+            return 'Событий пока нет.'
 
         # Подготовка данных о ближайших событиях для вывода результата в ТГ:
         # if result:
         minimal_days_delta, events_stack_from_db = result
+        event_date = today + timedelta(days=minimal_days_delta)
 
         events_stack = []
         for event in events_stack_from_db:
-            events_stack.append(Event(*event[1:]).as_view())
+            events_stack.append(event.as_view(event_date))
         events_stack = ', '.join(map(str, events_stack))
 
         # Формирование сообщения с учётом оставшихся дней:
@@ -118,12 +174,96 @@ def _generates_text_for_the_nearest_date():
                 f'Ближайш{word_in_message[0]}е событи{word_in_message[-1]}'
                 f' (через {time_left}):\n{events_stack}'
             )
-    except Exception as e:
-        print(e)
+    except Exception:
+        # Ошибка не кэшируется: сообщение подготовят заново в следующий раз.
+        logging.exception('Не удалось подготовить сообщение о ближайшем '
+                          'событии чата %s', chat_id)
+        return None
 
     return new_message
 
 
+def _get_nearest_date_text(chat_id, timezone=OUR_TIMEZONE):
+    """Возвращает сообщение о ближайшем событии чата (через кэш).
+
+    «Сегодня» считается в часовом поясе чата. Если сообщение подготовить
+    не удалось - возвращает текст об ошибке (он не кэшируется).
+    """
+    app = get_app()
+    local_today = _get_local_today(timezone)
+    message = app.message_cache.get_or_render(
+        local_today,
+        app.events_index.get_version(),
+        chat_id,
+        lambda: _generates_text_for_the_nearest_date(local_today, chat_id)
+    )
+    if message is None:
+        return 'Не удалось найти ближайшие события, попробуйте позже.'
+    return message
+
+
+def prepare_database():
+    """Создаёт недостающие таблицы и колонки БД перед запуском бота.
+
+    БД прежней версии (события без чата) бот не видит целиком, поэтому
+    тогда запуск прерывается с подсказкой выполнить migrate.py.
+    """
+    conn = get_connection()
+    create_tables(conn)
+    if needs_migration(conn):
+        raise SystemExit(
+            f'В {DB_PATH} есть события без чата (БД прежней версии). '
+            'Выполните: python migrate.py'
+        )
+
+
+def update_events_dates():
+    """Пересчитывает ближайшие даты у прошедших событий."""
+    update_next_dates(get_connection(), _get_local_today())
+
+
+def prepare_chats_digests():
+    """Заранее считает ближайшие сводки всех чатов."""
+    conn = get_connection()
+    prepare_digests(
+        conn, get_chats(conn), time.time(), get_app().digest_kinds
+    )
+
+
+def update_digests(event_ids=None):
+    """Обновляет неотправленные сводки после изменения событий."""
+    patch_digests(get_connection(), event_ids)
+
+
+def take_due_digests(chats) -> list[tuple]:
+    """Возвращает (chat_id, thread_id, текст) сводок, которые чатам пора
+    отправить, и отмечает их отправленными."""
+    digest_kinds = get_app().digest_kinds
+    if not digest_kinds:
+        return []
+    conn = get_connection()
+    due = get_due_digests(conn, chats, time.time(), digest_kinds)
+    if due:
+        set_digests_sent(conn, int(time.time()), [key for *_, key in due])
+    return [(chat_id, thread_id, text) for chat_id, thread_id, text, _ in due]
+
+
+def register_default_chat():
+    """Регистрирует нашу группу (TG_GROUP_ID), если её ещё нет в «chats»."""
+    chat_id = _get_default_chat_id()
+    conn = get_connection()
+    if chat_id is None or get_chat(conn, chat_id) is not None:
+        return
+    thread_id = os.getenv('TG_THREAD_ID')
+    register_chat(
+        conn,
+        chat_id,
+        int(thread_id) if thread_id else None,
+        OUR_TIMEZONE,
+        MESSAGE_TIME
+    )
+
+
 # Сохранение изменений в базе данных
 # пригодится при записи/перезаписи:
 # conn.commit()
@@ -131,7 +271,7 @@ def _generates_text_for_the_nearest_date():
 
 # СТАРТОВАЯ ФУНКЦИЯ ДЛЯ ОБЩЕНИЯ С БОТОМ:
 # --------------------------------------
-@bot.message_handler(commands=['start'])
+@metrics.timed('handler_seconds', 'start', profile=True)
 def wake_up(message):
     """Стартовая функция, запускающая бота с сообщением."""
 
@@ -143,71 +283,350 @@ def wake_up(message):
     # button_test = KeyboardButton('/test')
     # keyboard.add(button_next_event, button_test)  # Добавляем кнопки на клаву
 
+    # telebot (около 150 мс) импортируется вместе с ботом, а не с main:
+    from telebot.types import InlineKeyboardMarkup
+    from keyboards import NEAREST_DATE_BUTTON, TEST_BUTTON
+
     keyboard_buttons = [NEAREST_DATE_BUTTON, TEST_BUTTON]
     keyboard = InlineKeyboardMarkup(keyboard_buttons)
     _send_message(
         some_text='Привет! Нажми нужную кнопку.',
         message=message,
-        keyboard=keyboard,
-        for_group=bool(message.message_thread_id)
+        keyboard=keyboard
     )
 
 
-@bot.callback_query_handler(func=lambda call: True)
+@metrics.timed('handler_seconds', 'callback', profile=True)
 def handle_callback(call):
     """Из списка FUNCTION_FROM_COMMAND возвращает функцию callback-запроса."""
+    if call.data.startswith(f'{PAGE_CALLBACK_PREFIX}:'):
+        return turn_page(call)
     function_name = FUNCTION_FROM_COMMAND.get(call.data)
     if function_name:
         function_name(call.message)
     else:
-        print(f"Неизвестный callback: {call.data}")
-
-
-def run_tg_bot():
-    """Запускает бота и перезапускает, если выскакивает исключение."""
-    try:
-        bot.polling(
-            none_stop=True,
-            interval=BOT_POOLING_INTERVAL,
-            timeout=BOT_POOLING_TIMEOUT
-        )
-    except Exception as e:
-        print(
-            f'Ошибка {e}.'
-            f'{get_full_values_with_declension(RELOAD_BOT_TIMER)}'
-        )
-        time.sleep(RELOAD_BOT_TIMER)
-        # FIXME проверить, перезапускается ли функция
+        logging.warning(f"Неизвестный callback: {call.data}")
+
+
+def run_tg_bot(stop=None):
+    """Получает обновления и перезапускает опрос, если он упал.
+
+    Перезапуск - с нарастающей задержкой; опрос продолжается
+    с первого необработанного обновления.
+    """
+    app = get_app()
+    stop = stop or threading.Event()
+    supervise(
+        'polling',
+        lambda: poll_updates(
+            app.bot, app.update_offsets, app.heartbeat, stop
+        ),
+        stop
+    )
 
 
 # ВЗАИМОДЕЙСТВИЕ С БОТОМ ЧЕРЕЗ КЛАВИАТУРЫ:
 
 # функция 1
-@bot.message_handler(commands=['test'])
+@metrics.timed('handler_seconds', 'test', profile=True)
 def test_me(message):
     """Тестовая функция."""
     _send_message(
         'Просто тест!',
-        message=message,
-        for_group=bool(message.message_thread_id)
+        message=message
     )
 
 
 # функция 2
-@bot.message_handler(commands=['next'])
+@metrics.timed('handler_seconds', 'next', profile=True)
 def send_response(message):
     """В ответ на запрос отправляет сообщение о ближайшем событии в ТГ-бот."""
     _send_message(
-        _generates_text_for_the_nearest_date(),
-        message=message,
-        for_group=bool(message.message_thread_id)
+        _get_nearest_date_text(*_get_chat_settings(message.chat.id)),
+        message=message
+    )
+
+
+# Перечень всех рабочих функций, связанных с кнопками (см. keyboards):
+FUNCTION_FROM_COMMAND = {
+    'test_me_command': test_me,
+    'nearest_date_command': send_response
+}
+
+
+# СПИСКИ СОБЫТИЙ С ЛИСТАНИЕМ:
+def _send_first_page(message, view, get_period):
+    """Отправляет первую страницу списка событий за период."""
+    chat_id, timezone = _get_chat_settings(message.chat.id)
+    try:
+        start, end = get_period(
+            _get_local_today(timezone), *message.text.split()[1:2]
+        )
+    except ValueError as e:
+        return _send_message(
+            f'Не получилось: {e}', message=message
+        )
+    text, keyboard = render_page(get_connection(), chat_id, view, start, end)
+    _send_message(text, message=message, keyboard=keyboard)
+
+
+@metrics.timed('handler_seconds', 'upcoming', profile=True)
+def send_upcoming(message):
+    """Список событий на N дней вперёд: /upcoming [дней]."""
+    _send_first_page(message, VIEW_UPCOMING, get_upcoming_period)
+
+
+@metrics.timed('handler_seconds', 'month', profile=True)
+def send_month(message):
+    """Список событий месяца: /month [ММ]."""
+    _send_first_page(message, VIEW_MONTH, get_month_period)
+
+
+def turn_page(call):
+    """Заменяет сообщение со списком следующей (или первой) страницей."""
+    bot = get_app().bot
+    with metrics.timed('telegram_api_seconds', 'answerCallbackQuery'):
+        bot.answer_callback_query(call.id)
+    view, start, end, cursor = parse_page_callback(call.data)
+    chat_id, _ = _get_chat_settings(call.message.chat.id)
+    text, keyboard = render_page(
+        get_connection(), chat_id, view, start, end, cursor
+    )
+    with metrics.timed('telegram_api_seconds', 'editMessageText'):
+        bot.edit_message_text(
+            text,
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            reply_markup=keyboard
+        )
+
+
+# ПОИСК СОБЫТИЙ:
+def _search(chat_id, text):
+    """Возвращает пары (id, текст события) по запросу (через кэш)."""
+    app = get_app()
+    return app.search_cache.search(
+        get_connection(), app.events_index.get_version(), chat_id, text
+    )
+
+
+@metrics.timed('handler_seconds', 'find', profile=True)
+def find_events(message):
+    """Поиск событий по описанию: /find слово."""
+    text = message.text.partition(' ')[2]
+    if not text.strip():
+        return _send_message(
+            'Что искать? Например: /find мама', message=message
+        )
+    chat_id, _ = _get_chat_settings(message.chat.id)
+    views = [view for _, view in _search(chat_id, text)]
+    _send_message(
+        '\n'.join(views) if views else 'Ничего не нашлось.',
+        message=message
+    )
+
+
+@metrics.timed('handler_seconds', 'inline', profile=True)
+def answer_inline_query(query):
+    """Inline-режим: «@бот мама» - события, подходящие под запрос."""
+    from telebot.types import InlineQueryResultArticle, InputTextMessageContent
+
+    chat_id, _ = _get_chat_settings(query.from_user.id)
+    results = [
+        InlineQueryResultArticle(
+            str(event_id), view, InputTextMessageContent(view)
+        )
+        for event_id, view in _search(chat_id, query.query)
+    ]
+    with metrics.timed('telegram_api_seconds', 'answerInlineQuery'):
+        get_app().bot.answer_inline_query(
+            query.id, results, cache_time=INLINE_CACHE_TIME, is_personal=True
+        )
+
+
+# КАЛЕНДАРЬ ДЛЯ ПОДПИСКИ:
+@metrics.timed('handler_seconds', 'calendar', profile=True)
+def send_calendar(message):
+    """Файл .ics с событиями на N лет для календаря: /calendar [N]."""
+    argument = message.text.partition(' ')[2].strip() or str(ICS_YEARS)
+    if not argument.isdigit() or not 1 <= int(argument) <= MAX_ICS_YEARS:
+        return _send_message(
+            f'Укажите, на сколько лет выгрузить события (1-{MAX_ICS_YEARS}).'
+            f' Например: /calendar {ICS_YEARS}',
+            message=message
+        )
+    events_chat_id, timezone = _get_chat_settings(message.chat.id)
+    # Календарь пишется во временный файл кусками, а не собирается в памяти:
+    with tempfile.TemporaryFile() as calendar_file:
+        for chunk in iter_calendar(
+            get_connection(), events_chat_id, _get_local_today(timezone),
+            int(argument)
+        ):
+            calendar_file.write(chunk.encode())
+        calendar_file.seek(0)
+        with metrics.timed('telegram_api_seconds', 'sendDocument'):
+            get_app().bot.send_document(
+                message.chat.id,
+                calendar_file,
+                caption='Откройте файл в приложении календаря, '
+                        'чтобы добавить события.',
+                visible_file_name='events.ics',
+                message_thread_id=message.message_thread_id
+            )
+
+
+# ЗАГРУЗКА СОБЫТИЙ ИЗ ФАЙЛА:
+@metrics.timed('handler_seconds', 'import', profile=True)
+def import_help(message):
+    """Подсказка, как загрузить события."""
+    _send_message(
+        'Пришлите файл .csv или .jsonl с подписью /import. Поля: '
+        'day_and_month (ДДММ), description, year, special_rule, week_number.',
+        message=message
     )
 
 
-# АВТОМАТИЧЕСКАЯ ОТПРАВКА СООБЩЕНИЙ В ГРУППУ:
-def nearest_date(for_group=True, **kwargs):
-    """По расписанию отправляет сообщение о ближайшем событии в ТГ-бот."""
+@metrics.timed('handler_seconds', 'import_document', profile=True)
+def import_document(message):
+    """Загружает события из присланного файла и отвечает отчётом."""
+    if not _is_admin(message.from_user.id):
+        return _send_message(
+            'Загружать события может только администратор.',
+            message=message
+        )
+    try:
+        file_format = get_format(message.document.file_name)
+    except ValueError as e:
+        return _send_message(str(e), message=message)
+
+    bot = get_app().bot
+    file_info = bot.get_file(message.document.file_id)
+    lines = io.TextIOWrapper(
+        io.BytesIO(bot.download_file(file_info.file_path)),
+        encoding='utf-8-sig',
+        newline=''
+    )
+    conn = get_connection()
+    chat_id, _ = _get_chat_settings(message.chat.id)
+    report = import_events(conn, read_records(lines, file_format), chat_id)
+    update_next_dates(conn, _get_local_today())
+    _send_message(report.as_text(), message=message)
+
+
+# СТАТИСТИКА РАБОТЫ БОТА:
+@metrics.timed('handler_seconds', 'stats', profile=True)
+def send_stats(message):
+    """Задержки обработчиков, БД и Bot API, очередь и кэш (для админов)."""
+    if not _is_admin(message.from_user.id):
+        return _send_message(
+            'Статистика доступна только администратору.',
+            message=message
+        )
+    app = get_app()
+    outbox_stats = ', '.join(
+        f'{name} {value}' for name, value in app.outbox.get_stats().items()
+    )
+    dispatcher_stats = ', '.join(
+        f'{name} {value}'
+        for name, value in app.bot.dispatcher.get_stats().items()
+    )
     _send_message(
-        _generates_text_for_the_nearest_date(),
-        for_group=for_group
+        f'{metrics.render_text()}\n\nОчередь: {outbox_stats}.\n'
+        f'Входящие: {dispatcher_stats}.\n'
+        f'Кэш сообщений: {app.message_cache.hits} попаданий, '
+        f'{app.message_cache.misses} промахов.\n'
+        f'Кэш поиска: {app.search_cache.hits} попаданий, '
+        f'{app.search_cache.misses} промахов.',
+        message=message
+    )
+
+
+# НАСТРОЙКИ ЧАТА:
+@metrics.timed('handler_seconds', 'settings', profile=True)
+def change_settings(message):
+    """Время рассылки и часовой пояс чата: /settings ЧЧ:ММ Область/Город."""
+    if message.chat.type != 'private' and not _is_admin(message.from_user.id):
+        return _send_message(
+            'Настраивать группу может только администратор.',
+            message=message
+        )
+    chat = get_chat(get_connection(), message.chat.id)
+    send_time, timezone = (message.text.split() + [None, None])[1:3]
+    send_time = send_time or (chat[3] if chat else MESSAGE_TIME)
+    timezone = timezone or (chat[2] if chat else OUR_TIMEZONE)
+    try:
+        register_chat(
+            get_connection(),
+            message.chat.id,
+            message.message_thread_id,
+            timezone,
+            send_time
+        )
+    except ValueError as e:
+        return _send_message(
+            f'Не получилось: {e}', message=message
+        )
+    _send_message(
+        f'Рассылка каждый день в {send_time} ({timezone}).',
+        message=message
+    )
+
+
+# АВТОМАТИЧЕСКАЯ ОТПРАВКА СООБЩЕНИЙ В ЧАТЫ:
+def broadcast_nearest_date(chats):
+    """Рассылает сообщение о ближайшем событии в несколько чатов.
+
+    chats - строки (chat_id, thread_id, timezone, ...). Отправка идёт
+    через очередь (Outbox.broadcast) с максимально допустимой частотой.
+    """
+    messages = [
+        (chat_id, _get_nearest_date_text(chat_id, timezone), thread_id)
+        for chat_id, thread_id, timezone, *_ in chats
+    ]
+    # Сводки в свой день (понедельник, 1-е число) - готовые из БД:
+    messages += [
+        (chat_id, text, thread_id)
+        for chat_id, thread_id, text in take_due_digests(chats)
+    ]
+    get_app().outbox.broadcast(messages)
+
+
+def send_reminder(event_id, days_before):
+    """По расписанию напоминает в чате события о нём за days_before дней."""
+    conn = get_connection()
+    event = get_event(conn, event_id)
+    if event is None:
+        return  # событие удалили
+    chat_id, thread_id = get_event_chat(conn, event_id)
+    get_app().outbox.send(
+        chat_id,
+        f'Через {get_full_value_declension(days_before, "days")}:\n'
+        f'{StoredEvent.from_row(event).as_view()}',
+        thread_id=thread_id
+    )
+
+
+def register_handlers(bot):
+    """Подключает обработчики команд, кнопок и inline-запросов к боту.
+
+    Сообщение обрабатывает первый подходящий обработчик - порядок важен.
+    """
+    bot.register_message_handler(wake_up, commands=['start'])
+    bot.register_callback_query_handler(
+        handle_callback, func=lambda call: True
+    )
+    bot.register_message_handler(test_me, commands=['test'])
+    bot.register_message_handler(send_response, commands=['next'])
+    bot.register_message_handler(send_upcoming, commands=['upcoming'])
+    bot.register_message_handler(send_month, commands=['month'])
+    bot.register_message_handler(find_events, commands=['find'])
+    bot.register_inline_handler(answer_inline_query, func=lambda query: True)
+    bot.register_message_handler(send_calendar, commands=['calendar'])
+    bot.register_message_handler(import_help, commands=['import'])
+    bot.register_message_handler(
+        import_document,
+        content_types=['document'],
+        func=lambda message: (message.caption or '').startswith('/import')
     )
+    bot.register_message_handler(send_stats, commands=['stats'])
+    bot.register_message_handler(change_settings, commands=['settings'])
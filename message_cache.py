@@ -0,0 +1,70 @@
+import threading
+from datetime import timedelta
+
+from constants import MESSAGE_CACHE_DAYS
+
+
+class MessageCache:
+    """Кэш готовых сообщений о ближайшем событии.
+
+    Сообщения хранятся группами по (местная дата, версия таблицы событий),
+    в группе - по чатам. У чатов в разных часовых поясах местные даты
+    разные, поэтому группы нескольких дат живут одновременно. Новая группа
+    убирает группы прежних версий таблицы и дат старше MESSAGE_CACHE_DAYS
+    дней. Ведутся счётчики попаданий и промахов.
+    """
+
+    def __init__(self):
+        """Инициализатор пустого кэша."""
+        self._lock = threading.Lock()
+        self._groups = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _get_group(self, local_date, version) -> dict:
+        """Возвращает сообщения группы, создаёт её при нехватке.
+
+        Вызывается под блокировкой.
+        """
+        group = self._groups.get((local_date, version))
+        if group is None:
+            oldest_date = local_date - timedelta(days=MESSAGE_CACHE_DAYS)
+            self._groups = {
+                (group_date, group_version): messages
+                for (group_date, group_version), messages
+                in self._groups.items()
+                if group_version == version and group_date >= oldest_date
+            }
+            group = self._groups[(local_date, version)] = {}
+        return group
+
+    def get_or_render(self, local_date, version, chat_id, render):
+        """Возвращает сообщение из кэша или готовит его через render()."""
+        with self._lock:
+            message = self._get_group(local_date, version).get(chat_id)
+            if message is not None:
+                self.hits += 1
+                return message
+            self.misses += 1
+
+        message = render()
+        with self._lock:
+            # Пока шла подготовка, группу могла убрать новая версия:
+            group = self._groups.get((local_date, version))
+            if message is not None and group is not None:
+                group[chat_id] = message
+        return message
+
+    def clear(self):
+        """Очищает кэш (например, после записи в таблицу событий)."""
+        with self._lock:
+            self._groups = {}
+
+    def get_stats(self) -> dict:
+        """Возвращает счётчики кэша."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': sum(len(group) for group in self._groups.values()),
+            }
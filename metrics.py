@@ -0,0 +1,285 @@
+"""Метрики бота: счётчики и гистограммы задержек.
+
+Гистограмма хранит только число попаданий в интервалы METRICS_BUCKETS,
+количество и сумму, поэтому замер стоит пару обращений к словарю под
+блокировкой. Метрики выводятся командой /stats и в текстовом формате
+Prometheus: в файл METRICS_FILE или по адресу /metrics на METRICS_PORT
+(metrics_server).
+
+Медленные запросы (дольше SLOW_REQUEST_SECONDS) можно профилировать:
+SlowRequestProfiler периодически снимает их стеки и пишет самые частые
+в лог.
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+
+from constants import (METRICS_BUCKETS, PROFILER_INTERVAL,
+                       SLOW_REQUEST_SECONDS)
+
+METRICS_PREFIX = 'bot'
+# Сколько самых частых стеков медленного запроса писать в лог:
+PROFILE_TOP_STACKS = 5
+
+_QUERY_TABLE_PATTERN = re.compile(
+    r'\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF NOT EXISTS\s+)?(\w+)',
+    re.IGNORECASE
+)
+
+
+@lru_cache(maxsize=256)
+def get_query_name(sql) -> str:
+    """Возвращает короткое имя запроса: команда и таблица («SELECT events»)."""
+    command = sql.split(None, 1)[0].upper()
+    match = _QUERY_TABLE_PATTERN.search(sql)
+    return f'{command} {match.group(1)}' if match else command
+
+
+class Histogram:
+    """Гистограмма задержек с границами METRICS_BUCKETS (в секундах)."""
+
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        """Инициализатор пустой гистограммы."""
+        self.counts = [0] * (len(METRICS_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        """Добавляет замер."""
+        self.counts[bisect_left(METRICS_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def get_quantile(self, quantile) -> float:
+        """Возвращает верхнюю границу интервала, где лежит квантиль."""
+        rank = quantile * self.count
+        total = 0
+        for bound, count in zip(METRICS_BUCKETS, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float('inf')
+
+
+class SlowRequestProfiler:
+    """Выборочный профилировщик медленных запросов.
+
+    Поток-сэмплер раз в PROFILER_INTERVAL просматривает выполняющиеся
+    запросы и у тех, что идут дольше порога, запоминает стек их потока.
+    Когда такой запрос завершается, самые частые стеки пишутся в лог.
+    """
+
+    def __init__(self, threshold=SLOW_REQUEST_SECONDS,
+                 interval=PROFILER_INTERVAL):
+        """Инициализатор (поток-сэмплер запускается при первом запросе)."""
+        self.threshold = threshold
+        self.interval = interval
+        self._requests = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    def begin(self, name):
+        """Отмечает начало запроса в текущем потоке.
+
+        Возвращает None, если в потоке уже идёт запрос (вложенный вызов
+        обработчика профилируется вместе с внешним).
+        """
+        thread_id = threading.get_ident()
+        request = [name, time.perf_counter(), Counter()]
+        with self._lock:
+            if thread_id in self._requests:
+                return None
+            self._requests[thread_id] = request
+            if self._sampler is None:
+                self._sampler = threading.Thread(
+                    target=self._run, daemon=True
+                )
+                self._sampler.start()
+        return request
+
+    def end(self, request, seconds):
+        """Отмечает конец запроса и пишет в лог стеки медленного."""
+        if request is None:
+            return
+        with self._lock:
+            self._requests.pop(threading.get_ident(), None)
+        name, _, stacks = request
+        if not stacks:
+            return
+        lines = [
+            f'{count} x {stack}'
+            for stack, count in stacks.most_common(PROFILE_TOP_STACKS)
+        ]
+        logging.warning(
+            f'Медленный запрос {name} ({seconds:.2f} с), частые стеки:\n'
+            + '\n'.join(lines)
+        )
+
+    def _run(self):
+        """Поток-сэмплер."""
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, (_, started, stacks) in self._requests.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None and now - started >= self.threshold:
+                        stacks[_format_stack(frame)] += 1
+
+
+def _format_stack(frame) -> str:
+    """Возвращает стек одной строкой: «файл:функция:строка;...» от корня."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(
+            f'{os.path.basename(code.co_filename)}:{code.co_name}:'
+            f'{frame.f_lineno}'
+        )
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+class Metrics:
+    """Реестр метрик: гистограммы, счётчики и текущие значения (gauge).
+
+    Имя метрики - например, 'handler_seconds', имя объекта - команда,
+    запрос к БД или метод Bot API.
+    """
+
+    def __init__(self):
+        """Инициализатор пустого реестра."""
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.profiler = None  # SlowRequestProfiler, если включён
+
+    def observe(self, metric, name, seconds):
+        """Добавляет замер в гистограмму."""
+        with self._lock:
+            histogram = self.histograms.get((metric, name))
+            if histogram is None:
+                histogram = self.histograms[(metric, name)] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, metric, name, value=1):
+        """Увеличивает счётчик."""
+        with self._lock:
+            self.counters[(metric, name)] = (
+                self.counters.get((metric, name), 0) + value
+            )
+
+    def set_gauge(self, metric, name, value):
+        """Запоминает текущее значение (например, длину очереди)."""
+        with self._lock:
+            self.gauges[(metric, name)] = value
+
+    @contextmanager
+    def timed(self, metric, name, profile=False):
+        """Замеряет время блока (или функции - как декоратор).
+
+        Исключения считаются в счётчике ошибок метрики. С profile=True
+        блок профилируется, если включён профилировщик.
+        """
+        profiler = self.profiler if profile else None
+        request = profiler.begin(name) if profiler else None
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.increment(metric.replace('_seconds', '_errors'), name)
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            self.observe(metric, name, seconds)
+            if profiler:
+                profiler.end(request, seconds)
+
+    def _get_snapshot(self):
+        """Возвращает копии гистограмм и счётчиков, отсортированные."""
+        with self._lock:
+            histograms = [
+                (key, list(histogram.counts), histogram.count, histogram.sum)
+                for key, histogram in self.histograms.items()
+            ]
+            counters = list(self.counters.items())
+            gauges = list(self.gauges.items())
+        return (sorted(histograms), sorted(counters), sorted(gauges))
+
+    def render_prometheus(self) -> str:
+        """Возвращает метрики в текстовом формате Prometheus."""
+        histograms, counters, gauges = self._get_snapshot()
+        lines = []
+        for (metric, name), counts, count, total in histograms:
+            full_name = f'{METRICS_PREFIX}_{metric}'
+            label = f'name="{_escape_label(name)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(
+                (*METRICS_BUCKETS, '+Inf'), counts
+            ):
+                cumulative += bucket_count
+                lines.append(
+                    f'{full_name}_bucket{{{label},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{full_name}_sum{{{label}}} {total}')
+            lines.append(f'{full_name}_count{{{label}}} {count}')
+        for (metric, name), value in counters:
+            lines.append(
+                f'{METRICS_PREFIX}_{metric}_total'
+                f'{{name="{_escape_label(name)}"}} {value}'
+            )
+        for (metric, name), value in gauges:
+            lines.append(
+                f'{METRICS_PREFIX}_{metric}'
+                f'{{name="{_escape_label(name)}"}} {value}'
+            )
+        return '\n'.join(lines) + '\n'
+
+    def render_text(self) -> str:
+        """Возвращает сводку для /stats: число, среднее и p95 замеров."""
+        histograms, counters, gauges = self._get_snapshot()
+        lines = []
+        metric = None
+        for (histogram_metric, name), counts, count, total in histograms:
+            if histogram_metric != metric:
+                metric = histogram_metric
+                lines.append(f'{metric}:')
+            histogram = Histogram()
+            histogram.counts, histogram.count = counts, count
+            lines.append(
+                f'  {name}: {count} шт., среднее {total / count * 1000:.1f} '
+                f'мс, p95 ≤ {histogram.get_quantile(0.95) * 1000:g} мс'
+            )
+        for (other_metric, name), value in counters + gauges:
+            lines.append(f'{other_metric} {name}: {value}')
+        return '\n'.join(lines) or 'Замеров пока нет.'
+
+    def write_prometheus(self, path):
+        """Записывает метрики в файл (атомарно - через временный файл)."""
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(self.render_prometheus())
+        os.replace(temporary_path, path)
+
+
+def _escape_label(value) -> str:
+    """Экранирует значение метки Prometheus."""
+    return (
+        str(value).replace('\\', '\\\\').replace('"', '\\"')
+        .replace('\n', '\\n')
+    )
+
+
+# Метрики процесса:
+metrics = Metrics()
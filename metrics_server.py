@@ -0,0 +1,41 @@
+"""HTTP-сервер метрик Prometheus (GET /metrics на METRICS_PORT).
+
+Отдельно от metrics: http.server нужен только процессу бота с METRICS_PORT,
+а metrics импортируют все модули и CLI.
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from metrics import metrics
+
+METRICS_PATH = '/metrics'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Отдаёт метрики по GET /metrics."""
+
+    def do_GET(self):
+        """Отвечает метриками в формате Prometheus."""
+        if self.path != METRICS_PATH:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = metrics.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Не пишет в консоль строку на каждый запрос."""
+
+
+def run_metrics_server(host, port) -> ThreadingHTTPServer:
+    """Запускает HTTP-сервер метрик в фоновом потоке."""
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,47 @@
+"""Миграция БД прежней версии бота: все шаги по порядку.
+
+1. migrate_next_date - ближайшие даты событий;
+2. migrate_multichat - события без чата отдаются группе TG_GROUP_ID;
+3. migrate_search - поисковый индекс по описаниям;
+4. migrate_digests - ближайшие сводки чатов.
+
+Шаги можно выполнять повторно: уже выполненный ничего не портит.
+Бот не запускается, пока в БД есть события без чата (см. main).
+
+Запуск:
+    python migrate.py [путь к БД]
+"""
+import os
+import sys
+
+from dotenv import load_dotenv
+
+import migrate_digests
+import migrate_multichat
+import migrate_next_date
+import migrate_search
+from constants import DB_PATH
+
+
+def migrate(db_path, chat_id, thread_id=None):
+    """Выполняет все шаги миграции и печатает их результат."""
+    print(f'Обновлено событий: {migrate_next_date.migrate(db_path)}')
+    print(
+        'Событий перенесено в чат группы: '
+        f'{migrate_multichat.migrate(db_path, chat_id, thread_id)}'
+    )
+    print(f'Проиндексировано событий: {migrate_search.migrate(db_path)}')
+    print(f'Посчитано сводок: {migrate_digests.migrate(db_path)}')
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    group_id = os.getenv('TG_GROUP_ID')
+    if not group_id:
+        sys.exit('Укажите TG_GROUP_ID (в .env): ему отдаются события.')
+    thread_id = os.getenv('TG_THREAD_ID')
+    migrate(
+        sys.argv[1] if len(sys.argv) > 1 else DB_PATH,
+        int(group_id),
+        int(thread_id) if thread_id else None
+    )
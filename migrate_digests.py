@@ -0,0 +1,31 @@
+"""Миграция существующей БД: таблица сводок событий за неделю и месяц.
+
+Создаёт таблицу digests и сразу считает ближайшие сводки всех чатов
+(запускать после migrate_multichat.py; все миграции по порядку
+выполняет migrate.py).
+
+Запуск:
+    python migrate_digests.py [путь к БД]
+"""
+import sqlite3
+import sys
+import time
+
+from constants import DB_PATH
+from database import create_tables, get_chats
+from digests import prepare_digests
+
+
+def migrate(db_path):
+    """Создаёт таблицу сводок и возвращает число посчитанных сводок."""
+    conn = sqlite3.connect(db_path)
+    try:
+        create_tables(conn)
+        return prepare_digests(conn, get_chats(conn), time.time())
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    print(f'Посчитано сводок: {migrate(db_path)}')
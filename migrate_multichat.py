@@ -0,0 +1,47 @@
+"""Миграция существующей БД на несколько чатов.
+
+Добавляет колонку chat_id событиям и таблицу «chats», отдаёт все события
+без чата группе TG_GROUP_ID и регистрирует её с TG_THREAD_ID, MESSAGE_TIME
+и OUR_TIMEZONE (как бот работал до миграции). Колонку chat_id добавляет
+create_tables. Все миграции по порядку выполняет migrate.py.
+
+Запуск:
+    python migrate_multichat.py [путь к БД]
+"""
+import os
+import sqlite3
+import sys
+
+from dotenv import load_dotenv
+
+from chats import register_chat
+from constants import DB_PATH, MESSAGE_TIME, OUR_TIMEZONE
+from database import create_tables
+
+
+def migrate(db_path, chat_id, thread_id=None):
+    """Переносит события без чата в чат chat_id и регистрирует его."""
+    conn = sqlite3.connect(db_path)
+    try:
+        create_tables(conn)
+        with conn:
+            updated = conn.execute(
+                'UPDATE events SET chat_id = ? WHERE chat_id IS NULL',
+                (chat_id,)
+            ).rowcount
+        register_chat(conn, chat_id, thread_id, OUR_TIMEZONE, MESSAGE_TIME)
+        return updated
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    thread_id = os.getenv('TG_THREAD_ID')
+    updated = migrate(
+        db_path,
+        int(os.environ['TG_GROUP_ID']),
+        int(thread_id) if thread_id else None
+    )
+    print(f'Событий перенесено в чат группы: {updated}')
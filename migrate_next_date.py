@@ -0,0 +1,29 @@
+"""Миграция существующей БД: заполняет колонку next_date.
+
+Колонку и индекс по ней добавляет create_tables. Все миграции по порядку
+выполняет migrate.py.
+
+Запуск:
+    python migrate_next_date.py [путь к БД]
+"""
+import sqlite3
+import sys
+from datetime import date
+
+from constants import DB_PATH
+from database import create_tables, update_next_dates
+
+
+def migrate(db_path):
+    """Добавляет next_date (если её нет) и заполняет её для всех событий."""
+    conn = sqlite3.connect(db_path)
+    try:
+        create_tables(conn)
+        return update_next_dates(conn, date.today())
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    print(f'Обновлено событий: {migrate(db_path)}')
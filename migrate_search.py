@@ -0,0 +1,30 @@
+"""Миграция существующей БД: поисковый индекс FTS5 по описаниям событий.
+
+Создаёт таблицу events_fts с триггерами и заполняет её всеми событиями
+(запускать после migrate_multichat.py; все миграции по порядку
+выполняет migrate.py).
+
+Запуск:
+    python migrate_search.py [путь к БД]
+"""
+import sqlite3
+import sys
+
+from constants import DB_PATH
+from database import create_tables, rebuild_search_index
+
+
+def migrate(db_path):
+    """Создаёт поисковый индекс и возвращает число проиндексированных."""
+    conn = sqlite3.connect(db_path)
+    try:
+        create_tables(conn)
+        rebuild_search_index(conn)
+        return conn.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    print(f'Проиндексировано событий: {migrate(db_path)}')
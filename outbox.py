@@ -0,0 +1,330 @@
+"""Очередь исходящих сообщений с соблюдением ограничений Telegram.
+
+Обработчики не вызывают send_message сами, а ставят сообщение в очередь.
+Отдельный поток отправляет сообщения, соблюдая общий лимит бота и лимит
+каждого чата (token bucket), выжидает retry_after при ответе 429 и
+повторяет неудачные отправки с задержкой и случайным разбросом.
+Несколько ожидающих сообщений в один чат объединяются в одно.
+
+Сообщение помнит request_id обновлений (log_context), в ответ на которые
+оно поставлено в очередь; после отправки о нём сообщает on_sent (по нему
+loadtest считает время от обновления до ответа).
+"""
+import heapq
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from configs import get_log_context
+from constants import (MAX_MESSAGE_LENGTH, OUTBOX_CHAT_BUCKETS,
+                       OUTBOX_CHAT_RATE, OUTBOX_GLOBAL_RATE,
+                       OUTBOX_GROUP_RATE, OUTBOX_MAX_ATTEMPTS,
+                       OUTBOX_RETRY_DELAY)
+from metrics import metrics
+
+TOO_MANY_REQUESTS = 429
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, не больше capacity."""
+
+    def __init__(self, rate, capacity=1):
+        """Инициализатор полного «ведра»."""
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def get_wait(self, now) -> float:
+        """Возвращает 0 или сколько секунд ждать токена (не забирая его)."""
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now) -> float:
+        """Забирает токен. Возвращает 0 или сколько секунд ждать токена."""
+        wait = self.get_wait(now)
+        if not wait:
+            self.tokens -= 1
+        return wait
+
+    def is_full(self, now) -> bool:
+        """Возвращает True, если «ведро» успело наполниться."""
+        return self.tokens + (now - self.updated_at) * self.rate >= (
+            self.capacity
+        )
+
+
+class OutgoingMessage:
+    """Сообщение в очереди на отправку."""
+
+    __slots__ = ('chat_id', 'text', 'reply_markup', 'thread_id', 'attempts',
+                 'request_ids')
+
+    def __init__(self, chat_id, text, reply_markup=None, thread_id=None,
+                 request_ids=()):
+        """Инициализатор сообщения."""
+        self.chat_id = chat_id
+        self.text = text
+        self.reply_markup = reply_markup
+        self.thread_id = thread_id
+        self.attempts = 0
+        self.request_ids = list(request_ids)
+
+    def can_merge(self, other) -> bool:
+        """Можно ли дописать other к этому сообщению одним сообщением."""
+        return (
+            self.reply_markup is None and other.reply_markup is None
+            and self.thread_id == other.thread_id
+            and len(self.text) + len(other.text) + 2 <= MAX_MESSAGE_LENGTH
+        )
+
+
+def _get_retry_after(error):
+    """Возвращает retry_after из ответа 429 (или None для других ошибок)."""
+    if getattr(error, 'error_code', None) != TOO_MANY_REQUESTS:
+        return None
+    parameters = (getattr(error, 'result_json', None) or {}).get(
+        'parameters') or {}
+    return parameters.get('retry_after', 1)
+
+
+def _get_thread_id(thread_id=None):
+    """Возвращает id треда числом (из окружения он приходит строкой)."""
+    return None if thread_id is None else int(thread_id)
+
+
+class Outbox:
+    """Очередь исходящих сообщений с потоком-отправителем.
+
+    Очереди ведутся по чатам; чаты, которым можно отправлять, обходятся
+    по кругу, а ждущие своего лимита или retry_after лежат в куче
+    по времени готовности.
+    """
+
+    def __init__(self, bot, global_rate=OUTBOX_GLOBAL_RATE, on_sent=None):
+        """Инициализатор очереди для бота bot (TeleBot или подделка)."""
+        self.bot = bot
+        self.on_sent = on_sent
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = {}
+        self._max_chat_buckets = OUTBOX_CHAT_BUCKETS
+        self._queues = {}
+        self._ready = deque()
+        self._delayed = []
+        self._condition = threading.Condition()
+        self._worker = None
+        self._running = False
+        self.sent = 0
+        self.merged = 0
+        self.retried = 0
+        self.failed = 0
+
+    def send(self, chat_id, text, reply_markup=None, thread_id=None):
+        """Ставит сообщение в очередь (не ждёт отправки)."""
+        # id из переменных окружения - строки, из Telegram - числа; у одного
+        # чата должны быть одна очередь и один ограничитель:
+        request_id = get_log_context().get('request_id')
+        message = OutgoingMessage(
+            int(chat_id), text, reply_markup, _get_thread_id(thread_id),
+            () if request_id is None else (request_id,)
+        )
+        with self._condition:
+            self._put(message)
+            self._condition.notify()
+        self._start()
+
+    def _put(self, message):
+        """Добавляет сообщение в очередь чата (вызывается под блокировкой)."""
+        queue = self._queues.get(message.chat_id)
+        if queue is None:
+            queue = self._queues[message.chat_id] = deque()
+            self._ready.append(message.chat_id)
+        queue.append(message)
+
+    def broadcast(self, messages):
+        """Рассылает сообщения по чатам с максимально допустимой частотой.
+
+        messages - пары (chat_id, text) или тройки (chat_id, text,
+        thread_id): у каждого чата может быть свой текст. Сообщения
+        ставятся в очередь под одной блокировкой, отправитель будится
+        один раз.
+        """
+        request_id = get_log_context().get('request_id')
+        request_ids = () if request_id is None else (request_id,)
+        with self._condition:
+            for chat_id, text, *thread_id in messages:
+                self._put(OutgoingMessage(
+                    int(chat_id), text,
+                    thread_id=_get_thread_id(*thread_id),
+                    request_ids=request_ids
+                ))
+            self._condition.notify()
+        self._start()
+
+    def get_stats(self) -> dict:
+        """Возвращает счётчики очереди."""
+        with self._condition:
+            return {
+                'queued': sum(len(queue) for queue in self._queues.values()),
+                'sent': self.sent,
+                'merged': self.merged,
+                'retried': self.retried,
+                'failed': self.failed,
+            }
+
+    def _start(self):
+        """Запускает поток-отправитель при первой отправке."""
+        with self._condition:
+            if self._worker is not None:
+                return
+            self._running = True
+            self._worker = threading.Thread(target=self._run, daemon=True)
+            self._worker.start()
+
+    def stop(self, timeout=None):
+        """Останавливает отправителя, дождавшись отправки очереди."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+            worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def _get_chat_bucket(self, chat_id, now):
+        """Возвращает ограничитель чата (у групп лимит ниже)."""
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self._max_chat_buckets:
+                self._prune_chat_buckets(now)
+            rate = (
+                OUTBOX_GROUP_RATE if str(chat_id).startswith('-')
+                else OUTBOX_CHAT_RATE
+            )
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate)
+        return bucket
+
+    def _prune_chat_buckets(self, now):
+        """Убирает полные ограничители чатов без очереди (под блокировкой).
+
+        Такой ограничитель ничем не отличается от нового. Если убрать
+        почти нечего, порог удваивается, чтобы не перебирать их на каждом
+        новом чате.
+        """
+        self._chat_buckets = {
+            chat_id: bucket for chat_id, bucket in self._chat_buckets.items()
+            if chat_id in self._queues or not bucket.is_full(now)
+        }
+        self._max_chat_buckets = max(
+            OUTBOX_CHAT_BUCKETS, 2 * len(self._chat_buckets)
+        )
+
+    def _delay(self, chat_id, seconds):
+        """Откладывает чат на seconds секунд (вызывается под блокировкой)."""
+        heapq.heappush(self._delayed, (time.monotonic() + seconds, chat_id))
+
+    def _take_next(self):
+        """Ждёт чат, которому можно отправить, и забирает его сообщение.
+
+        Возвращает None, когда отправитель остановлен и очередь пуста.
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    self._ready.append(heapq.heappop(self._delayed)[1])
+                if self._ready:
+                    chat_id = self._ready.popleft()
+                    chat_bucket = self._get_chat_bucket(chat_id, now)
+                    wait = chat_bucket.get_wait(now)
+                    if wait:
+                        self._delay(chat_id, wait)
+                        continue
+                    # Токен чата забирается, только когда есть общий:
+                    wait = self._global_bucket.take(now)
+                    if wait:
+                        self._ready.appendleft(chat_id)
+                        self._condition.wait(wait)
+                        continue
+                    chat_bucket.take(now)
+                    return self._pop_merged(chat_id)
+                if not self._running and not self._delayed:
+                    return None
+                self._condition.wait(
+                    self._delayed[0][0] - now if self._delayed else None
+                )
+
+    def _pop_merged(self, chat_id):
+        """Забирает первое сообщение чата, дописав к нему следующие."""
+        queue = self._queues[chat_id]
+        message = queue.popleft()
+        while queue and message.can_merge(queue[0]):
+            other = queue.popleft()
+            message.text += '\n\n' + other.text
+            message.request_ids += other.request_ids
+            self.merged += 1
+        return message
+
+    def _finish(self, message, retry_in=None):
+        """Возвращает сообщение в очередь или убирает опустевший чат."""
+        with self._condition:
+            queue = self._queues[message.chat_id]
+            if retry_in is not None:
+                queue.appendleft(message)
+                self._delay(message.chat_id, retry_in)
+            elif queue:
+                self._ready.append(message.chat_id)
+            else:
+                del self._queues[message.chat_id]
+
+    def _run(self):
+        """Поток-отправитель."""
+        while True:
+            message = self._take_next()
+            if message is None:
+                return
+            try:
+                with metrics.timed('telegram_api_seconds', 'sendMessage'):
+                    self.bot.send_message(
+                        chat_id=message.chat_id,
+                        text=message.text,
+                        reply_markup=message.reply_markup,
+                        message_thread_id=message.thread_id
+                    )
+            except Exception as e:
+                message.attempts += 1
+                retry_after = _get_retry_after(e)
+                if retry_after is None and (
+                    message.attempts >= OUTBOX_MAX_ATTEMPTS
+                ):
+                    logging.error(
+                        f'Сообщение в чат {message.chat_id} не отправлено: {e}'
+                    )
+                    self.failed += 1
+                    self._finish(message)
+                    continue
+                # Случайный разброс, чтобы повторы не шли одной волной:
+                delay = retry_after or OUTBOX_RETRY_DELAY * 2 ** (
+                    message.attempts - 1
+                )
+                self.retried += 1
+                self._finish(message, delay * (1 + random.random() / 10))
+                continue
+            self.sent += 1
+            self._finish(message)
+            self._notify_sent(message)
+
+    def _notify_sent(self, message):
+        """Сообщает on_sent, что сообщение отправлено."""
+        if self.on_sent is None:
+            return
+        try:
+            self.on_sent(message)
+        except Exception as e:
+            logging.error(f'Ошибка on_sent: {e}')
@@ -0,0 +1,51 @@
+"""Напоминания за несколько дней до события (таймеры в TimerHeap).
+
+На каждое событие и каждое значение REMINDER_DAYS заводится свой таймер
+с ключом ('reminder', id события, за сколько дней). При изменении событий
+пересчитываются только их таймеры. Напоминание приходит во время рассылки
+чата события (в его часовом поясе), для событий без настроек чата -
+в MESSAGE_TIME нашего часового пояса.
+"""
+import time
+from datetime import date, timedelta
+from functools import partial
+
+from constants import MESSAGE_TIME, OUR_TIMEZONE, REMINDER_DAYS
+from database import get_next_dates
+from timers import get_fire_time
+
+REMINDER_KEY = 'reminder'
+
+
+def sync_reminders(scheduler, conn, send_reminder, event_ids=None):
+    """Приводит таймеры напоминаний в соответствие с таблицей событий.
+
+    send_reminder(event_id, days_before) вызывается в момент срабатывания.
+    Если event_ids не указан - пересчитываются все напоминания.
+    """
+    now = time.time()
+    if event_ids is not None:
+        event_ids = set(event_ids)
+
+    desired = {}
+    rows = get_next_dates(conn, event_ids)
+    for event_id, next_date, timezone, send_time in rows:
+        next_date = date.fromisoformat(next_date)
+        for days_before in REMINDER_DAYS:
+            fire_at = get_fire_time(
+                next_date - timedelta(days=days_before),
+                send_time or MESSAGE_TIME,
+                timezone or OUR_TIMEZONE
+            ).timestamp()
+            if fire_at > now:
+                desired[(REMINDER_KEY, event_id, days_before)] = fire_at
+
+    for key in scheduler.get_keys():
+        if key not in desired and key[0] == REMINDER_KEY and (
+            event_ids is None or key[1] in event_ids
+        ):
+            scheduler.cancel(key)
+
+    for key, fire_at in desired.items():
+        if scheduler.get_deadline(key) != fire_at:
+            scheduler.add(fire_at, partial(send_reminder, *key[1:]), key)
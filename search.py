@@ -0,0 +1,83 @@
+"""Поиск событий по описанию: /find и inline-режим («@бот мама»).
+
+Запрос пользователя превращается в запрос FTS5, где каждое слово ищется
+как начало слова (поиск по мере набора). Результаты повторяющихся
+запросов берутся из небольшого LRU-кэша, который очищается при любом
+изменении таблицы событий.
+"""
+import re
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from constants import SEARCH_CACHE_SIZE, SEARCH_LIMIT
+from database import search_events
+from function import StoredEvent
+
+_WORD_PATTERN = re.compile(r'\w+')
+# Больше слов в запросе не учитывается:
+MAX_QUERY_WORDS = 8
+
+
+def make_match_query(text) -> str:
+    """Возвращает запрос FTS5: все слова текста как префиксы («мам*»).
+
+    Пустая строка - в тексте нет слов.
+    """
+    words = _WORD_PATTERN.findall(text.lower())[:MAX_QUERY_WORDS]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def get_event_views(rows) -> list[tuple[int, str]]:
+    """Возвращает пары (id, текст события) для строк search_events."""
+    return [
+        (
+            row[0],
+            StoredEvent.from_row(row[:-1]).as_view(
+                date.fromisoformat(row[-1]) if row[-1] else None
+            )
+        )
+        for row in rows
+    ]
+
+
+class SearchCache:
+    """LRU-кэш результатов поиска: ключ - (чат, запрос FTS5).
+
+    При смене версии таблицы событий кэш очищается целиком.
+    """
+
+    def __init__(self, size=SEARCH_CACHE_SIZE):
+        """Инициализатор пустого кэша."""
+        self.size = size
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def search(self, conn, version, chat_id, text, limit=SEARCH_LIMIT):
+        """Возвращает пары (id, текст события), подходящие под text."""
+        match_query = make_match_query(text)
+        if not match_query:
+            return []
+        key = (chat_id, match_query, limit)
+        with self._lock:
+            if version != self._version:
+                self._results.clear()
+                self._version = version
+            results = self._results.get(key)
+            if results is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return results
+            self.misses += 1
+        results = get_event_views(
+            search_events(conn, chat_id, match_query, limit)
+        )
+        with self._lock:
+            if version == self._version:
+                self._results[key] = results
+                if len(self._results) > self.size:
+                    self._results.popitem(last=False)
+        return results
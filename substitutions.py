@@ -1,16 +1,49 @@
-import regex
+from functools import lru_cache
 
 from constants import MONTH_NAME
 
 
+# Окончания для склонения месяцев: «в январе» (ending_special - для марта
+# и августа, у которых окончание добавляется, а не заменяется) и «1 января».
+MONTH_ENDINGS = (('е', 'е'), ('а', 'я'))
+
+# Формы слов для 1, 2-4 и 5-20 (единиц):
+WORD_MAPPING = {
+    'years': ('год', 'года', 'лет'),
+    'days': ('день', 'дня', 'дней'),
+    'minutes': ('минуту', 'минуты', 'минут'),
+    'seconds': ('секунду', 'секунды', 'секунд'),
+}
+
+# Размер заранее посчитанных таблиц для чисел (0-999):
+DECLENSION_TABLE_SIZE = 1000
+
+
+def _decline_month(month, ending_special, ending_mass):
+    """Склоняет имя месяца (последняя буква заменяется на ending_mass)."""
+    if month in [3, 8]:
+        return MONTH_NAME[month] + ending_special
+    return MONTH_NAME[month][:-1] + ending_mass
+
+
+_MONTH_DECLENSIONS = {
+    (month, ending_special, ending_mass): _decline_month(
+        month, ending_special, ending_mass
+    )
+    for month in range(1, 13)
+    for ending_special, ending_mass in MONTH_ENDINGS
+}
+
+
 def get_declension(month, ending_special, ending_mass):
     """Склонение для имени месяца.
 
     январь - январе, март - марте и т.д.
     """
-    if month in [3, 8]:
-        return MONTH_NAME[month] + ending_special
-    return regex.sub(r'(\p{L})$', ending_mass, MONTH_NAME[month])
+    declension = _MONTH_DECLENSIONS.get((month, ending_special, ending_mass))
+    if declension is None:
+        return _decline_month(month, ending_special, ending_mass)
+    return declension
 
 
 # 1     - день год
@@ -20,24 +53,8 @@ def get_declension(month, ending_special, ending_mass):
 # 22-24 - дня года
 
 
-def get_full_value_declension(value, type_value):
-    """Возвращает количество дней/лет/минут с правильным падежом."""
-    days = ('день', 'дня', 'дней')
-    years = ('год', 'года', 'лет')
-    minutes = ('минуту', 'минуты', 'минут')
-    seconds = ('секунду', 'секунды', 'секунд')
-
-    word_mapping = {
-        'years': years,
-        'days': days,
-        'minutes': minutes,
-        'seconds': seconds,
-    }
-    word = word_mapping.get(type_value)
-
-    if word is None:
-        raise ValueError(f"Неизвестный тип: {type_value}")
-
+def _decline_value(value, word):
+    """Возвращает число со словом в нужной форме."""
     if value % 10 == 1 and value % 100 != 11:
         need_word = word[0]
     elif 2 <= value % 10 <= 4 and (value % 100 < 10 or value % 100 >= 20):
@@ -47,18 +64,28 @@ def get_full_value_declension(value, type_value):
     return f'{value} {need_word}'
 
 
-def get_full_values_with_declension(value):
-    """Возвращает количество минут И секунд с правильным падежом.
-
-    Examples:
-        >>>get_full_values_with_declension(70)\n
-        Перезапуск через 1 минуту 10 секунд..."""
-    minutes_left = value // 60
-    seconds_left = value % 60
-    minutes_left_in_str = get_full_value_declension(
-        minutes_left, 'minutes'
-    )
-    seconds_left_in_str = get_full_value_declension(
-        seconds_left, 'seconds'
+_VALUE_DECLENSIONS = {
+    type_value: tuple(
+        _decline_value(value, word) for value in range(DECLENSION_TABLE_SIZE)
     )
-    return f'Перезапуск через {minutes_left_in_str} {seconds_left_in_str}...'
+    for type_value, word in WORD_MAPPING.items()
+}
+
+
+@lru_cache(maxsize=1024)
+def _get_large_value_declension(value, type_value):
+    """Склоняет значения, которых нет в таблице (с запоминанием)."""
+    return _decline_value(value, WORD_MAPPING[type_value])
+
+
+def get_full_value_declension(value, type_value):
+    """Возвращает количество дней/лет/минут с правильным падежом."""
+    table = _VALUE_DECLENSIONS.get(type_value)
+
+    if table is None:
+        raise ValueError(f"Неизвестный тип: {type_value}")
+
+    if isinstance(value, int) and 0 <= value < DECLENSION_TABLE_SIZE:
+        return table[value]
+    return _get_large_value_declension(value, type_value)
+
@@ -0,0 +1,241 @@
+"""Перезапуск упавших частей бота, учёт полученных обновлений и heartbeat.
+
+supervise выполняет функцию (опрос Telegram, поток расписания) и после
+сбоя запускает её снова. Задержка перед перезапуском начинается с долей
+секунды и удваивается при повторных сбоях подряд (до BACKOFF_MAX).
+
+UpdateOffsets запоминает в файле последний полученный update_id и ещё
+не обработанные обновления. После перезапуска опрос продолжается с этого
+места, а необработанные обновления обрабатываются снова: ничего
+не теряется, а уже обработанные повторно не обрабатываются.
+
+Heartbeat пишет в файл время последней активности каждой части бота -
+по нему внешний мониторинг (systemd, docker healthcheck) видит, что бот
+жив, а не просто запущен.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from constants import (BACKOFF_INITIAL, BACKOFF_JITTER, BACKOFF_MAX,
+                       BACKOFF_RESET_AFTER, BOT_POOLING_TIMEOUT,
+                       HEARTBEAT_INTERVAL)
+from metrics import metrics
+
+
+def write_json(path, data):
+    """Записывает JSON в файл атомарно (через временный файл)."""
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as json_file:
+        json.dump(data, json_file)
+    os.replace(temporary_path, path)
+
+
+class Backoff:
+    """Экспоненциальная задержка перед перезапуском со случайным разбросом.
+
+    Разброс не даёт нескольким копиям бота стучаться в API одновременно.
+    """
+
+    def __init__(self, initial=BACKOFF_INITIAL, maximum=BACKOFF_MAX,
+                 jitter=BACKOFF_JITTER):
+        """Инициализатор (первая задержка - initial)."""
+        self.initial = initial
+        self.maximum = maximum
+        self.jitter = jitter
+        self.delay = initial
+
+    def get_delay(self) -> float:
+        """Возвращает очередную задержку и удваивает следующую."""
+        delay = self.delay * (1 + random.uniform(-self.jitter, self.jitter))
+        self.delay = min(self.delay * 2, self.maximum)
+        return delay
+
+    def reset(self):
+        """Возвращает задержку к начальной."""
+        self.delay = self.initial
+
+
+def supervise(name, target, stop=None, backoff=None,
+              reset_after=BACKOFF_RESET_AFTER):
+    """Выполняет target и перезапускает его после сбоя (до stop.set()).
+
+    Если target проработал дольше reset_after секунд, сбой считается
+    не повторным и задержка начинается заново.
+    """
+    stop = stop or threading.Event()
+    backoff = backoff or Backoff()
+    while not stop.is_set():
+        started = time.monotonic()
+        try:
+            target()
+        except Exception as e:
+            logging.error(f'{name}: ошибка {e!r}')
+        else:
+            if stop.is_set():
+                return
+            logging.warning(f'{name}: завершился без остановки')
+        metrics.increment('restarts', name)
+        if time.monotonic() - started >= reset_after:
+            backoff.reset()
+        delay = backoff.get_delay()
+        logging.warning(f'{name}: перезапуск через {delay:.2f} с')
+        stop.wait(delay)
+
+
+class Heartbeat:
+    """Время последней активности частей бота в JSON-файле.
+
+    Файл: {"updated_at": время, "components": {имя: время}}, время -
+    Unix timestamp. Пишется не чаще раза в interval секунд.
+    """
+
+    def __init__(self, path=None, interval=HEARTBEAT_INTERVAL):
+        """Инициализатор (без path время только хранится в памяти)."""
+        self.path = path
+        self.interval = interval
+        self.beats = {}
+        self._lock = threading.Lock()
+        self._written_at = 0
+
+    def beat(self, name):
+        """Отмечает, что часть бота name жива."""
+        now = time.time()
+        with self._lock:
+            self.beats[name] = now
+            if not self.path or now - self._written_at < self.interval:
+                return
+            self._written_at = now
+            data = {'updated_at': now, 'components': dict(self.beats)}
+        try:
+            write_json(self.path, data)
+        except OSError as e:
+            logging.error(f'Не удалось записать {self.path}: {e}')
+
+
+class UpdateOffsets:
+    """Учёт полученных и обработанных обновлений для getUpdates.
+
+    Опрос идёт с received + 1, где received - последний полученный
+    update_id: Telegram считает полученные обновления подтверждёнными
+    и не отдаёт их снова, поэтому, пока обработчики заняты, long polling
+    ждёт новых обновлений, а не возвращает сразу те же. Полученные, но ещё
+    не обработанные обновления хранятся в файле своим JSON - после
+    перезапуска они обрабатываются снова (take_restored).
+    """
+
+    def __init__(self, path=None):
+        """Инициализатор; читает сохранённое состояние из path."""
+        self.path = path
+        self.received = 0
+        self._pending = {}  # update_id -> JSON обновления
+        self._restored = []
+        # Обработанные обновления из файла прежнего формата (с offset
+        # первого необработанного) - Telegram отдаст их ещё раз:
+        self._done = set()
+        self._saved = None
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as offsets_file:
+                data = json.load(offsets_file)
+            self.received = data['offset'] - 1
+            self._pending = {
+                update['update_id']: update
+                for update in data.get('pending', ())
+            }
+            self._restored = list(self._pending.values())
+            self._done = set(data.get('done', ()))
+            self._saved = self._get_state()
+
+    def get_offset(self) -> int:
+        """Возвращает offset для getUpdates (0 - с самого начала)."""
+        with self._lock:
+            return self.received + 1 if self.received else 0
+
+    def take_new(self, updates) -> list:
+        """Возвращает ещё не полученные обновления и отмечает их.
+
+        У обновления должен быть атрибут json - его JSON от Telegram
+        (см. DispatchingTeleBot.get_updates).
+        """
+        new_updates = []
+        with self._lock:
+            for update in updates:
+                update_id = update.update_id
+                if update_id <= self.received:
+                    continue
+                self.received = update_id
+                if update_id in self._done:
+                    self._done.discard(update_id)
+                    continue
+                self._pending[update_id] = update.json
+                new_updates.append(update)
+        return new_updates
+
+    def take_restored(self) -> list:
+        """Возвращает JSON обновлений, не обработанных до перезапуска.
+
+        Возвращает их один раз: при повторном запуске опроса в том же
+        процессе они уже в очереди бота.
+        """
+        with self._lock:
+            restored, self._restored = self._restored, []
+        return restored
+
+    def mark_done(self, update_id):
+        """Отмечает обновление обработанным."""
+        with self._lock:
+            # Обновление, полученное не через опрос (webhook), не учтено:
+            self._pending.pop(update_id, None)
+
+    def _get_state(self) -> dict:
+        """Возвращает состояние для файла (вызывается под блокировкой)."""
+        return {
+            'offset': self.received + 1,
+            'pending': [
+                self._pending[update_id] for update_id in sorted(self._pending)
+            ],
+        }
+
+    def save(self):
+        """Сохраняет состояние в файл, если оно изменилось."""
+        if not self.path:
+            return
+        with self._lock:
+            state = self._get_state()
+            if state == self._saved:
+                return
+            self._saved = state
+        write_json(self.path, state)
+
+
+def poll_updates(bot, offsets, heartbeat, stop=None,
+                 timeout=BOT_POOLING_TIMEOUT):
+    """Получает обновления long polling'ом и ставит новые в очередь бота.
+
+    Сначала в очередь ставятся обновления, не обработанные до перезапуска.
+    Ошибки API не перехватываются - перезапуском занимается supervise.
+    """
+    stop = stop or threading.Event()
+    restored = offsets.take_restored()
+    if restored:
+        from telebot.types import Update
+
+        bot.process_new_updates(
+            [Update.de_json(json_update) for json_update in restored]
+        )
+    while not stop.is_set():
+        updates = bot.get_updates(
+            offset=offsets.get_offset(),
+            timeout=timeout,
+            long_polling_timeout=timeout
+        )
+        heartbeat.beat('polling')
+        new_updates = offsets.take_new(updates)
+        if new_updates:
+            bot.process_new_updates(new_updates)
+        offsets.save()
@@ -0,0 +1,171 @@
+"""Планировщик на куче таймеров (min-heap) вместо ежесекундного опроса.
+
+Поток планировщика спит до ближайшего срока и просыпается только когда
+пора выполнить задачу или когда добавлена задача с более ранним сроком.
+Добавление и отмена таймера стоят O(log n).
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from configs import log_context
+from metrics import metrics
+
+
+def get_fire_time(day: date, message_time, timezone) -> datetime:
+    """Возвращает момент ЧЧ:ММ указанного дня в часовом поясе timezone."""
+    hour, minute = map(int, message_time.split(':'))
+    return datetime(
+        day.year, day.month, day.day, hour, minute, tzinfo=ZoneInfo(timezone)
+    )
+
+
+def get_job_name(key) -> str:
+    """Возвращает имя задачи для метрик: ключ таймера или его первая часть."""
+    if isinstance(key, tuple):
+        key = key[0]
+    return str(key) if key is not None else 'job'
+
+
+def get_next_fire_time(message_time, timezone) -> datetime:
+    """Возвращает ближайшее наступление времени ЧЧ:ММ в часовом поясе."""
+    now = datetime.now(ZoneInfo(timezone))
+    fire_at = get_fire_time(now.date(), message_time, timezone)
+    if fire_at <= now:
+        fire_at = get_fire_time(
+            now.date() + timedelta(days=1), message_time, timezone
+        )
+    return fire_at
+
+
+class TimerHeap:
+    """Куча таймеров: (время срабатывания, порядковый номер, ключ, задача).
+
+    Таймер с ключом заменяет ранее добавленный таймер с тем же ключом.
+    Отменённые таймеры помечаются и выбрасываются, когда доходят
+    до вершины кучи (или при уплотнении кучи).
+    """
+
+    def __init__(self):
+        """Инициализатор пустого планировщика."""
+        self._heap = []
+        self._timers = {}
+        self._cancelled = 0
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._running = False
+
+    def __len__(self):
+        """Возвращает количество активных таймеров."""
+        return len(self._heap) - self._cancelled
+
+    def add(self, fire_at: float, job, key=None):
+        """Добавляет задачу job на момент fire_at (timestamp)."""
+        timer = [fire_at, next(self._counter), key, job]
+        with self._condition:
+            if key is not None:
+                self._cancel(key)
+                self._timers[key] = timer
+            heapq.heappush(self._heap, timer)
+            if self._heap[0] is timer:
+                self._condition.notify()  # новый ближайший срок
+
+    def add_daily(self, message_time, timezone, job, key):
+        """Добавляет задачу, выполняемую каждый день в ЧЧ:ММ."""
+        def run_and_reschedule():
+            self.add_daily(message_time, timezone, job, key)
+            job()
+
+        self.add(
+            get_next_fire_time(message_time, timezone).timestamp(),
+            run_and_reschedule,
+            key
+        )
+
+    def add_every(self, interval, job, key):
+        """Добавляет задачу, выполняемую каждые interval секунд."""
+        def run_and_reschedule():
+            self.add_every(interval, job, key)
+            job()
+
+        self.add(time.time() + interval, run_and_reschedule, key)
+
+    def cancel(self, key):
+        """Отменяет таймер с указанным ключом (если он есть)."""
+        with self._condition:
+            self._cancel(key)
+
+    def _cancel(self, key):
+        """Помечает таймер отменённым (вызывается под блокировкой)."""
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return
+        timer[-1] = None
+        self._cancelled += 1
+        # Уплотняем кучу, когда отменённых таймеров больше половины:
+        if self._cancelled > len(self._heap) // 2:
+            self._heap = [timer for timer in self._heap if timer[-1]]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+    def get_deadline(self, key):
+        """Возвращает время срабатывания таймера по ключу (или None)."""
+        with self._condition:
+            timer = self._timers.get(key)
+            return timer[0] if timer else None
+
+    def get_keys(self) -> set:
+        """Возвращает ключи активных таймеров."""
+        with self._condition:
+            return set(self._timers)
+
+    def _pop_due(self):
+        """Ждёт ближайший срок и возвращает таймер (None - при остановке)."""
+        with self._condition:
+            while self._running:
+                while self._heap and self._heap[0][-1] is None:
+                    heapq.heappop(self._heap)
+                    self._cancelled -= 1
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                timer = heapq.heappop(self._heap)
+                if self._timers.get(timer[2]) is timer:
+                    del self._timers[timer[2]]
+                return timer
+            return None
+
+    def run(self):
+        """Выполняет задачи по мере наступления сроков (до вызова stop)."""
+        self._running = True
+        while True:
+            timer = self._pop_due()
+            if timer is None:
+                return
+            fire_at, number, key, job = timer
+            name = get_job_name(key)
+            # Отставание от срока (задачи выполняются по очереди):
+            metrics.observe(
+                'scheduler_lag_seconds', name, time.time() - fire_at
+            )
+            try:
+                # Записи лога задачи помечаются её именем и номером:
+                with log_context(request_id=f'{name}-{number}'):
+                    with metrics.timed('scheduler_job_seconds', name):
+                        job()
+            except Exception as e:
+                logging.error(f'Ошибка задачи {name}: {e}')
+
+    def stop(self):
+        """Останавливает run()."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
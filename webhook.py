@@ -0,0 +1,114 @@
+"""Получение обновлений Telegram через webhook вместо long polling.
+
+Локальный HTTP-сервер принимает JSON обновлений от Telegram (обычно через
+обратный прокси с HTTPS), проверяет секретный токен и передаёт обновления
+в обработчики бота.
+"""
+import hmac
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+from telebot.types import Update
+
+from constants import WEBHOOK_MAX_BODY_SIZE, WEBHOOK_PATH
+
+# Заголовок, в котором Telegram передаёт secret_token из set_webhook:
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик POST-запросов с обновлениями Telegram."""
+
+    def do_POST(self):
+        """Проверяет запрос и передаёт обновление боту."""
+        server = self.server
+        if self.path != server.webhook_path:
+            return self._reply(404)
+
+        secret_token = self.headers.get(SECRET_TOKEN_HEADER, '')
+        if server.secret_token and not hmac.compare_digest(
+            secret_token, server.secret_token
+        ):
+            return self._reply(403)
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if not 0 < length <= WEBHOOK_MAX_BODY_SIZE:
+            return self._reply(413 if length else 400)
+        try:
+            json_update = json.loads(self.rfile.read(length))
+            update = Update.de_json(json_update)
+        except (ValueError, KeyError, TypeError):
+            return self._reply(400)
+
+        if server.recorder is not None:
+            server.recorder.record([json_update])
+
+        server.process_updates([update])
+        return self._reply(200)
+
+    def _reply(self, status):
+        """Отправляет пустой ответ с указанным статусом."""
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        """Не пишет в консоль строку на каждый запрос."""
+
+
+def create_webhook_server(
+    process_updates, secret_token, host, port, webhook_path=WEBHOOK_PATH,
+    recorder=None
+) -> ThreadingHTTPServer:
+    """Создаёт HTTP-сервер, передающий обновления в process_updates.
+
+    process_updates - например, bot.process_new_updates (или подделка
+    в тестах). Каждый запрос обрабатывается в своём потоке. recorder
+    (loadtest.UpdateRecorder) записывает JSON принятых обновлений.
+    """
+    server = ThreadingHTTPServer((host, port), WebhookRequestHandler)
+    server.daemon_threads = True
+    server.process_updates = process_updates
+    server.secret_token = secret_token
+    server.webhook_path = webhook_path
+    server.recorder = recorder
+    return server
+
+
+def run_webhook(bot, url, secret_token, host, port):
+    """Регистрирует webhook в Telegram и обслуживает входящие обновления.
+
+    Без url или secret_token не запускается (ValueError): сервер принял бы
+    обновления без проверки отправителя.
+    """
+    if not url or not secret_token:
+        raise ValueError('Для webhook нужны url и secret_token.')
+    server = create_webhook_server(
+        bot.process_new_updates, secret_token, host, port,
+        recorder=bot.recorder
+    )
+    bot.remove_webhook()
+    bot.set_webhook(url=url, secret_token=secret_token)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def post_update(url, update, secret_token=None, timeout=10) -> float:
+    """Отправляет записанное обновление на webhook, как это делает Telegram.
+
+    Возвращает время ответа сервера в секундах. Нужна для проверки
+    webhook локально, без сети.
+    """
+    headers = {'Content-Type': 'application/json'}
+    if secret_token:
+        headers[SECRET_TOKEN_HEADER] = secret_token
+    request = Request(
+        url, data=json.dumps(update).encode(), headers=headers, method='POST'
+    )
+    started = time.perf_counter()
+    with urlopen(request, timeout=timeout):
+        return time.perf_counter() - started
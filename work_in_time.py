@@ -1,28 +1,155 @@
-import schedule
-import time
-from threading import Thread
+import os
+from threading import Event, Thread
 
-from main import run_tg_bot, nearest_date
+from chats import ChatsScheduler
+from configs import configure_logging
+from database import (get_chat_event_ids, get_connection, on_chats_changed,
+                      on_events_changed)
+from main import (create_app, get_app, run_tg_bot, broadcast_nearest_date,
+                  prepare_chats_digests, prepare_database,
+                  register_default_chat, send_reminder, update_digests,
+                  update_events_dates)
+from metrics import metrics
+from reminders import sync_reminders
+from supervisor import supervise
+from timers import TimerHeap
 
-from constants import MESSAGE_TIME, OUR_TIMEZONE
+from constants import (BOT_RUNTIME_ASYNCIO, BOT_RUNTIME_THREADS,
+                       HEARTBEAT_INTERVAL, METRICS_HOST,
+                       METRICS_WRITE_INTERVAL,
+                       NEXT_DATES_UPDATE_TIME, OUR_TIMEZONE,
+                       UPDATES_MODE_POLLING, UPDATES_MODE_WEBHOOK,
+                       WEBHOOK_HOST, WEBHOOK_PORT)
 
 
-schedule.every().day.at(MESSAGE_TIME, OUR_TIMEZONE).do(
-    lambda: nearest_date(for_group=True)
+scheduler = TimerHeap()
+# Остановка опроса и расписания (иначе они перезапускаются после сбоя):
+stop_event = Event()
+
+# Ежедневные рассылки по чатам (один таймер на ближайший срок):
+chats_scheduler = ChatsScheduler(
+    scheduler, get_connection, broadcast_nearest_date
 )
 
 
+def update_reminders(event_ids=None):
+    """Пересчитывает таймеры напоминаний (всех или указанных событий)."""
+    sync_reminders(scheduler, get_connection(), send_reminder, event_ids)
+
+
+def update_chat_reminders(chat_id):
+    """Пересчитывает таймеры напоминаний о событиях чата chat_id."""
+    update_reminders(get_chat_event_ids(get_connection(), chat_id))
+
+
+def start_new_day():
+    """Обновляет ближайшие даты, напоминания и сводки после полуночи."""
+    update_events_dates()
+    update_reminders()  # таблицу могли изменить и вне бота
+    prepare_chats_digests()
+
+
+def check_updates_mode():
+    """Прерывает запуск, если для webhook не заданы адрес или секрет.
+
+    Без WEBHOOK_SECRET обновления на webhook мог бы прислать кто угодно,
+    без WEBHOOK_URL Telegram не узнает, куда их отправлять.
+    """
+    mode = os.getenv('BOT_UPDATES_MODE', UPDATES_MODE_POLLING)
+    if mode != UPDATES_MODE_WEBHOOK:
+        return
+    missing = [
+        name for name in ('WEBHOOK_URL', 'WEBHOOK_SECRET')
+        if not os.getenv(name)
+    ]
+    if missing:
+        raise SystemExit(
+            f'Для BOT_UPDATES_MODE={mode} задайте {", ".join(missing)} '
+            '(в .env).'
+        )
+
+
+def run_updates_receiver():
+    """Получает обновления через webhook или polling (BOT_UPDATES_MODE)."""
+    mode = os.getenv('BOT_UPDATES_MODE', UPDATES_MODE_POLLING)
+    if mode == UPDATES_MODE_WEBHOOK:
+        from webhook import run_webhook
+        run_webhook(
+            get_app().bot,
+            url=os.getenv('WEBHOOK_URL'),
+            secret_token=os.getenv('WEBHOOK_SECRET'),
+            host=os.getenv('WEBHOOK_HOST', WEBHOOK_HOST),
+            port=int(os.getenv('WEBHOOK_PORT', WEBHOOK_PORT))
+        )
+    else:
+        run_tg_bot(stop_event)
+
+
+def start_metrics():
+    """Отдаёт метрики Prometheus по HTTP (METRICS_PORT) и/или в файл."""
+    port = os.getenv('METRICS_PORT')
+    if port:
+        from metrics_server import run_metrics_server
+        run_metrics_server(os.getenv('METRICS_HOST', METRICS_HOST), int(port))
+    path = os.getenv('METRICS_FILE')
+    if path:
+        metrics.write_prometheus(path)
+        scheduler.add_every(
+            METRICS_WRITE_INTERVAL,
+            lambda: metrics.write_prometheus(path),
+            key='metrics'
+        )
+
+
 def start_timer():
-    """Запуск расписания для вывода сообщения в указанное время."""
-    while True:
-        schedule.run_pending()  # ожидание выполнения
-        time.sleep(1)
+    """Ставит задачи расписания (один раз, до запуска его потока)."""
+    chats_scheduler.reschedule()
+    scheduler.add_daily(
+        NEXT_DATES_UPDATE_TIME, OUR_TIMEZONE, start_new_day, key='new_day'
+    )
+    update_reminders()
+    on_events_changed(update_reminders)
+    prepare_chats_digests()
+    on_events_changed(update_digests)
+    # Новое время рассылки чата меняет и время его напоминаний:
+    on_chats_changed(lambda chat_id: chats_scheduler.reschedule())
+    on_chats_changed(update_chat_reminders)
+    start_metrics()
+    # Поток расписания отмечается в HEALTH_FILE, пока выполняет задачи:
+    heartbeat = get_app().heartbeat
+    scheduler.add_every(
+        HEARTBEAT_INTERVAL,
+        lambda: heartbeat.beat('scheduler'),
+        key='heartbeat'
+    )
+
+
+def run_scheduler():
+    """Выполняет задачи расписания и перезапускает его после сбоя."""
+    # Поток спит до ближайшего срока:
+    supervise('scheduler', scheduler.run, stop_event)
 
 
 if __name__ == '__main__':
-    # Запуск расписания в отдельном потоке
-    scheduler_thread = Thread(target=start_timer)
-    scheduler_thread.start()
+    configure_logging()
+    create_app()
+    # Новая БД создаётся, прежней версии - дополняется или требует migrate.py:
+    prepare_database()
+    if os.getenv('BOT_RUNTIME', BOT_RUNTIME_THREADS) == BOT_RUNTIME_ASYNCIO:
+        # Бот и расписание в одном цикле событий asyncio:
+        from async_bot import run_async_bot
+        run_async_bot()
+    else:
+        # До запуска потоков, чтобы процесс завершился сразу:
+        check_updates_mode()
+        # Ближайшие даты могли устареть, пока бот был выключен:
+        update_events_dates()
+        register_default_chat()
+
+        # Запуск расписания в отдельном потоке
+        start_timer()
+        scheduler_thread = Thread(target=run_scheduler)
+        scheduler_thread.start()
 
-    # Запуск бота, с которым можно взаимодействовать:
-    run_tg_bot()
+        # Запуск бота, с которым можно взаимодействовать:
+        run_updates_receiver()